@@ -47,13 +47,29 @@ echo "done."
 #
 # Events
 ##
-seiscomp exec scevtls -d ${DB} --begin '1980-01-01 00:00:00' --end "$(( $(date -u +%Y) + 1 ))-01-01 00:00:00" | while read evID
-do
-	echo -n "Working on $evID . . . "
-	seiscomp exec scxmldump -d ${DB} -E ${evID} -P -A -M -F -f -m -o  $dir/$evID.xml
-	[ $? -ne 0 ] && echo "Error." && continue
-	echo "done."
-done
+# Dumped in parallel by sc3dump.py into the events directory, EVENTS or
+# events/ by default, that is kept across runs so only the events that
+# are new or were modified since the last run are dumped. The event files
+# are then hard linked into $dir, which holds all of them as before. With
+# ARCHIVE set they are kept as a sharded archive in EVENTS instead, its
+# shards grow in place and are not linked. Events that still fail after
+# the retries are counted and the backup goes on, only a failed listing
+# of the events stops it.
+EVENTS="${EVENTS:-events}"
+end="$(( $(date -u +%Y) + 1 ))-01-01 00:00:00"
+if [ -n "$ARCHIVE" ]; then
+	echo "Events to archive $EVENTS/ . . . "
+	python3 "$(dirname "$0")/sc3dump.py" -d ${DB} -o "$EVENTS" --archive --end "$end" -- $*
+else
+	echo "Events to $EVENTS/ . . . "
+	python3 "$(dirname "$0")/sc3dump.py" -d ${DB} -o "$EVENTS" --end "$end" -- $*
+fi
+status=$?
+[ $status -gt 1 ] && echo "Error." && cleanup && exit 1
+if [ -z "$ARCHIVE" ]; then
+	find "$EVENTS" -maxdepth 1 -name '*.xml' -exec ln -f -t $dir/ {} +
+fi
+[ $status -eq 1 ] && echo "done, some events failed." || echo "done."
 
 #
 # Cleanup
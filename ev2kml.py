@@ -22,9 +22,15 @@
 #                                                                              #
 #### 2015-02-26 ################################################################
 #
-import sys, hashlib, math
-from seiscomp3 import IO, DataModel
+import os, re, sys, math
+import array, bisect, datetime, functools
 from optparse import OptionParser
+import sc3pool, sc3cache, sc3reader, sc3stats, sc3kml, sc3catalog, sc3watch, sc3archive
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
 
 '''
 Style Factory
@@ -32,25 +38,14 @@ Style Factory
 class StyleFactory(object):
 	def __init__(self):
 		self.styles = {}
+		self.ids = {}
 
 	def dump(self, openfile):
 		for ID in self.styles:
 			color = self.styles[ID]['color']
 			scale = self.styles[ID]['size']
 
-			print('<Style id="%s">' % ID, file = openfile)
-			print('<LabelStyle>', file = openfile)
-			print('<scale>0</scale>', file = openfile)
-			print('</LabelStyle>', file = openfile)
-			print('<IconStyle>', file = openfile)
-			if color:
-				print(' <color>%s</color>' % color, file = openfile)
-			print(' <scale>%f</scale>' % scale, file = openfile)
-			print(' <Icon>', file = openfile)
-			print('  <href>http://maps.google.com/mapfiles/kml/shapes/donut.png</href>', file = openfile)
-			print(' </Icon>', file = openfile)
-			print('</IconStyle>', file = openfile)
-			print('</Style>', file = openfile)
+			openfile.write(STYLE % (ID, COLOR % color if color else "", scale))
 		return
 
 	def basicstyle(self):
@@ -60,163 +55,674 @@ class StyleFactory(object):
 			self.styles['basic']['size']  = 1.0
 		return "basic"
 
-	def getstyle(self, size, color):
-		sh1 = "S_%s" %  hashlib.sha1("%.2f-%s" %  (size, color)).hexdigest()
-		if sh1 in self.styles:
-			return sh1
-		self.styles[sh1] = { }
-		self.styles[sh1]['color'] = color
-		self.styles[sh1]['size'] = size
+	def getstyle(self, size, band):
+		#
+		## size in tenths and the depth band are the ID, short and
+		## the same on every run
+		key = (size, band)
+		if key in self.ids:
+			return self.ids[key]
+
+		ID = "S%d_%d" % key
+		self.ids[key] = ID
+		self.styles[ID] = { }
+		self.styles[ID]['color'] = DEPTHBANDS[band][1]
+		self.styles[ID]['size'] = size / 10.0
 
-		return sh1
+		return ID
+
+'''
+KML Templates
+	Each element is rendered with a single format, optional lines
+	have their own template and an empty slot when absent.
+'''
+STYLE = ('<Style id="%s">\n'
+		 '<LabelStyle>\n'
+		 '<scale>0</scale>\n'
+		 '</LabelStyle>\n'
+		 '<IconStyle>\n'
+		 '%s'
+		 ' <scale>%f</scale>\n'
+		 ' <Icon>\n'
+		 '  <href>http://maps.google.com/mapfiles/kml/shapes/donut.png</href>\n'
+		 ' </Icon>\n'
+		 '</IconStyle>\n'
+		 '</Style>\n')
+COLOR = ' <color>%s</color>\n'
+
+HEADER = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+		  '<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">\n'
+		  ' <Document>\n')
+
+FOLDER = (' <Folder>\n'
+		  '  <name>Earthquakes</name>\n'
+		  '  <description><![CDATA[\n'
+		  '  <p>SeisComP3 Event Extracter sc3xml2kml<br/>\n'
+		  '  Depth Filter: %s/%s<br/>\n'
+		  '  Mag Filter: %s/%s<br/>\n'
+		  '  Picks Filter: %s</p>\n'
+		  ']]>  </description>\n')
+
+PLACEMARK = ('  <Placemark>\n'
+			 '%s'
+			 '  <name>%s %s</name>\n'
+			 '  <description><![CDATA[\n'
+			 'Origin time: %s<br/>\n'
+			 'Longitude: %.4f<br/>\n'
+			 'Latitude: %.4f<br/>\n'
+			 '%s'
+			 '%s'
+			 '%s'
+			 ']]></description>\n'
+			 '  <gx:TimeStamp><when>%s</when></gx:TimeStamp>\n'
+			 '   <Point>\n'
+			 '%s'
+			 '    <coordinates>%f,%f,%f</coordinates>\n'
+			 '   </Point>\n'
+			 '  </Placemark>\n')
+STYLEURL = '  <styleUrl>#%s</styleUrl>\n'
+DEPTH = 'Depth: %.0f (km)<br/>\n'
+MAGNITUDE = 'Mag. %.2f %s<br/>\n'
+ARRIVALS = 'Number of arrivals: %d<br/>\n'
+ALTITUDE = '<altitudeMode>absolute</altitudeMode>\n'
+
+FOOTER = (' </Folder>\n'
+		  ' </Document>\n'
+		  ' </kml>\n')
+
+TILE = (' <Folder>\n'
+		'  <name>Earthquakes, tile %s</name>\n')
+REGION = ('  <Region>\n'
+		  '   <LatLonAltBox><north>%f</north><south>%f</south><east>%f</east><west>%f</west></LatLonAltBox>\n'
+		  '   <Lod><minLodPixels>%d</minLodPixels><maxLodPixels>-1</maxLodPixels></Lod>\n'
+		  '  </Region>\n')
+NETWORKLINK = ('  <NetworkLink>\n'
+			   '  <name>Tile %s</name>\n'
+			   '%s'
+			   '  <Link><href>%s</href><viewRefreshMode>onRegion</viewRefreshMode></Link>\n'
+			   '  </NetworkLink>\n')
+
+OVERLAY = ('  <GroundOverlay>\n'
+		   '  <name>%s</name>\n'
+		   '  <Icon><href>%s</href></Icon>\n'
+		   '   <LatLonBox><north>%f</north><south>%f</south><east>%f</east><west>%f</west></LatLonBox>\n'
+		   '  </GroundOverlay>\n')
 
 '''
 KML Generators
 '''
 def openKML(openfile, options, styler):
-	print('<?xml version="1.0" encoding="UTF-8"?>', file = openfile)
-	print('<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">', file = openfile)
-	print(' <Document>', file = openfile)
+	openfile.write(HEADER)
 
 	if styler:
 		styler.dump(openfile)
 
-	print(' <Folder>', file = openfile)
-	print('  <name>Earthquakes</name>', file = openfile)
-	print('  <description><![CDATA[', file = openfile)
-	print('  <p>SeisComP3 Event Extracter sc3xml2kml<br/>', file = openfile)
-	print('  Depth Filter: %s/%s<br/>' % (options.mindep, options.maxdep), file = openfile)
-	print('  Mag Filter: %s/%s<br/>' % (options.minmag, options.maxmag), file = openfile)
-	print('  Picks Filter: %s</p>' % options.minarrival, file = openfile)
-	print(']]>  </description>', file = openfile)
+	openfile.write(FOLDER % (options.mindep, options.maxdep, options.minmag, options.maxmag, options.minarrival))
+
+def placemark(options, time, lon, lat, dep, mag, magt, desc, nar, style):
+
+	if time == None: return None
+	if lon == None: return None
+	if lat == None: return None
+
+	return PLACEMARK % (STYLEURL % style if style else "",
+						time, "(%s)" % desc if desc else "",
+						time, lon, lat,
+						DEPTH % dep if dep != None else "",
+						MAGNITUDE % (mag, magt) if mag != None else "",
+						ARRIVALS % (nar) if nar != None else "",
+						time,
+						ALTITUDE if options.skydepth else "",
+						lon, lat, -1 * dep * 1000.0 if dep else 0.0)
 
 def ptKML(openfile, options, time, lon, lat, dep, mag, magt, desc, nar, style):
+	text = placemark(options, time, lon, lat, dep, mag, magt, desc, nar, style)
+	if text:
+		openfile.write(text)
 
-	if time == None: return
-	if lon == None: return
-	if lat == None: return
-
-	print('  <Placemark>', file = openfile)
-	if style:
-		print('  <styleUrl>#%s</styleUrl>' % style, file = openfile)
-	print('  <name>%s %s</name>' % (time, "(%s)" % desc if desc else ""), file = openfile)
-	print('  <description><![CDATA[', file = openfile)
-	if time != None:
-		print('Origin time: %s<br/>' % time, file = openfile)
-	print('Longitude: %.4f<br/>' % lon, file = openfile)
-	print('Latitude: %.4f<br/>' % lat, file = openfile)
-	if dep != None:
-		print('Depth: %.0f (km)<br/>' % dep, file = openfile)
-	if mag != None:
-		print('Mag. %.2f %s<br/>' % (mag, magt), file = openfile)
-	if nar != None:
-		print('Number of arrivals: %d<br/>' % (nar), file = openfile)
-	print(']]></description>', file = openfile)
-	print('  <gx:TimeStamp><when>%s</when></gx:TimeStamp>' % (time), file = openfile)
-
-	print('   <Point>', file = openfile)
-	if options.skydepth:
-		print('<altitudeMode>absolute</altitudeMode>', file = openfile)
-	if dep:
-		print('    <coordinates>%f,%f,%f</coordinates>' % (lon, lat, -1 * dep * 1000.0), file = openfile)
+def closeKML(openfile):
+	openfile.write(FOOTER)
+
+def render(options, styler, data):
+	# Find style
+	#
+	if options.usemagdep:
+		style = styler.getstyle(size = data['size'], band = data['band'])
 	else:
-		print('    <coordinates>%f,%f,%f</coordinates>' % (lon, lat, 0.0), file = openfile)
-	print('   </Point>', file = openfile)
-	print('  </Placemark>', file = openfile)
+		style = styler.basicstyle()
 
-def closeKML(openfile):
-	print(' </Folder>', file = openfile)
-	print(' </Document>', file = openfile)
-	print(' </kml>', file = openfile)
+	# Write
+	#
+	return placemark(options,
+		data['time'],
+		data['lon'],
+		data['lat'],
+		data['dep'],
+		data['mag'],
+		data['magt'],
+		data['desc'],
+		data['arc'],
+		style)
 
 '''
-Data Reader
+Regionation
+	Splits the placemarks in a quadtree of tiles over the globe. Every
+	tile keeps the size largest magnitude events that reached it and
+	hands the others down to its four quadrants, so big events show
+	up on the coarse tiles and small ones only when zoomed in. Below
+	depth levels a tile keeps all its events. Tiles are written as
+	<key>.kml files in a directory, the root one as doc.kml, linked by
+	NetworkLinks that load a child once its Region covers lod pixels.
 '''
-def datafromxml(filename):
-	data = None
+class Tile(object):
+	__slots__ = ( 'key', 'box', 'placemarks', 'children' )
 
-	ar = IO.XMLArchive()
-	ar.open(filename)
-	obj = ar.readObject()
-	ar.close()
+	def __init__(self, key, box):
+		self.key = key
+		self.box = box
+		self.placemarks = [ ]
+		self.children = [ ]
 
-	ep = DataModel.EventParameters.Cast(obj)
+	def __str__(self):
+		return "tile %s" % self.key
 
-	if type(ep) == type(None):
-		print ("File (%s) is no event, skipping." % filename, file = sys.stderr)
-		return data
+	def filename(self):
+		return "doc.kml" if len(self.key) == 1 else "%s.kml" % self.key
 
-	if ep.eventCount == 0:
-		print ("File (%s) has no events, skipping." % filename, file = sys.stderr)
-		return data
+TILENAME = re.compile(r"^0[0-3]+\.kml$")
 
-	evt = ep.event(0)
-	evt = DataModel.Event.Cast(evt)
+def region(box, lod):
+	(west, south, east, north) = box
+	return REGION % (north, south, east, west, lod)
 
-	if type(evt) == type(None):
-		print ("Cannot get event from file (%s), skipping." % filename, file = sys.stderr)
-		return data
+def quadtree(items, size, depth = 16):
+	#
+	## items are (lon, lat, mag, placemark), largest magnitudes first
+	tiles = [ ]
+	stack = [ ("0", (-180.0, -90.0, 180.0, 90.0), items) ]
+	while stack:
+		(key, box, items) = stack.pop()
+		tile = Tile(key, box)
+		tiles.append(tile)
+
+		keep = len(items) if len(key) > depth else size
+		tile.placemarks = [ item[3] for item in items[:keep] ]
+
+		(west, south, east, north) = box
+		(lon, lat) = ((west + east) / 2.0, (south + north) / 2.0)
+		quadrants = ( [ ], [ ], [ ], [ ] )
+		for item in items[keep:]:
+			quadrants[(item[1] >= lat) * 2 + (item[0] >= lon)].append(item)
+
+		for (q, children) in enumerate(quadrants):
+			if not children: continue
+			child = ( lon if q & 1 else west, lat if q & 2 else south,
+					  east if q & 1 else lon, north if q & 2 else lat )
+			tile.children.append(("%s%d" % (key, q), child))
+			stack.append(("%s%d" % (key, q), child, children))
+
+	return tiles
+
+def writetile(directory, options, styler, tile):
+	fio = sc3kml.Buffer(sc3watch.Replacement(os.path.join(directory, tile.filename())))
+
+	if len(tile.key) == 1:
+		openKML(fio, options, styler)
+	else:
+		fio.write(HEADER)
+		styler.dump(fio)
+		fio.write(region(tile.box, options.lod))
+		fio.write(TILE % tile.key)
 
-	if evt.preferredOriginID() == "":
-		print ("No origin (%s), skipping." % filename, file = sys.stderr)
-		return data
+	for text in tile.placemarks:
+		fio.write(text)
 
-	if evt.preferredMagnitudeID() == "":
-		print ("No magnitude (%s)" % filename, file = sys.stderr)
+	for (key, box) in tile.children:
+		fio.write(NETWORKLINK % (key, region(box, options.lod), "%s.kml" % key))
 
-	ori = ep.findOrigin(evt.preferredOriginID())
-	mag = ori.findMagnitude(evt.preferredMagnitudeID())
+	closeKML(fio)
+	fio.close()
 
-	data = { }
-	data['time'] = ori.time().value().toString("%Y-%m-%dT%H:%M:%SZ")
-	data['lat'] = ori.latitude().value()
-	data['lon'] = ori.longitude().value()
-	data['dep'] = ori.depth().value()
-	data['arc'] = ori.arrivalCount()
+	return (len(tile.placemarks), fio.openfile.changed)
 
-	data['mag'] = None
-	data['magt'] = None
-	if type(mag) != type(None):
-		data['mag'] = mag.magnitude().value()
-		data['magt'] = mag.type()
+def regionate(directory, options, styler, items):
+	if not os.path.isdir(directory):
+		os.makedirs(directory)
 
-	data['desc'] = None
-	if evt.eventDescriptionCount() != 0:
-		data['desc'] = evt.eventDescription(0).text()
+	items.sort(key = lambda item: float("inf") if item[2] is None else -item[2])
+	tiles = quadtree(items, options.tilesize)
 
-	return data
+	written = 0
+	changed = 0
+	for (tile, result) in sc3pool.orderedmap(functools.partial(writetile, directory, options, styler), tiles, options.jobs, options.timeout):
+		if result is None:
+			print ("Tile %s was not written." % tile.key, file = sys.stderr)
+			continue
+		written += result[0]
+		changed += result[1]
+
+	#
+	## Tiles of an earlier run the quadtree does not have any more
+	names = set([ tile.filename() for tile in tiles ])
+	for name in os.listdir(directory):
+		if TILENAME.match(name) and name not in names:
+			os.remove(os.path.join(directory, name))
+
+	print ("Wrote %d events in %d tiles to '%s', %d tiles changed" % (written, len(tiles), directory, changed), file = sys.stderr)
+
+'''
+Heatmap
+	Bins the epicentres on a grid of cells of grid degrees around
+	the events and lays the counts, or the summed magnitudes, over
+	the map as PNG images in the KMZ. With depth layers every depth
+	band of getband gets an overlay in its color, otherwise a single
+	overlay runs from blue to red. Cells are shaded on a log scale
+	shared by all layers. Needs NumPy.
+'''
+MAXPIXELS = 4096 * 4096
+
+#
+## Color ramp as positions and their red, green and blue values
+RAMP = ( (0.0, 0.5, 1.0), (0, 255, 255), (0, 255, 0), (255, 0, 0) )
+
+def rgb(color):
+	#
+	## KML colors are aabbggrr
+	return (int(color[6:8], 16), int(color[4:6], 16), int(color[2:4], 16))
+
+def bandname(i, scale):
+	if i == 0:
+		return "Depth up to %g km" % (DEPTHBANDS[0][0] * scale)
+	if DEPTHBANDS[i][0] is None:
+		return "Depth from %g km" % (DEPTHBANDS[i - 1][0] * scale)
+	return "Depth %g to %g km" % (DEPTHBANDS[i - 1][0] * scale, DEPTHBANDS[i][0] * scale)
+
+def heatimage(level, color = None):
+	(height, width) = level.shape
+	image = numpy.zeros((height, width, 4), dtype = numpy.uint8)
+
+	if color is None:
+		for i in range(3):
+			image[:, :, i] = numpy.interp(level, RAMP[0], RAMP[i + 1])
+	else:
+		image[:, :, :3] = rgb(color)
+	image[:, :, 3] = numpy.where(level > 0.0, 64.0 + 191.0 * level, 0.0)
+
+	return sc3kml.png(width, height, image.tobytes())
+
+def collect(columns, data):
+	if data['lon'] is None or data['lat'] is None: return
+
+	for (column, key) in zip(columns, ( 'lon', 'lat', 'mag', 'dep' )):
+		column.append(float("nan") if data[key] is None else data[key])
+
+def heatmap(out, options, columns):
+	#
+	## columns are the lon, lat, mag and dep arrays, NaN when unset
+	(lon, lat, mag, dep) = [ numpy.asarray(column, dtype = numpy.float64) for column in columns ]
+
+	if len(lon) == 0:
+		openKML(out, options, None)
+		closeKML(out)
+		return 0
+
+	grid = options.grid
+	west = math.floor(lon.min() / grid) * grid
+	south = math.floor(lat.min() / grid) * grid
+	width = max(int(math.ceil((lon.max() - west) / grid)), 1)
+	height = max(int(math.ceil((lat.max() - south) / grid)), 1)
+	(east, north) = (west + width * grid, south + height * grid)
+
+	if width * height > MAXPIXELS:
+		raise ValueError("A grid of %d x %d cells is too large, use a coarser --grid." % (width, height))
+
+	weights = None
+	if options.heatweight == "magnitude":
+		weights = numpy.clip(numpy.nan_to_num(mag), 0.0, None)
+
+	#
+	## Cell of every event counted from the north west corner, the
+	## events on the east and south edges go to the last cells
+	x = numpy.minimum(((lon - west) / grid).astype(numpy.intp), width - 1)
+	y = numpy.minimum(((north - lat) / grid).astype(numpy.intp), height - 1)
+	cell = y * width + x
+
+	if options.heatdepth:
+		#
+		## Same bands as getband, only its first limit is inclusive
+		scale = float(options.depthscale)
+		limits = numpy.array(depthlimits(scale), dtype = numpy.float64)
+		band = numpy.searchsorted(limits, dep, side = "right")
+		band[dep == limits[0]] = 0
+		layers = [ (bandname(i, scale), band == i, color) for (i, (limit, color)) in enumerate(DEPTHBANDS) ]
+	else:
+		layers = [ ("Earthquake density", slice(None), None) ]
+
+	def counts(selected):
+		return numpy.bincount(cell[selected], None if weights is None else weights[selected],
+							  width * height).reshape(height, width)
+
+	#
+	## Layers are binned again when drawn instead of holding them all
+	top = max([ counts(selected).max() for (name, selected, color) in layers ])
+
+	openKML(out, options, None)
+	for (i, (name, selected, color)) in enumerate(layers):
+		h = counts(selected)
+		if not h.any(): continue
+		image = "heatmap%d.png" % i
+		out.openfile.asset(image, heatimage(numpy.log1p(h) / numpy.log1p(top), color))
+		out.write(OVERLAY % (name, image, north, south, east, west))
+	closeKML(out)
+
+	return len(lon)
+
+'''
+Data Reader
+'''
+def datafromxml(filename, cache = None, reader = None):
+	return datafromrecords(sc3reader.readevents(filename, cache, reader))
+
+def datafromrecords(records):
+	for record in records:
+		data = { }
+		data['id'] = record['id']
+		data['time'] = datetime.datetime.utcfromtimestamp(math.floor(record['time'])).strftime("%Y-%m-%dT%H:%M:%SZ")
+		data['lat'] = record['lat']
+		data['lon'] = record['lon']
+		data['dep'] = record['dep']
+		data['arc'] = record['arc']
+		data['mag'] = record['mag']
+		data['magt'] = record['magt']
+		data['desc'] = record['desc']
+
+		yield data
 
 '''
 Scales
 '''
 def getsize(value, scale, power):
+	#
+	## Symbol size in tenths
 	if value == None:
-		return 1.0
+		return 10
 
-	v = int((math.pow(power,value)/2.0)*10*scale)/10
-	if v < 0.2: v = 0.2
+	v = int((math.pow(power,value)/2.0)*10*scale)
+	if v < 2: v = 2
 
 	return v
 
-def getcolor(value,  scale):
-	if value <= 10 * scale:
-		return "FF152F9D"
-	elif value < 35 * scale:
-		return "FF15509D"
-	elif value < 65 * scale:
-		return "FF156D9D"
-	elif value < 85 * scale:
-		return "FF15889D"
-	elif value < 120 * scale:
-		return "FF159D9B"
-	elif value < 300 * scale:
-		return "FF128337"
-	elif value < 500 * scale:
-		return "FF0E5A13"
-	elif value < 1000 * scale:
-		return "FF222605"
-	else:
-		return "FF512B10"
+#
+## Depth bands as (upper limit in km, color), the first limit is
+## inclusive, the others exclusive and the last band is open
+DEPTHBANDS = ( (10, "FF152F9D"),
+			   (35, "FF15509D"),
+			   (65, "FF156D9D"),
+			   (85, "FF15889D"),
+			   (120, "FF159D9B"),
+			   (300, "FF128337"),
+			   (500, "FF0E5A13"),
+			   (1000, "FF222605"),
+			   (None, "FF512B10") )
+
+#
+## Band limits scaled by --depthscale, computed once per scale
+LIMITS = { }
+
+def depthlimits(scale):
+	if scale not in LIMITS:
+		LIMITS[scale] = [ limit * scale for (limit, color) in DEPTHBANDS[:-1] ]
+	return LIMITS[scale]
+
+def getband(value, scale):
+	limits = depthlimits(scale)
+	if value <= limits[0]:
+		return 0
+	return bisect.bisect_right(limits, value)
+
+'''
+Event Selection
+'''
+def selectevent(options, data):
+	# Apply filters
+	#
+	if options.mindep and data['dep'] < float(options.mindep): return None
+	if options.maxdep and data['dep'] > float(options.maxdep): return None
+
+	if options.minmag and (data['mag'] == None or data['mag'] < float(options.minmag)): return None
+	if options.maxmag and data['mag'] != None and data['mag'] > float(options.maxmag): return None
+
+	if options.minarrival and data['arc'] < int(options.minarrival): return None
+	if options.maxarrival and data['arc'] > int(options.maxarrival): return None
+
+	# Style parameters
+	#
+	if options.usemagdep:
+		data['size'] = getsize(data['mag'], float(options.magscale), float(options.magpower))
+		data['band'] = getband(data['dep'], float(options.depthscale))
+
+	if options.skydepth:
+		# Maximum earths eq depth is ~1000km
+		data['dep'] = -0.5 * (1000.0 - data['dep'])
+
+	return data
+
+def catalogfilter(options):
+	#
+	## The filters of selectevent as catalog and database conditions
+	conditions = [ ]
+	if options.mindep: conditions.append(("dep >= ?", (float(options.mindep),)))
+	if options.maxdep: conditions.append(("dep <= ?", (float(options.maxdep),)))
+	if options.minmag: conditions.append(("mag >= ?", (float(options.minmag),)))
+	if options.maxmag: conditions.append(("mag IS NULL OR mag <= ?", (float(options.maxmag),)))
+	if options.minarrival: conditions.append(("arc >= ?", (int(options.minarrival),)))
+	if options.maxarrival: conditions.append(("arc <= ?", (int(options.maxarrival),)))
+	if options.where: conditions.append((options.where, ()))
+	return conditions
+
+def selectevents(options, cache, filename):
+	return selectdata(options, datafromxml(filename, cache, options.reader))
+
+def selectdata(options, source):
+	# Get data
+	#
+	for data in sc3stats.timed("parse", source):
+		with sc3stats.stage("filter"):
+			data = selectevent(options, data)
+		if data is not None:
+			yield data
+
+'''
+KML Output
+	Placemarks are streamed to the output as events are added. When
+	the style depends on the event the styles are only known at the
+	end and have to be written before the folder, spool the body.
+	Regionation keeps them all until the tiles are built and the
+	heatmap only the coordinates until they are binned, close()
+	writes them.
+'''
+class Output(object):
+	def __init__(self, options, styler):
+		self.options = options
+		self.styler = styler
+		self.items = [ ]
+		self.columns = tuple([ array.array("d") for i in range(4) ])
+		self.out = None
+		self.body = None
+
+		if options.regionate:
+			if not options.usemagdep:
+				styler.basicstyle()
+			return
+
+		self.out = sc3kml.openkml(options.output, options.kmz)
+
+		if options.heatmap:
+			self.body = None
+		elif options.usemagdep:
+			self.body = sc3kml.Buffer(sc3kml.Spool())
+		else:
+			styler.basicstyle()
+			openKML(self.out, options, styler)
+			self.body = self.out
+
+	def add(self, data):
+		if self.options.heatmap:
+			with sc3stats.stage("bin"):
+				collect(self.columns, data)
+			return
+
+		with sc3stats.stage("write"):
+			text = render(self.options, self.styler, data)
+
+			if not text:
+				return
+			elif self.options.regionate:
+				self.items.append((data['lon'], data['lat'], data['mag'], text))
+			else:
+				self.body.write(text)
+
+	def close(self):
+		options = self.options
+		out = self.out
+		body = self.body
+
+		# Write the tiles
+		#
+		if options.regionate:
+			with sc3stats.stage("write"):
+				regionate(options.regionate, options, self.styler, self.items)
+			return
+
+		# Draw the heatmap
+		#
+		if options.heatmap:
+			with sc3stats.stage("write"):
+				try:
+					n = heatmap(out, options, self.columns)
+				finally:
+					out.close()
+			print ("Binned %d events" % n, file = sys.stderr)
+			return
+
+		# Start KML
+		#
+		with sc3stats.stage("write"):
+			if body != out:
+				body.flush()
+				openKML(out, options, self.styler)
+				body.openfile.copy(out)
+				body.close()
+
+			# Finish
+			#
+			closeKML(out)
+			out.close()
+
+'''
+Watch Mode
+	Keeps the selected events of every file of the watched directory
+	in memory together with their placemarks, only new or modified
+	files are parsed. After every change the output is written from
+	memory again and takes the place of the old one at once, with
+	--regionate only the tiles that changed are replaced.
+'''
+def export(options, events):
+	styler = StyleFactory()
+	if not options.usemagdep:
+		styler.basicstyle()
+
+	if options.heatmap:
+		columns = tuple([ array.array("d") for i in range(4) ])
+		for data in events:
+			collect(columns, data)
+		out = sc3kml.openkml(options.output, True, True)
+		heatmap(out, options, columns)
+		out.close()
+		return
+
+	placemarks = [ ]
+	for data in events:
+		if 'text' not in data:
+			data['text'] = render(options, styler, data)
+		elif options.usemagdep:
+			styler.getstyle(size = data['size'], band = data['band'])
+		if data['text']:
+			placemarks.append(data)
+
+	if options.regionate:
+		regionate(options.regionate, options, styler, [ (data['lon'], data['lat'], data['mag'], data['text']) for data in placemarks ])
+		return
+
+	out = sc3kml.openkml(options.output, options.kmz, True)
+	openKML(out, options, styler)
+	for data in placemarks:
+		out.write(data['text'])
+	closeKML(out)
+	out.close()
+
+def watch(options, cache):
+	files = { }
+
+	def update(changed, removed):
+		for f in removed:
+			files.pop(f, None)
+		for f in changed:
+			files[f] = [ ]
+
+		for (f, data) in sc3pool.orderedchain(functools.partial(selectevents, options, cache), changed, options.jobs, options.timeout):
+			files[f].append(data)
+
+		with sc3stats.stage("write"):
+			try:
+				export(options, [ data for f in sorted(files) for data in files[f] ])
+			except (IOError, OSError, ValueError) as e:
+				print ("Cannot write the output\n %s" % str(e), file = sys.stderr)
+				return
+
+		print ("Read %d and dropped %d files, %d events in %d files." % (len(changed), len(removed), sum([ len(events) for events in files.values() ]), len(files)), file = sys.stderr)
+
+	sc3watch.watch(options.watch, options.interval, update)
+
+'''
+Option Checks
+	Raises ValueError when the output options cannot be used
+'''
+def checkoptions(options):
+	try:
+		float(options.magpower)
+	except:
+		raise ValueError("Bad mag power value.")
+
+	try:
+		float(options.magscale)
+	except:
+		raise ValueError("Bad mag scale value.")
+
+	try:
+		float(options.depthscale)
+	except:
+		raise ValueError("Bad depth scale value.")
+
+	if options.regionate and (options.output or options.kmz):
+		raise ValueError("Regionation writes its own files into %s, it cannot be used with --output or --kmz." % options.regionate)
+
+	if options.tilesize < 1:
+		raise ValueError("Bad tile size value.")
+
+	if options.heatmap:
+		if numpy is None:
+			raise ValueError("Writing a heatmap needs numpy, please install it.")
+
+		if options.regionate or options.usemagdep or options.skydepth:
+			raise ValueError("A heatmap cannot be used with --regionate, --color or --flyover.")
+
+		if options.grid <= 0.0:
+			raise ValueError("Bad grid value.")
+
+		# The images need a KMZ to live in
+		#
+		options.kmz = True
 
 '''
 Basic
@@ -224,7 +730,19 @@ Basic
 def make_cmdline_parser():
 	# Create the parser
 	#
-	parser = OptionParser(usage="%prog [options] <files>", version="1.0", add_help_option = True)
+	parser = OptionParser(usage="%prog [options] <event files or archives>", version="1.0", add_help_option = True)
+
+	parser.add_option("-o","--output", type="string", dest="output", help="Output filename, default is stdout", default=None)
+	parser.add_option("--kmz", action="store_true", dest="kmz", help="Write a compressed KMZ (zip holding doc.kml) instead of plain KML", default=False)
+
+	parser.add_option("--regionate", type="string", dest="regionate", help="Write a quadtree of KML tiles linked by regions into the directory REGIONATE, open its doc.kml", default=None)
+	parser.add_option("--tile-size", type="int", dest="tilesize", help="Maximum number of events in one tile with --regionate", default=1000)
+	parser.add_option("--lod", type="int", dest="lod", help="Size in pixels a tile region must reach on screen before it is loaded with --regionate", default=128)
+
+	parser.add_option("--heatmap", action="store_true", dest="heatmap", help="Write a KMZ with the event density binned on a grid and drawn as image overlays instead of placemarks (needs numpy)", default=False)
+	parser.add_option("--grid", type="float", dest="grid", help="Cell size in degrees of the --heatmap grid", default=0.1)
+	parser.add_option("--heat-weight", type="choice", choices=[ "count", "magnitude" ], dest="heatweight", help="Shade the --heatmap cells by the number of events or by their summed magnitudes (count/magnitude)", default="count")
+	parser.add_option("--heat-depth", action="store_true", dest="heatdepth", help="Draw one --heatmap layer per depth color band", default=False)
 
 	parser.add_option("-c","--color", action="store_true", dest="usemagdep", help="Use magnitude for symbol size and depth to color circles", default=False)
 
@@ -243,91 +761,136 @@ def make_cmdline_parser():
 	parser.add_option("--maxarrival", type="string", dest="maxarrival", help="Filter events with more than MAXARRIVAL picks", default=None)
 
 	parser.add_option("--flyover", action="store_true", dest="skydepth", help="Make earthquakes to fly above the surface", default=False)
+
+	parser.add_option("--reader", type="choice", choices=sc3reader.READERS, dest="reader", help="XML reader, seiscomp uses the SeisComP bindings and stream a lightweight parser (%s)" % "/".join(sc3reader.READERS), default=None)
+
+	parser.add_option("--jobs", type="int", dest="jobs", help="Number of worker processes used to parse the event files", default=1)
+	parser.add_option("--timeout", type="float", dest="timeout", help="Seconds a worker may spend on one event file before it is abandoned (with --jobs)", default=300.0)
+
+	parser.add_option("--cache", dest="cache", help="SQLite file used to keep the parsed events between runs", default=None)
+	parser.add_option("--cache-size", type="float", dest="cachesize", help="Maximum size of the event cache in MB", default=1024.0)
+
+	parser.add_option("--catalog", dest="catalog", help="SQLite catalog index built by sc3catalog.py, only files with events passing the filters are read. The files given are indexed first when needed, without files all the catalog is used", default=None)
+	parser.add_option("--db", dest="db", help="Read the events from this SQLite database in the SeisComP schema instead of event files, the filters are applied by the query", default=None)
+	parser.add_option("--where", dest="where", help="SQL condition on the columns id, time, lat, lon, dep, mag, magt and arc selecting the events (with --catalog or --db)", default=None)
+
+	parser.add_option("--watch", dest="watch", help="Keep running and rewrite the output whenever event files in the directory WATCH are added, changed or removed", default=None)
+	parser.add_option("--interval", type="float", dest="interval", help="Seconds between two looks at the --watch directory", default=10.0)
+
+	parser.add_option("--stats", dest="stats", help="Write a JSON summary of stage times, counters and warnings at exit to STATS (- for stderr)", default=None)
+	parser.add_option("--profile", dest="profile", help="Write a cProfile dump of the main process to PROFILE", default=None)
 	return parser
 
 if __name__ == "__main__":
 	parser = make_cmdline_parser()
 	(options, args) = parser.parse_args()
+
+	# Event archives are read shard by shard
+	#
+	args = list(sc3archive.expand(args))
 	
 	# Styler
 	#
 	styler = StyleFactory()
 
 	try:
-		float(options.magpower)
-	except:
-		print ("Bad mag power value.", file = sys.stderr)
+		options.reader = sc3reader.checkreader(options.reader)
+	except Exception as e:
+		print (str(e), file = sys.stderr)
 		sys.exit(1)
 
 	try:
-		float(options.magscale)
-	except:
-		print ("Bad mag scale value.", file = sys.stderr)
+		checkoptions(options)
+	except ValueError as e:
+		print (str(e), file = sys.stderr)
 		sys.exit(1)
 
-	try:
-		float(options.depthscale)
-	except:
-		print ("Bad depth scale value.", file = sys.stderr)
+	if options.where and not (options.catalog or options.db):
+		print ("--where needs a catalog given with --catalog or a database given with --db.", file = sys.stderr)
 		sys.exit(1)
 
-	# Loop each file
-	#
-	files = []
-	for f in args:
+	if options.db and (args or options.catalog):
+		print ("Events are read from the database %s, no event files or catalog can be given." % options.db, file = sys.stderr)
+		sys.exit(1)
 
-		# Get data
-		#
-		data = datafromxml(f)
-		if data == None: continue
+	if options.watch:
+		if args or options.db or options.catalog:
+			print ("Watch mode reads the files in %s, no event files, catalog or database can be given." % options.watch, file = sys.stderr)
+			sys.exit(1)
 
-		# Apply filters
-		#
-		if options.mindep and data['dep'] < float(options.mindep): continue
-		if options.maxdep and data['dep'] > float(options.maxdep): continue
+		if not (options.output or options.regionate):
+			print ("Watch mode rewrites its output, it needs --output or --regionate.", file = sys.stderr)
+			sys.exit(1)
 
-		if options.minmag and data['mag'] < float(options.minmag): continue
-		if options.maxmag and data['mag'] > float(options.maxmag): continue
+	sc3stats.setup("ev2kml", options.stats, options.profile)
 
-		if options.minarrival and data['arrivalc'] < int(options.minarrival): continue
-		if options.maxarrival and data['arrivalc'] > int(options.maxarrival): continue
+	# Watch mode runs until interrupted
+	#
+	if options.watch:
+		cache = None
+		if options.cache:
+			cache = sc3cache.EventCache(options.cache, int(options.cachesize * 1024 * 1024))
+		watch(options, cache)
+		if cache:
+			cache.close()
+		sys.exit(0)
+
+	# Database, read with one query
+	#
+	records = None
+	if options.db:
+		try:
+			records = sc3reader.databaseevents(options.db, catalogfilter(options))
+		except sc3reader.ReaderError as e:
+			print (str(e), file = sys.stderr)
+			sys.exit(1)
+
+	# Catalog, files holding no selected event are not read
+	#
+	selected = None
+	if options.catalog:
+		with sc3stats.stage("catalog"):
+			try:
+				(args, selected) = sc3catalog.select(options.catalog, args, catalogfilter(options), options.reader, options.jobs, options.timeout)
+			except ValueError as e:
+				print (str(e), file = sys.stderr)
+				sys.exit(1)
+
+	# Output
+	#
+	try:
+		output = Output(options, styler)
+	except IOError as e:
+		print ("Cannot open output file '%s'\n %s" % (options.output, str(e)), file = sys.stderr)
+		sys.exit(1)
 
-		# Find style
-		#
-		if options.usemagdep:
-			style = styler.getstyle(size = getsize(data['mag'], float(options.magscale), float(options.magpower)),
-									color = getcolor(data['dep'], float(options.depthscale)))
-		else:
-			style = styler.basicstyle()
+	# Event cache
+	#
+	cache = None
+	if options.cache:
+		cache = sc3cache.EventCache(options.cache, int(options.cachesize * 1024 * 1024))
 
-		if options.skydepth:
-			# Maximum earths eq depth is ~1000km
-			data['dep'] = -0.5 * (1000.0 - data['dep'])
+	# Loop each file
+	#
+	if records is not None:
+		results = ((options.db, data) for data in selectdata(options, datafromrecords(records)))
+	else:
+		results = sc3pool.orderedchain(functools.partial(selectevents, options, cache), args, options.jobs, options.timeout)
 
-		data['style'] = style
-		files.append(data)
+	for (f, data) in results:
+		if selected is not None and data['id'] not in selected[f]:
+			continue
 
-	# Start KML
-	#
-	openKML(sys.stdout, options, styler)
+		output.add(data)
 
-	for data in files:
-		# Write
-		#
-		ptKML(sys.stdout, options,
-			data['time'],
-			data['lon'],
-			data['lat'],
-			data['dep'],
-			data['mag'],
-			data['magt'],
-			data['desc'],
-			data['arc'],
-			data['style'])
-
-	# Finish
-	#
-	closeKML(sys.stdout)
+	if cache:
+		cache.close()
+
+	try:
+		output.close()
+	except ValueError as e:
+		print (str(e), file = sys.stderr)
+		sys.exit(1)
 
 	# END
 	#
@@ -22,12 +22,29 @@
 #                                                                              #
 #### 2015-02-28 ################################################################
 #
+from __future__ import print_function
 import os
 import sys
-import math
+import json
+import array
+import hashlib
+import bisect
 import datetime
+import functools
 from optparse import OptionParser
-from seiscomp3 import IO, DataModel, Core
+import sc3pool
+import sc3cache
+import sc3reader
+import sc3invindex
+import sc3stats
+import sc3catalog
+import sc3watch
+import sc3archive
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
 
 '''
 Station Class
@@ -36,70 +53,77 @@ Station Class
 	export, filter your events by this class before export.
 '''
 class Stations(object):
-	def __init__(self, filename):
+	def __init__(self, filename, reader = None):
 		self.inventory = None
 		self.selection = { }
+		self.index = { }
 
-		ar = IO.XMLArchive()
+		self.inventory = sc3invindex.readinventory(filename, reader)
 
-		err = ar.open(filename)
+		if type(self.inventory) != type(None):
+			self.buildindex()
 
-		if err == False:
-			print >>sys.stderr, "Filename '%s' is not accessible." % (filename)
-			return
-
-		obj = ar.readObject()
-		ar.close()
-
-		self.inventory = DataModel.Inventory.Cast(obj)
+	def buildindex(self):
+		#
+		## Collect the stream epochs, keyed by net, sta, loc and band,
+		## times are epoch seconds and open epochs end at infinity
+		epochs = { }
+		order = 0
+		for sta in self.inventory:
+			ns = "%s%s" % (sta['net'], sta['sta'])
+			for (loc, cha, start, end, depth) in sta['streams']:
+				end = float("inf") if end is None else end
+
+				key = (sta['net'], sta['sta'], loc, cha[0:2])
+				item = (start, end, order, ( ns, sta['lat'], sta['lon'], sta['elev'], depth ))
+				epochs.setdefault(key, []).append(item)
+				order += 1
 
-		self.selection = { }
+		#
+		## Sort each key by start time, reach holds the latest
+		## end seen so far so that the backward scan can stop early
+		self.index = { }
+		for key in epochs:
+			items = sorted(epochs[key], key = lambda x: (x[0], x[2]))
+			starts = [ ]
+			reach = [ ]
+			for (start, end, order, station) in items:
+				starts.append(start)
+				reach.append(max(end, reach[-1]) if reach else end)
+			self.index[key] = (starts, reach, items)
 
 	def select(self, n, s, l , c, t):
 		err = True
 
 		if type(self.inventory) == type(None): return err
 
-		for i in range(0, self.inventory.networkCount()):
-			net = self.inventory.network(i)
-			if net.code() != n: 
-				continue
-
-			for j in range(0, net.stationCount()):
-				sta = net.station(j)
-				if sta.code() != s:
-					continue
-
-				for k in range(0, sta.sensorLocationCount()):
-					loc = sta.sensorLocation(k)
-					if loc.code() != l:
-						continue
-
-					for l in range(0, loc.streamCount()):
-						cha = loc.stream(l)
-						if cha.code()[0:2] != c[0:2]:
-							continue
-
-						s = sc3timeparse(cha.start())
-						try:
-							e = cha.end()
-							e = sc3timeparse(e)
-						except Core.ValueException:
-							e = None
-
-						if s > t: continue
-						if e and e < t: continue
+		found = None
+		entry = self.index.get((n, s, l, c[0:2]))
+		if entry:
+			(starts, reach, items) = entry
+			#
+			## Walk back from the last epoch starting before t, the first
+			## stream of the inventory that covers t is the one selected
+			i = bisect.bisect_right(starts, t) - 1
+			while i >= 0:
+				if reach[i] < t: break
+				(start, end, order, station) = items[i]
+				if end >= t and (found is None or order < found[0]):
+					found = (order, station)
+				i -= 1
+
+		if found is None:
+			sc3stats.warn("unresolved station", " Warning, station (%s.%s.%s.%s @ %s) not resolved." % (n,s,l,c,datetime.datetime.utcfromtimestamp(t)))
+			return err
+
+		## FINISH SELECTION
+		station = found[1]
+		ns = station[0]
+
+		if ns not in self.selection:
+			self.selection[ns] = station
 
-						## FINISH SELECTION
-						ns = "%s%s" % (net.code(), sta.code())
-
-						if ns not in self.selection:
-							self.selection[ns] = ( ns, sta.latitude(), sta.longitude(), sta.elevation(), cha.depth() )
-
-						err = False
-						return err
-
-		print >>sys.stderr," Warning, station (%s.%s.%s.%s @ %s) not resolved." % (n,s,l,c,t)
+		err = False
 		return err
 
 	def selectbye(self, e):
@@ -117,257 +141,778 @@ class Stations(object):
 
 		return err
 
-	def write(self, openfile):
-		for k in self.selection:
+	def lines(self):
+		lines = [ ]
+		for k in sorted(self.selection):
 			(ns, lat, lon, ele, dep) = self.selection[k]
-			print >>openfile, "%-7s %8.3f %8.3f" % (ns, lat, lon)
+			lines.append("%-7s %8.3f %8.3f" % (ns, lat, lon))
+		return lines
+
+	def write(self, openfile):
+		for line in self.lines():
+			print(line, file = openfile)
+
+	def update(self, filename):
+		#
+		## Keep the stations already in the file and their order,
+		## refresh the ones selected again and append the new ones
+		lines = [ ]
+		if os.path.exists(filename):
+			with open(filename) as fio:
+				lines = [ line.rstrip("\n") for line in fio if line.strip() ]
+		where = dict([ (line.split()[0], i) for (i, line) in enumerate(lines) ])
+
+		for line in self.lines():
+			name = line.split()[0]
+			if name in where:
+				lines[where[name]] = line
+			else:
+				where[name] = len(lines)
+				lines.append(line)
+
+		replace(filename, lines)
 
 '''
 Event Class
 	This handles one event, it is instantiated by 
 	the method datafromxml and returned on success.
+
+	Picks are kept in array columns: the index of the stream
+	code in the table shared by all events, the pick time in
+	epoch seconds, the phase index in PHASES and the weight.
+	The origin time is also kept in epoch seconds, dates are
+	only formatted when the event is written. A set of the
+	stream and phase pairs already picked finds duplicates.
+
+	The stream table lives for a run, a long running process
+	calls rebase() with the events it still holds to drop the
+	streams no longer used.
 '''
 class Event(object):
-	def __init__(self, time, longitude, latitude, depth, magnitude, eh, ez, rms):
+	PHASES = ( 'P', 'S' )
+
+	streams = [ ]
+	streamindex = { }
+
+	__slots__ = ( 'publicid', 'time', 'longitude', 'latitude', 'depth', 'magnitude', 'eh', 'ez', 'rms',
+				  '_stream', '_time', '_phase', '_weight', '_picked' )
+
+	def __init__(self, time, longitude, latitude, depth, magnitude, eh, ez, rms, publicid = None):
+		self.publicid = publicid
 		self.time = time 
 
 		try:
 			self.longitude = float(longitude)
-		except TypeError,e:
-			print e
+		except TypeError as e:
+			print(e)
 			raise Exception(" Bad longitude !")
 
 		try:
 			self.latitude = float(latitude)
-		except TypeError,e:
-			print e
+		except TypeError as e:
+			print(e)
 			raise Exception(" Bad latitude !")
 
 		try:
 			self.depth = float(depth)
-		except TypeError,e:
-			print e
+		except TypeError as e:
+			print(e)
 			raise Exception(" Bad depth !")
 
 		try:
 			self.magnitude = float(magnitude)
-		except TypeError,e:
+		except TypeError as e:
 			self.magnitude = 0.0
 			pass
 
 		try:
 			self.eh = eh
-		except TypeError,e:
+		except TypeError as e:
 			self.eh = 0.0
 			pass
 
 		try:
 			self.ez = ez
-		except TypeError,e:
+		except TypeError as e:
 			self.ez = 0.0
 			pass
 
 		try:
 			self.rms = rms
-		except TypeError,e:
+		except TypeError as e:
 			self.rms = 0.0
 			pass
 
-		self.picks = { 'P': { }, 'S': { } }
+		self._stream = array.array('i')
+		self._time = array.array('d')
+		self._phase = array.array('b')
+		self._weight = array.array('d')
+		self._picked = set()
+
+	def __getstate__(self):
+		#
+		## Stream indexes are only valid in this process, send the codes
+		return (self.publicid, self.time, self.longitude, self.latitude, self.depth, self.magnitude, self.eh, self.ez, self.rms,
+				[ Event.streams[i] for i in self._stream ], self._time, self._phase, self._weight)
+
+	def __setstate__(self, state):
+		(self.publicid, self.time, self.longitude, self.latitude, self.depth, self.magnitude, self.eh, self.ez, self.rms,
+		 nslcs, self._time, self._phase, self._weight) = state
+		self._stream = array.array('i', [ Event.intern(nslc) for nslc in nslcs ])
+		self._picked = set(zip(self._stream, self._phase))
+
+	@staticmethod
+	def intern(nslc):
+		index = Event.streamindex.get(nslc)
+		if index is None:
+			index = len(Event.streams)
+			Event.streams.append(nslc)
+			Event.streamindex[nslc] = index
+		return index
+
+	@staticmethod
+	def rebase(events):
+		#
+		## A new stream table holding only the streams of events,
+		## their picks are renumbered to it
+		streams = Event.streams
+		Event.streams = [ ]
+		Event.streamindex = { }
+		for ev in events:
+			ev._stream = array.array('i', [ Event.intern(streams[i]) for i in ev._stream ])
+			ev._picked = set(zip(ev._stream, ev._phase))
 
 	def addPick(self, network, station, location, channel, time, phase, weight):
 		#
 		## Check phase
-		if phase not in self.picks.keys():
+		if phase not in self.PHASES:
 			return True
 
 		#
 		## Check that weight is 0.0
 		if weight == 0.0:
-			print >>sys.stderr," Warning, arrival with weight 0.0 on event %s stream (%s.%s.%s.%s)" % (self.time, network,station,location,channel)
+			sc3stats.warn("arrival weight 0.0", " Warning, arrival with weight 0.0 on event %s stream (%s.%s.%s.%s)" % (datetime.datetime.utcfromtimestamp(self.time), network,station,location,channel))
 
 		#
 		## Check that weight is >1.0
 		if weight > 1.0:
-			print >>sys.stderr," Warning, arrival with weight >1.0 on event %s stream (%s.%s.%s.%s) -- normilized 1.0" % (self.time, network,station,location,channel)
+			sc3stats.warn("arrival weight >1.0", " Warning, arrival with weight >1.0 on event %s stream (%s.%s.%s.%s) -- normilized 1.0" % (datetime.datetime.utcfromtimestamp(self.time), network,station,location,channel))
 			weight = 1.0
 
 		#
 		## Save pick
 		nslc = "%s.%s.%s.%s" % (network, station, location, channel)
-		if nslc in self.picks[phase]:
-			print >>sys.stderr," Phase %s is already set for %s" % (phase, nslc)
+		stream = Event.intern(nslc)
+		code = self.PHASES.index(phase)
+		if (stream, code) in self._picked:
+			sc3stats.warn("phase already set", " Phase %s is already set for %s" % (phase, nslc))
 			return True
-		self.picks[phase][nslc] = (nslc, time, phase, weight)
+
+		self._picked.add((stream, code))
+		self._stream.append(stream)
+		self._time.append(time)
+		self._phase.append(code)
+		self._weight.append(weight)
 
 		#
 		## Done
 		return False
 
+	def order(self):
+		#
+		## P picks first, each phase in the order it was added
+		return sorted(range(len(self._stream)), key = lambda i: self._phase[i])
+
 	def getpicks(self, phase = None, nslc = None ):
 		picks = [ ]
 
-		for p in self.picks:
+		for i in self.order():
+			p = self.PHASES[self._phase[i]]
 			if phase is not None and phase != p: continue
-
-			if nslc is None:
-				picks.extend(self.picks[p].values())
-			elif nslc in self.picks[p]:
-				picks.append(self.picks[p][nslc])
+			if nslc is not None and Event.streams[self._stream[i]] != nslc: continue
+			picks.append((Event.streams[self._stream[i]], self._time[i], p, self._weight[i]))
 
 		return picks
 
-	def write(self, openfile, evid):
+	def traveltimes(self):
+		#
+		## Origin and pick times are given to the microsecond, rounding
+		## both before the difference keeps the travel times exact
+		origin = round(self.time * 1E6)
+		if numpy is not None:
+			return (numpy.round(numpy.asarray(self._time, dtype = numpy.float64) * 1E6) - origin) / 1E6
+		return [ (round(t * 1E6) - origin) / 1E6 for t in self._time ]
+
+	def lines(self, evid):
+		(seconds, microseconds) = divmod(int(round(self.time * 1E6)), 1000000)
+		time = datetime.datetime.utcfromtimestamp(seconds)
+
 		#
-		## Output Event line
-		print >>openfile,"# %04d %02d %02d %02d %02d %.4f %.4f %.4f %.2f %.2f %.1f %.1f %.2f %9d" % (self.time.year, self.time.month, self.time.day,
-																									self.time.hour, self.time.minute, (float(self.time.second) + float(self.time.microsecond) / 1E6),
-																									self.latitude, self.longitude, self.depth,
-																									self.magnitude,
-																									self.eh, self.ez, self.rms, evid)
+		## Event line
+		lines = [ "# %04d %02d %02d %02d %02d %.4f %.4f %.4f %.2f %.2f %.1f %.1f %.2f %9d" % (time.year, time.month, time.day,
+																							time.hour, time.minute, (float(time.second) + float(microseconds) / 1E6),
+																							self.latitude, self.longitude, self.depth,
+																							self.magnitude,
+																							self.eh, self.ez, self.rms, evid) ]
 
 		#
 		## P-wave picks
-		for (nslc, time, phase, weight) in self.getpicks():
-			tt = time - self.time
-			(n, s, l, c) = nslc.split(".")
-			print >>openfile,"%-7s %8.4f %3.1f %1s" % ("%s%s" % (n,s), tt.total_seconds(), weight, phase)
+		tts = self.traveltimes()
+		for i in self.order():
+			(n, s, l, c) = Event.streams[self._stream[i]].split(".")
+			lines.append("%-7s %8.4f %3.1f %1s" % ("%s%s" % (n,s), tts[i], self._weight[i], self.PHASES[self._phase[i]]))
+
+		return lines
+
+	def write(self, openfile, evid):
+		for line in self.lines(evid):
+			print(line, file = openfile)
 
 		return
 
 '''
-Sc3 Time
+Differential Times Class
+	Collects the hypocentres and P/S travel times of the written
+	events and exports the catalog differential times (dt.ct)
+	needed by hypoDD, replacing the pair search done by ph2dt.
+	Event pairs are searched on a grid of MAXSEP sized cells over
+	earth centered coordinates so that only events in neighbouring
+	cells are ever compared.
 '''
-def sc3timeparse(sc3t):
-	#
-	## Get Core Time from TimeQuantity
-	if isinstance(sc3t, DataModel.TimeQuantity):
-		sc3t = sc3t.value()
-	
-	#
-	## Send to standard datetime
-	dt = datetime.datetime.utcfromtimestamp( float(sc3t.seconds()) + float(sc3t.microseconds()) / 1E6 )
+class DifferentialTimes(object):
+	EARTH = 6371.0
+	BLOCK = 1 << 20
+
+	def __init__(self, maxsep, maxngh, minlnk, maxobs, maxdist):
+		self.maxsep = maxsep
+		self.maxngh = maxngh
+		self.minlnk = minlnk
+		self.maxobs = maxobs
+		self.maxdist = maxdist
+
+		self.codes = { }
+		self.ids = [ ]
+		self.hypocentres = [ ]
+		self.keys = [ ]
+		self.tts = [ ]
+		self.weights = [ ]
+
+	def xyz(self, latitude, longitude, radius):
+		latitude = numpy.radians(latitude)
+		longitude = numpy.radians(longitude)
+		return numpy.column_stack((radius * numpy.cos(latitude) * numpy.cos(longitude),
+								   radius * numpy.cos(latitude) * numpy.sin(longitude),
+								   radius * numpy.sin(latitude)))
+
+	def add(self, e, evid):
+		if not isinstance(e, Event):
+			raise Exception("Object has bad value")
+
+		#
+		## Each station and phase is a key, station*2 + (0 for P, 1 for S)
+		keys = [ ]
+		for (stream, phase) in zip(e._stream, e._phase):
+			(n, s, l, c) = Event.streams[stream].split(".")
+			code = self.codes.setdefault("%s%s" % (n,s), len(self.codes))
+			keys.append(2 * code + phase)
+
+		#
+		## Only the first pick of a station and phase is used
+		(keys, first) = numpy.unique(numpy.array(keys, dtype = numpy.int64), return_index = True)
+
+		self.ids.append(evid)
+		self.hypocentres.append((e.latitude, e.longitude, e.depth))
+		self.keys.append(keys)
+		self.tts.append(e.traveltimes()[first])
+		self.weights.append(numpy.asarray(e._weight, dtype = numpy.float64)[first])
+
+	def stationxyz(self, selection):
+		#
+		## Station coordinates by code, NaN for stations not selected
+		xyz = numpy.empty((len(self.codes), 3))
+		xyz.fill(numpy.nan)
+		for (ns, code) in self.codes.items():
+			if ns not in selection: continue
+			(ns, lat, lon, ele, dep) = selection[ns]
+			xyz[code] = self.xyz(lat, lon, self.EARTH + (ele - dep) / 1000.0)[0]
+		return xyz
+
+	def neighbours(self, xyz):
+		#
+		## Bin hypocentres in cells of maxsep
+		cells = numpy.floor(xyz / self.maxsep).astype(numpy.int64)
+		grid = { }
+		for (i, cell) in enumerate(map(tuple, cells)):
+			grid.setdefault(cell, []).append(i)
+
+		offsets = [ (a, b, c) for a in (-1, 0, 1) for b in (-1, 0, 1) for c in (-1, 0, 1) ]
 
-	return dt
+		#
+		## Compare each cell against its 27 neighbouring cells, a block
+		## of members at a time so that a crowded cell, like the one of
+		## an aftershock sequence, never needs more than BLOCK distances.
+		## Cells go in the order of their first event, the pairs come
+		## out the same whatever the order of the dictionary
+		for cell in sorted(grid, key = lambda cell: grid[cell][0]):
+			members = grid[cell]
+			candidates = [ ]
+			for (a, b, c) in offsets:
+				candidates.extend(grid.get((cell[0] + a, cell[1] + b, cell[2] + c), []))
+			candidates = numpy.array(candidates, dtype = numpy.int64)
+
+			members = numpy.array(members, dtype = numpy.int64)
+			rows = max(1, self.BLOCK // len(candidates))
+			for start in range(0, len(members), rows):
+				block = members[start:start + rows]
+				distance = numpy.zeros((len(block), len(candidates)))
+				for axis in range(3):
+					distance += (xyz[block, axis][:, None] - xyz[candidates, axis][None, :]) ** 2
+				distance = numpy.sqrt(distance)
+
+				for (k, i) in enumerate(block):
+					near = (distance[k] <= self.maxsep) & (candidates != i)
+					order = numpy.argsort(distance[k][near], kind = "mergesort")
+					yield (i, candidates[near][order])
+
+	def write(self, openfile, selection):
+		if not self.ids: return
+
+		hypocentres = numpy.array(self.hypocentres, dtype = numpy.float64)
+		xyz = self.xyz(hypocentres[:, 0], hypocentres[:, 1], self.EARTH - hypocentres[:, 2])
+
+		stations = self.stationxyz(selection)
+		names = [ None ] * len(self.codes)
+		for (ns, code) in self.codes.items():
+			names[code] = ns
+		names = numpy.array(names)
+		phases = numpy.array([ 'P', 'S' ])
+
+		done = set()
+		npairs = 0
+		nobs = 0
+		for (i, candidates) in self.neighbours(xyz):
+			nngh = 0
+			for j in candidates:
+				if nngh >= self.maxngh: break
+
+				#
+				## Shared stations and phases of the pair
+				(keys, a, b) = numpy.intersect1d(self.keys[i], self.keys[j], assume_unique = True, return_indices = True)
+
+				#
+				## Only stations known to the inventory and close enough
+				distance = numpy.sqrt(((stations[keys // 2] - (xyz[i] + xyz[j]) / 2.0) ** 2).sum(axis = 1))
+				keep = ~numpy.isnan(distance)
+				if self.maxdist is not None:
+					keep &= distance <= self.maxdist
+				if keep.sum() < self.minlnk: continue
+
+				nngh += 1
+
+				pair = (min(i, j), max(i, j))
+				if pair in done: continue
+				done.add(pair)
+
+				#
+				## Closest stations first, up to maxobs
+				order = numpy.argsort(distance[keep], kind = "mergesort")[:self.maxobs]
+				keys = keys[keep][order]
+				(a, b) = (a[keep][order], b[keep][order])
+				(first, second) = (i, j) if self.ids[i] < self.ids[j] else (j, i)
+				if first != i: (a, b) = (b, a)
+
+				print("# %9d %9d" % (self.ids[first], self.ids[second]), file = openfile)
+				for (name, tt1, tt2, weight, phase) in zip(names[keys // 2],
+															self.tts[first][a], self.tts[second][b],
+															(self.weights[first][a] + self.weights[second][b]) / 2.0,
+															phases[keys % 2]):
+					print("%-7s %8.4f %8.4f %6.4f %s" % (name, tt1, tt2, weight, phase), file = openfile)
+
+				npairs += 1
+				nobs += len(keys)
+
+		print("Wrote %d event pairs with %d differential times." % (npairs, nobs), file = sys.stderr)
 
 '''
-Data Reader
+State Class
+	Remembers the hypoDD id given to every SC3 event publicID and
+	a digest of the lines written for it. Running again with the
+	same state file keeps the ids and only exports the events that
+	are new or changed since the last run. Without filename it is
+	only kept in memory.
+
+	The state belongs to the event file it was saved with, whose name
+	and content hash it keeps. A state of another event file is
+	refused. When the event file is gone or was changed since, the
+	digests are forgotten and rewrite is set, every event is written
+	again into a new event file under the ids it had.
 '''
-def datafromxml(filename):
-	ev = None
-
-	ar = IO.XMLArchive()
+class State(object):
+	VERSION = 1
 
-	err = ar.open(filename)
-	if err == False:
-		print >>sys.stderr, "Filename '%s' is not accessible." % (filename)
-		return None
+	def __init__(self, filename, eventfile = None):
+		self.filename = filename
+		self.output = None if eventfile is None else os.path.abspath(eventfile)
+		self.events = { }
+		self.next = 1
+		self.rewrite = True
 
-	obj = ar.readObject()
-	ar.close()
+		if filename is None or not os.path.exists(filename): return
 
-	ep = DataModel.EventParameters.Cast(obj)
+		with open(filename) as fio:
+			state = json.load(fio)
 
-	if type(ep) == type(None):
-		print >>sys.stderr,"File (%s) is no event, skipping." % filename
-		return None
+		if state.get('version') != self.VERSION:
+			raise Exception("State file '%s' has an unknown version" % filename)
 
-	if ep.eventCount == 0:
-		print >>sys.stderr,"File (%s) has no events, skipping." % filename
-		return None
+		if state.get('output') not in (None, self.output):
+			raise Exception("State file '%s' belongs to the event file '%s'" % (filename, state['output']))
 
-	evt = ep.event(0)
-	evt = DataModel.Event.Cast(evt)
+		self.events = state['events']
+		self.next = state['next']
 
-	if type(evt) == type(None):
-		print >>sys.stderr,"Cannot get event from file (%s), skipping." % filename
-		return None
+		self.rewrite = state.get('fingerprint') is None or state['fingerprint'] != fingerprint(self.output)
+		if self.rewrite:
+			print("Event file '%s' is missing or changed since the state was saved, writing all events again." % eventfile, file = sys.stderr)
+			for entry in self.events.values():
+				entry[1] = None
 
-	if evt.preferredOriginID() == "":
-		print >>sys.stderr,"No origin (%s), skipping." % filename
-		return None
+	def id(self, publicid):
+		if publicid not in self.events:
+			self.events[publicid] = [ self.next, None ]
+			self.next += 1
+		return self.events[publicid][0]
 
-	print >>sys.stderr,"\nProcessing event %s (%s)" % (evt.publicID(), filename)
+	def digest(self, publicid):
+		return self.events[publicid][1] if publicid in self.events else None
 
-	if evt.preferredMagnitudeID() == "":
-		print >>sys.stderr," No magnitude (%s)" % filename
+	def update(self, publicid, digest):
+		self.events[publicid][1] = digest
 
-	ori = ep.findOrigin(evt.preferredOriginID())
-	mag = ori.findMagnitude(evt.preferredMagnitudeID())
+	def save(self):
+		if self.filename is None: return
+		replace(self.filename, [ json.dumps({ 'version': self.VERSION, 'next': self.next, 'events': self.events,
+											  'output': self.output, 'fingerprint': fingerprint(self.output) }, sort_keys = True) ])
 
-	mag = mag.magnitude().value() if type(mag) != type(None) else None
+'''
+File Helpers
+'''
+def fingerprint(filename):
+	if filename is None or not os.path.isfile(filename):
+		return None
+	return sc3cache.filehash(filename)
 
+def replace(filename, lines):
 	#
-	## Assembly errors from Sc3 solution
-	try:
-		eh  = math.sqrt(math.pow(ori.latitude().uncertainty(), 2)  + math.pow(ori.longitude().uncertainty(), 2))
-	except Core.ValueException:
-		eh = 0.0
-	
-	try:
-		ez  = ori.depth().uncertainty()
-	except Core.ValueException:
-		ez = 0.0
+	## Write next to the file and rename, readers never see half a file
+	tmp = "%s.tmp" % filename
+	with open(tmp, "w") as fio:
+		for line in lines:
+			print(line, file = fio)
+	os.rename(tmp, filename)
+
+def splice(filename, blocks):
+	#
+	## Replace the events given as id -> lines in a phase file, the
+	## ones that are not found in it are appended
+	blocks = dict(blocks)
+	lines = [ ]
+	skip = False
+	with open(filename) as fio:
+		for line in fio:
+			line = line.rstrip("\n")
+			if line.startswith("#"):
+				evid = int(line.split()[-1])
+				skip = evid in blocks
+				if skip: lines.extend(blocks.pop(evid))
+			if not skip: lines.append(line)
+
+	for evid in sorted(blocks):
+		lines.extend(blocks[evid])
+
+	replace(filename, lines)
 
-	try:
-		rms = ori.quality().standardError()
-	except Core.ValueException:
-		rms = 0.0
+'''
+Data Reader
+'''
+def eventfromrecord(record, filename):
+	print("\nProcessing event %s (%s)" % (record['id'], filename), file = sys.stderr)
 
 	try:
-		ev = Event(time = sc3timeparse(ori.time()),
-				   longitude = ori.longitude().value(),
-				   latitude = ori.latitude().value(),
-				   depth = ori.depth().value(),
-				   magnitude = mag,
-				   eh = eh, ez = ez, rms = rms)
-	except Exception,e:
-		print >>sys.stderr," %s" % (str(e))
+		ev = Event(time = record['time'],
+				   longitude = record['lon'],
+				   latitude = record['lat'],
+				   depth = record['dep'],
+				   magnitude = record['mag'],
+				   eh = record['eh'], ez = record['ez'], rms = record['rms'],
+				   publicid = record['id'])
+	except Exception as e:
+		sc3stats.warn("rejected event", " %s" % (str(e)))
 		return None
 
-	for i in range(0,ori.arrivalCount()):
+	for (n, s, l, c, time, phase, weight, pickid) in record['picks']:
 		#
-		## Get Arrival
-		arrival = ori.arrival(i)
+		## Load Pick into Event
+		err = ev.addPick(n, s, l, c,
+						time,
+						phase,
+						weight
+			)
+
+		if err:
+			sc3stats.warn("rejected pick", " Pick %s, %s, was rejected" % (phase, pickid))
+
+	return ev
+
+def datafromxml(filename, cache = None, reader = None):
+	return datafromrecords(sc3reader.readevents(filename, cache, reader), filename)
+
+def datafromrecords(records, filename):
+	for record in sc3stats.timed("parse", records):
+		with sc3stats.stage("picks"):
+			ev = eventfromrecord(record, filename)
+		if ev is not None:
+			yield ev
+
+'''
+Output Class
+	Writes the events handed to add() to the hypoDD files named in
+	options, in the order they are given. The station and the
+	differential times files are written by close(), which also
+	splices in the changed events and saves the state in
+	incremental mode and removes the output files left empty.
+'''
+class Output(object):
+	def __init__(self, options, state, station):
+		self.options = options
+		self.state = state
+		self.station = station
+
+		self.eventfile = None
+		self.stationfile = None
+		self.dtctfile = None
+
+		self.sequenceid = 1
+		self.changed = { }
+		self.counts = { 'new': 0, 'changed': 0, 'unchanged': 0 }
+
+		try:
+			if options.eventfile:
+				self.eventfile = sc3stats.Counted(open(options.eventfile, "a" if state and not state.rewrite else "w"))
+		except IOError as e:
+			raise IOError("Cannot open event file '%s'\n %s" % (options.eventfile, str(e)))
+
+		try:
+			if options.stationfile and not state:
+				self.stationfile = sc3stats.Counted(open(options.stationfile, "w"))
+		except IOError as e:
+			raise IOError("Cannot open station file '%s'\n %s" % (options.stationfile, str(e)))
+
+		try:
+			if options.dtctfile:
+				self.dtctfile = sc3stats.Counted(open(options.dtctfile, "w"))
+				self.dtct = DifferentialTimes(options.maxsep, options.maxngh, options.minlnk, options.maxobs, options.maxdist)
+		except IOError as e:
+			raise IOError("Cannot open differential times file '%s'\n %s" % (options.dtctfile, str(e)))
+
+	def add(self, ev):
+		state = self.state
+		sequenceid = self.sequenceid
 
 		#
-		## Get Pick
-		pick = ep.findPick(arrival.pickID())
-		if type(pick) == type(None):
-			print >>sys.stderr," Invalid pick -- %s " % arrival.pickID()
+		## Filter the station class
+		with sc3stats.stage("stations"):
+			err = self.station.selectbye(ev)
+		if err:
+			sc3stats.warn("station not selected", " Warning. Station is not selected.")
 
 		#
-		## Get WaveformID
-		waveform = pick.waveformID()
+		## Events keep their id between runs in incremental mode
+		if state:
+			sequenceid = state.id(ev.publicid)
 
 		#
-		## Phase Hint
-		phaseHint = pick.phaseHint()
+		## Write to output
+		with sc3stats.stage("write"):
+			if self.eventfile and state:
+				lines = ev.lines(sequenceid)
+				digest = hashlib.sha1("\n".join(lines).encode("utf-8")).hexdigest()
+				previous = state.digest(ev.publicid)
+				if previous is None:
+					for line in lines:
+						print(line, file = self.eventfile)
+					self.counts['new'] += 1
+				elif previous != digest:
+					self.changed[sequenceid] = lines
+					self.counts['changed'] += 1
+				else:
+					self.counts['unchanged'] += 1
+				state.update(ev.publicid, digest)
+			elif self.eventfile:
+				ev.write(self.eventfile, sequenceid)
+
+		if self.dtctfile:
+			with sc3stats.stage("dtct"):
+				self.dtct.add(ev, sequenceid)
 
 		#
-		## Load Pick into Event
-		err = ev.addPick(waveform.networkCode(),
-						waveform.stationCode(),
-						waveform.locationCode(),
-						waveform.channelCode(),
-						sc3timeparse(pick.time()),
-						phaseHint.code(),
-						arrival.weight()
-			)
+		## Prepare a new sequence
+		self.sequenceid = sequenceid + 1
 
-		if err:
-			print >>sys.stderr," Pick %s, %s, was rejected" % (phaseHint.code(), arrival.pickID())
+	def close(self):
+		options = self.options
+		state = self.state
 
-	return ev
+		#
+		## Close Event File if open
+		if self.eventfile:
+			self.eventfile.close()
+
+		#
+		## Replace the changed events and record the state once the
+		## event file is complete
+		if state:
+			with sc3stats.stage("write"):
+				if self.changed:
+					splice(options.eventfile, self.changed)
+				state.save()
+			print("Incremental export: %d new, %d changed and %d unchanged events." % (self.counts['new'], self.counts['changed'], self.counts['unchanged']), file = sys.stderr)
+
+		#
+		## Output stations
+		with sc3stats.stage("write"):
+			if self.stationfile:
+				self.station.write(self.stationfile)
+				self.stationfile.close()
+			elif options.stationfile and state:
+				self.station.update(options.stationfile)
+
+		#
+		## Output differential times
+		if self.dtctfile:
+			with sc3stats.stage("dtct"):
+				self.dtct.write(self.dtctfile, self.station.selection)
+			self.dtctfile.close()
+
+		#
+		## Make sure empty files are not left around
+		if options.stationfile and os.path.getsize(options.stationfile) == 0:
+			print("Warning, removing empty station file '%s'" % options.stationfile, file = sys.stderr)
+			os.unlink(options.stationfile)
+
+		if options.eventfile and os.path.getsize(options.eventfile) == 0:
+			print("Warning, removing empty event file '%s'" % options.eventfile, file = sys.stderr)
+			os.unlink(options.eventfile)
+
+		if options.dtctfile and os.path.getsize(options.dtctfile) == 0:
+			print("Warning, removing empty differential times file '%s'" % options.dtctfile, file = sys.stderr)
+			os.unlink(options.dtctfile)
+
+'''
+Watch Mode
+	Keeps the events of every file of the watched directory in memory
+	with their hypoDD lines, only new or modified files are parsed.
+	Events keep their id while running, and between runs with a
+	state file. After every change the output files are written from
+	memory again and replace the old ones at once. Stations selected
+	once stay in the station file.
+'''
+def watch(options, state, station, cache):
+	files = { }
+
+	def update(changed, removed):
+		for f in removed:
+			files.pop(f, None)
+		for f in changed:
+			files[f] = [ ]
+
+		for (f, ev) in sc3pool.orderedchain(functools.partial(datafromxml, cache = cache, reader = options.reader), changed, options.jobs, options.timeout):
+			with sc3stats.stage("stations"):
+				err = station.selectbye(ev)
+			if err:
+				sc3stats.warn("station not selected", " Warning. Station is not selected.")
+
+			sequenceid = state.id(ev.publicid)
+			lines = ev.lines(sequenceid)
+			state.update(ev.publicid, hashlib.sha1("\n".join(lines).encode("utf-8")).hexdigest())
+			files[f].append((sequenceid, ev, lines))
+
+		#
+		## Streams only used by the events dropped are forgotten
+		Event.rebase([ ev for f in files for (sequenceid, ev, lines) in files[f] ])
+
+		events = sorted([ item for f in files for item in files[f] ], key = lambda item: item[0])
+
+		try:
+			with sc3stats.stage("write"):
+				if options.eventfile:
+					replace(options.eventfile, [ line for (sequenceid, ev, lines) in events for line in lines ])
+				if options.stationfile:
+					replace(options.stationfile, station.lines())
+				state.save()
+
+			if options.dtctfile:
+				with sc3stats.stage("dtct"):
+					dtct = DifferentialTimes(options.maxsep, options.maxngh, options.minlnk, options.maxobs, options.maxdist)
+					for (sequenceid, ev, lines) in events:
+						dtct.add(ev, sequenceid)
+					dtctfile = sc3watch.Replacement(options.dtctfile)
+					dtct.write(dtctfile, station.selection)
+					dtctfile.close()
+		except (IOError, OSError) as e:
+			print("Cannot write the output\n %s" % str(e), file = sys.stderr)
+			return
+
+		print("Read %d and dropped %d files, %d events in %d files." % (len(changed), len(removed), len(events), len(files)), file = sys.stderr)
+
+	sc3watch.watch(options.watch, options.interval, update)
+
+'''
+Option Checks
+	Raises ValueError when the output options cannot be used
+'''
+def checkoptions(options):
+	if options.eventfile is None and options.stationfile is None and options.dtctfile is None:
+		raise ValueError("Nothing to do, please specify at least one of the output files.")
+
+	if options.dtctfile and numpy is None:
+		raise ValueError("Writing differential times needs numpy, please install it.")
+
+	if options.state and options.eventfile is None:
+		raise ValueError("Incremental export needs the event file, please specify it with --events.")
 
 def make_cmdline_parser():
 	# Create the parser
 	#
-	parser = OptionParser(usage="%prog [options] <files>", version="1.0", add_help_option = True)
+	parser = OptionParser(usage="%prog [options] <event files or archives>", version="1.0", add_help_option = True)
 
 	parser.add_option("--events", dest="eventfile", help="Filename to write events information and picks in hypoDD format", default=None)
 	parser.add_option("--stations", dest="stationfile", help="Filename to write station information in hypoDD format", default=None)
-	parser.add_option("--inventory", dest="inventory", help="Filename to read sc3 inventory from", default="inventory.xml")
+	parser.add_option("--inventory", dest="inventory", help="Filename to read sc3 inventory from, its index built by sc3invindex.py is used when up to date", default="inventory.xml")
+	parser.add_option("--state", dest="state", help="JSON file keeping the hypoDD id of every event between runs, only new or changed events are appended to the event file and the station file is updated in place", default=None)
+	parser.add_option("--reader", type="choice", choices=sc3reader.READERS, dest="reader", help="XML reader, seiscomp uses the SeisComP bindings and stream a lightweight parser (%s)" % "/".join(sc3reader.READERS), default=None)
+
+	parser.add_option("--dtct", dest="dtctfile", help="Filename to write catalog differential times (dt.ct) in hypoDD format", default=None)
+	parser.add_option("--maxsep", type="float", dest="maxsep", help="Maximum hypocentral separation of an event pair in dt.ct (km)", default=10.0)
+	parser.add_option("--maxngh", type="int", dest="maxngh", help="Maximum number of neighbours of an event in dt.ct", default=10)
+	parser.add_option("--minlnk", type="int", dest="minlnk", help="Minimum number of shared phases for an event pair in dt.ct", default=8)
+	parser.add_option("--maxobs", type="int", dest="maxobs", help="Maximum number of differential times of an event pair in dt.ct", default=50)
+	parser.add_option("--maxdist", type="float", dest="maxdist", help="Maximum distance between an event pair and a station in dt.ct (km)", default=500.0)
+
+	parser.add_option("--jobs", type="int", dest="jobs", help="Number of worker processes used to parse the event files", default=1)
+	parser.add_option("--timeout", type="float", dest="timeout", help="Seconds a worker may spend on one event file before it is abandoned (with --jobs)", default=300.0)
+	parser.add_option("--cache", dest="cache", help="SQLite file used to keep the parsed events between runs", default=None)
+	parser.add_option("--cache-size", type="float", dest="cachesize", help="Maximum size of the event cache in MB", default=1024.0)
+
+	parser.add_option("--catalog", dest="catalog", help="SQLite catalog index built by sc3catalog.py, only files with events matching --where are read. The files given are indexed first when needed, without files all the catalog is used", default=None)
+	parser.add_option("--db", dest="db", help="Read the events from this SQLite database in the SeisComP schema instead of event files", default=None)
+	parser.add_option("--where", dest="where", help="SQL condition on the columns id, time, lat, lon, dep, mag, magt and arc selecting the events (with --catalog or --db)", default=None)
+
+	parser.add_option("--watch", dest="watch", help="Keep running and rewrite the output files whenever event files in the directory WATCH are added, changed or removed", default=None)
+	parser.add_option("--interval", type="float", dest="interval", help="Seconds between two looks at the --watch directory", default=10.0)
+
+	parser.add_option("--stats", dest="stats", help="Write a JSON summary of stage times, counters and warnings at exit to STATS (- for stderr)", default=None)
+	parser.add_option("--profile", dest="profile", help="Write a cProfile dump of the main process to PROFILE", default=None)
 
 	return parser
 
@@ -375,76 +920,107 @@ if __name__ == "__main__":
 	parser = make_cmdline_parser()
 	(options, args) = parser.parse_args()
 
-	if options.eventfile is None and options.stationfile is None:
-		print >>sys.stderr,"Nothing to do, please specify at least one of the output files."
-		sys.exit(1)
-
-	station = Stations(options.inventory)
+	#
+	## Event archives are read shard by shard
+	args = list(sc3archive.expand(args))
 
-	eventfile = None
-	stationfile = None
+	try:
+		checkoptions(options)
+	except ValueError as e:
+		print(str(e), file = sys.stderr)
+		sys.exit(1)
 
 	try:
-		if options.eventfile:
-			eventfile = open(options.eventfile, "w")
-	except IOError,e:
-		print >>sys.stderr,"Cannot open event file '%s'\n %s" % (options.eventfile, str(e))
+		options.reader = sc3reader.checkreader(options.reader)
+	except Exception as e:
+		print(str(e), file = sys.stderr)
 		sys.exit(1)
 
+	state = None
 	try:
-		if options.stationfile:
-			stationfile = open(options.stationfile, "w")
-	except IOError,e:
-		print >>sys.stderr,"Cannot open station file '%s'\n %s" % (options.stationfile, str(e))
+		if options.state:
+			state = State(options.state, options.eventfile)
+	except Exception as e:
+		print("Cannot load state file '%s'\n %s" % (options.state, str(e)), file = sys.stderr)
 		sys.exit(1)
 
-	#
-	## Parse all files
-	sequenceid = 1
-	for f in args:
-		#
-		## Parse data
-		ev = datafromxml(f)
+	if options.where and not (options.catalog or options.db):
+		print("--where needs a catalog given with --catalog or a database given with --db.", file = sys.stderr)
+		sys.exit(1)
 
-		#
-		## Event is invalid, skip
-		if ev is None: continue
+	if options.db and (args or options.catalog):
+		print("Events are read from the database %s, no event files or catalog can be given." % options.db, file = sys.stderr)
+		sys.exit(1)
 
-		#
-		## Filter the station class
-		err = station.selectbye(ev)
-		if err:
-			print >>sys.stderr, " Warning. Station is not selected."
+	if options.watch and (args or options.db or options.catalog):
+		print("Watch mode reads the files in %s, no event files, catalog or database can be given." % options.watch, file = sys.stderr)
+		sys.exit(1)
 
-		#
-		## Write to output
-		if eventfile:
-			ev.write(eventfile, sequenceid)
+	sc3stats.setup("sc32ph", options.stats, options.profile)
 
-		#
-		## Prepare a new sequence
-		sequenceid += 1
+	#
+	## The database is read with one query
+	records = None
+	if options.db:
+		try:
+			records = sc3reader.databaseevents(options.db, [ (options.where, ()) ] if options.where else [ ])
+		except sc3reader.ReaderError as e:
+			print(str(e), file = sys.stderr)
+			sys.exit(1)
 
 	#
-	## Close Event File if open
-	if eventfile:
-		eventfile.close()
+	## Files holding no selected event are not read
+	selected = None
+	if options.catalog:
+		with sc3stats.stage("catalog"):
+			try:
+				(args, selected) = sc3catalog.select(options.catalog, args, [ (options.where, ()) ] if options.where else [ ],
+													 options.reader, options.jobs, options.timeout)
+			except ValueError as e:
+				print(str(e), file = sys.stderr)
+				sys.exit(1)
+
+	with sc3stats.stage("inventory"):
+		station = Stations(options.inventory, options.reader)
 
 	#
-	## Output stations
-	if stationfile:
-		station.write(stationfile)
-		stationfile.close()
+	## Watch mode runs until interrupted
+	if options.watch:
+		cache = None
+		if options.cache:
+			cache = sc3cache.EventCache(options.cache, int(options.cachesize * 1024 * 1024))
+		watch(options, state or State(None), station, cache)
+		if cache:
+			cache.close()
+		sys.exit(0)
+
+	try:
+		output = Output(options, state, station)
+	except IOError as e:
+		print(str(e), file = sys.stderr)
+		sys.exit(1)
 
 	#
-	## Make sure empty files are not left around
-	if options.stationfile and os.path.getsize(options.stationfile) == 0:
-		print >>sys.stderr,"Warning, removing empty station file '%s'" % options.stationfile
-		os.unlink(options.stationfile)
-
-	if options.eventfile and os.path.getsize(options.eventfile) == 0:
-		print >>sys.stderr,"Warning, removing empty event file '%s'" % options.eventfile
-		os.unlink(options.eventfile)
+	## Parse all files
+	cache = None
+	if options.cache:
+		cache = sc3cache.EventCache(options.cache, int(options.cachesize * 1024 * 1024))
+
+	if records is not None:
+		results = ((options.db, ev) for ev in datafromrecords(records, options.db))
+	else:
+		results = sc3pool.orderedchain(functools.partial(datafromxml, cache = cache, reader = options.reader), args, options.jobs, options.timeout)
+
+	for (f, ev) in results:
+		if selected is not None and ev.publicid not in selected[f]:
+			continue
+
+		output.add(ev)
+
+	if cache:
+		cache.close()
+
+	output.close()
 
 	#
 	## Done
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#                                                                              #
+#   Sharded event archive shared by the sc3tools converters                    #
+#   Copyright (C) 2026  Marcelo Belentani de Bianchi                           #
+#                                                                              #
+#   This program is free software; you can redistribute it and/or modify       #
+#   it under the terms of the GNU General Public License as published by       #
+#   the Free Software Foundation; either version 2 of the License, or          #
+#   (at your option) any later version.                                        #
+#                                                                              #
+#   This program is distributed in the hope that it will be useful,            #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#   GNU General Public License for more details.                               #
+#                                                                              #
+#   You should have received a copy of the GNU General Public License along    #
+#   with this program; if not, write to the Free Software Foundation, Inc.,    #
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.                #
+#                                                                              #
+#### 2026-10-18 ################################################################
+#
+from __future__ import print_function
+import os
+import sys
+import zlib
+import struct
+import sqlite3
+from xml.parsers import expat
+from optparse import OptionParser
+
+'''
+Event Archive
+	A directory holding the XML dumps of many events in a few large
+	shard files instead of one file per event. Every event is one
+	gzip member of a shard, named after the event, so a shard is a
+	valid gzip file and zcat prints the events one after the other.
+	The index, index.db in the same directory, has the table
+
+		members (id, shard, offset, length)
+
+	giving the shard file name and the byte range of the member of
+	every event publicID. A shard is filled up to about shardsize
+	bytes before the next one is started.
+
+	An event added again goes to the newest shard and the index is
+	pointed to it. Its old shard gets an empty member appended, so
+	that shard changes too and caches keyed on its size and content
+	do not serve the replaced event. A removed event leaves the index
+	the same way. The members left behind are only dropped when the
+	archive is compacted, which writes every shard holding them anew
+	with the members of the index alone. Nothing else may write to
+	the archive meanwhile.
+'''
+INDEX = "index.db"
+SUFFIX = ".shard"
+SHARDSIZE = 64 * 1024 * 1024
+
+def isarchive(path):
+	return os.path.isdir(path) and os.path.exists(os.path.join(path, INDEX))
+
+def isshard(filename):
+	return filename.endswith(SUFFIX) and os.path.exists(os.path.join(os.path.dirname(filename), INDEX))
+
+def shards(directory):
+	names = [ f for f in os.listdir(directory) if f.endswith(SUFFIX) ]
+	return [ os.path.join(directory, f) for f in sorted(names) ]
+
+def member(name, data):
+	#
+	## A gzip member with FNAME set, see RFC 1952
+	compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+	body = compressor.compress(data) + compressor.flush()
+
+	return (b"\x1f\x8b\x08\x08" + struct.pack("<I", 0) + b"\x00\xff" + name.encode("utf-8") + b"\x00" +
+			body + struct.pack("<II", zlib.crc32(data) & 0xFFFFFFFF, len(data) & 0xFFFFFFFF))
+
+class Archive(object):
+	VERSION = 1
+
+	def __init__(self, directory, shardsize = SHARDSIZE):
+		self.directory = directory
+		self.shardsize = shardsize
+
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+
+		#
+		## The writer in sc3dump adds from several threads, one at a time
+		self.db = sqlite3.connect(os.path.join(directory, INDEX), timeout = 60.0, check_same_thread = False)
+		self.db.execute("PRAGMA synchronous=NORMAL")
+		if self.db.execute("PRAGMA user_version").fetchone()[0] != self.VERSION:
+			if self.db.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'members'").fetchone()[0]:
+				raise Exception("Archive index '%s' has an unknown version" % os.path.join(directory, INDEX))
+			self.db.execute("PRAGMA user_version = %d" % self.VERSION)
+		self.db.execute("CREATE TABLE IF NOT EXISTS members (id TEXT PRIMARY KEY, shard TEXT, offset INTEGER, length INTEGER)")
+		self.db.execute("CREATE INDEX IF NOT EXISTS members_shard ON members (shard, offset)")
+		self.db.commit()
+
+	def shards(self):
+		return shards(self.directory)
+
+	def ids(self):
+		return [ row[0] for row in self.db.execute("SELECT id FROM members ORDER BY shard, offset") ]
+
+	def locate(self, evid):
+		return self.db.execute("SELECT shard, offset, length FROM members WHERE id = ?", (evid,)).fetchone()
+
+	def read(self, evid):
+		#
+		## The XML of one event, None when it is not in the archive
+		row = self.locate(evid)
+		if row is None: return None
+
+		(shard, offset, length) = row
+		with open(os.path.join(self.directory, shard), "rb") as fio:
+			fio.seek(offset)
+			return zlib.decompress(fio.read(length), 16 + zlib.MAX_WBITS)
+
+	def current(self):
+		#
+		## Numbered on from the last shard, compaction can leave gaps
+		shards = self.shards()
+		if not shards:
+			return "%05d%s" % (0, SUFFIX)
+		if os.path.getsize(shards[-1]) < self.shardsize:
+			return os.path.basename(shards[-1])
+		return "%05d%s" % (int(os.path.basename(shards[-1])[:-len(SUFFIX)]) + 1, SUFFIX)
+
+	def append(self, shard, data):
+		with open(os.path.join(self.directory, shard), "ab") as fio:
+			offset = fio.tell()
+			fio.write(data)
+		return offset
+
+	def add(self, evid, data):
+		#
+		## Stores data, the XML of event evid as bytes, and returns
+		## the name of the shard it went to
+		old = self.locate(evid)
+		shard = self.current()
+
+		data = member(evid, data)
+		offset = self.append(shard, data)
+
+		with self.db:
+			self.db.execute("INSERT OR REPLACE INTO members VALUES (?, ?, ?, ?)", (evid, shard, offset, len(data)))
+
+		if old is not None and old[0] != shard:
+			self.append(old[0], member(evid, b""))
+
+		return shard
+
+	def remove(self, evid):
+		old = self.locate(evid)
+		if old is None: return
+
+		with self.db:
+			self.db.execute("DELETE FROM members WHERE id = ?", (evid,))
+		self.append(old[0], member(evid, b""))
+
+	def compact(self):
+		#
+		## Returns the number of bytes freed
+		freed = 0
+		for filename in self.shards():
+			shard = os.path.basename(filename)
+			rows = self.db.execute("SELECT id, offset, length FROM members WHERE shard = ? ORDER BY offset", (shard,)).fetchall()
+			size = os.path.getsize(filename)
+			if sum([ length for (evid, offset, length) in rows ]) == size: continue
+
+			if not rows:
+				os.remove(filename)
+				freed += size
+				continue
+
+			tmp = "%s.tmp" % filename
+			moved = [ ]
+			with open(filename, "rb") as source:
+				with open(tmp, "wb") as target:
+					for (evid, offset, length) in rows:
+						source.seek(offset)
+						moved.append((target.tell(), evid))
+						target.write(source.read(length))
+
+			#
+			## The shard is replaced before the index is committed
+			with self.db:
+				self.db.executemany("UPDATE members SET offset = ? WHERE id = ?", moved)
+				os.rename(tmp, filename)
+
+			freed += size - os.path.getsize(filename)
+
+		return freed
+
+	def close(self):
+		self.db.close()
+
+'''
+Shard Reader
+	Yields (id, xml) for every event of a shard in file order, each
+	read with one seek into the shard.
+'''
+def members(filename):
+	#
+	## The index is only queried, archives on read only storage work
+	db = sqlite3.connect(os.path.join(os.path.dirname(filename), INDEX), timeout = 60.0)
+	try:
+		rows = db.execute("SELECT id, offset, length FROM members WHERE shard = ? ORDER BY offset",
+						  (os.path.basename(filename),)).fetchall()
+	finally:
+		db.close()
+
+	with open(filename, "rb") as fio:
+		for (evid, offset, length) in rows:
+			fio.seek(offset)
+			yield (evid, zlib.decompress(fio.read(length), 16 + zlib.MAX_WBITS))
+
+def expand(names):
+	#
+	## Archive directories are replaced by their shards
+	for name in names:
+		if not isarchive(name):
+			yield name
+			continue
+		for shard in shards(name):
+			yield shard
+
+def eventid(data):
+	#
+	## The publicID of the first event in the XML data, None when it
+	## holds no event
+	found = [ ]
+	depth = [ 0 ]
+
+	def start(name, attributes):
+		depth[0] += 1
+		name = name.rpartition("}")[2]
+		if depth[0] == 2 and name != "EventParameters":
+			raise StopIteration
+		if depth[0] == 3 and name == "event":
+			found.append(attributes.get("publicID"))
+			raise StopIteration
+
+	def end(name):
+		depth[0] -= 1
+
+	parser = expat.ParserCreate(namespace_separator = "}")
+	parser.StartElementHandler = start
+	parser.EndElementHandler = end
+	try:
+		parser.Parse(data, True)
+	except StopIteration:
+		pass
+
+	return found[0] if found else None
+
+def make_cmdline_parser():
+	# Create the parser
+	#
+	parser = OptionParser(usage="%prog [options] <archive> [event files or directories to add]", version="1.0", add_help_option = True)
+
+	parser.add_option("--shard-size", type="float", dest="shardsize", help="Size in MB a shard is filled to before the next one is started", default=SHARDSIZE / 1024.0 / 1024.0)
+	parser.add_option("--get", dest="get", help="Write the XML of the event with this publicID to stdout", default=None)
+	parser.add_option("--list", action="store_true", dest="list", help="List the publicIDs of the events in the archive", default=False)
+	parser.add_option("--compact", action="store_true", dest="compact", help="Drop the replaced and removed events from the shards, nothing else may write to the archive meanwhile", default=False)
+
+	return parser
+
+if __name__ == "__main__":
+	parser = make_cmdline_parser()
+	(options, args) = parser.parse_args()
+
+	if not args:
+		parser.error("no archive given")
+
+	try:
+		archive = Archive(args[0], int(options.shardsize * 1024 * 1024))
+	except Exception as e:
+		print("Cannot open archive '%s'\n %s" % (args[0], str(e)), file = sys.stderr)
+		sys.exit(1)
+
+	#
+	## Files are added under the publicID of their event, as sc3dump.py
+	## adds them, a file of several events under the first one. Other
+	## dumps like the inventory are left out
+	n = 0
+	for name in args[1:]:
+		files = [ name ]
+		if os.path.isdir(name):
+			files = [ ]
+			for (directory, subdirectories, names) in os.walk(name):
+				subdirectories.sort()
+				files.extend([ os.path.join(directory, f) for f in sorted(names) if f.endswith(".xml") ])
+
+		for filename in files:
+			try:
+				with open(filename, "rb") as fio:
+					data = fio.read()
+				evid = eventid(data)
+				if evid is None:
+					print("File '%s' holds no event, skipping." % filename, file = sys.stderr)
+					continue
+				archive.add(evid, data)
+			except (IOError, OSError, expat.ExpatError) as e:
+				print("Cannot add '%s'\n %s" % (filename, str(e)), file = sys.stderr)
+				continue
+			n += 1
+
+	if n:
+		print("Added %d events to archive '%s'." % (n, args[0]), file = sys.stderr)
+
+	if options.compact:
+		try:
+			freed = archive.compact()
+		except (IOError, OSError, sqlite3.Error) as e:
+			print("Cannot compact archive '%s'\n %s" % (args[0], str(e)), file = sys.stderr)
+			sys.exit(1)
+		print("Compacted archive '%s', %d bytes freed." % (args[0], freed), file = sys.stderr)
+
+	if options.list:
+		for evid in archive.ids():
+			print(evid)
+
+	status = 0
+	if options.get:
+		data = archive.read(options.get)
+		if data is None:
+			print("Event %s is not in archive '%s'." % (options.get, args[0]), file = sys.stderr)
+			status = 1
+		else:
+			getattr(sys.stdout, "buffer", sys.stdout).write(data)
+
+	archive.close()
+	sys.exit(status)
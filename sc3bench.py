@@ -0,0 +1,484 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#                                                                              #
+#   Synthetic catalog benchmark for the sc3tools converters                    #
+#   Copyright (C) 2026  Marcelo Belentani de Bianchi                           #
+#                                                                              #
+#   This program is free software; you can redistribute it and/or modify       #
+#   it under the terms of the GNU General Public License as published by       #
+#   the Free Software Foundation; either version 2 of the License, or          #
+#   (at your option) any later version.                                        #
+#                                                                              #
+#   This program is distributed in the hope that it will be useful,            #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#   GNU General Public License for more details.                               #
+#                                                                              #
+#   You should have received a copy of the GNU General Public License along    #
+#   with this program; if not, write to the Free Software Foundation, Inc.,    #
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.                #
+#                                                                              #
+#### 2026-10-18 ################################################################
+#
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import datetime
+import tempfile
+import contextlib
+import subprocess
+from optparse import OptionParser
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCHEMA = "http://geofon.gfz-potsdam.de/ns/seiscomp3-schema/0.7"
+
+'''
+Tools
+	The interpreter each converter is written for and the stages
+	timed inside of it.
+'''
+TOOLS = {
+	'ev2kml': { 'python': 3, 'stages': ( 'parse', 'filter', 'write' ) },
+	'st2kml': { 'python': 3, 'stages': ( 'parse', 'filter', 'write' ) },
+	'sc32ph': { 'python': 2, 'stages': ( 'parse', 'inventory', 'stations', 'write', 'dtct' ) },
+}
+
+'''
+Catalog Generator
+	Writes a synthetic Inventory and EventParameters catalog into
+	workdir, every station has the given number of epochs and three
+	components on two locations. Events pick randomly chosen
+	stations with P and S phases. The same seed always gives the
+	same catalog. Returns the catalog description, also saved as
+	catalog.json in workdir.
+'''
+def timestring(t):
+	return t.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+def generate(workdir, events = 2000, picks = 20, networks = 4, stations = 25, epochs = 2, perfile = 1, seed = 1):
+	rng = random.Random(seed)
+
+	first = datetime.datetime(2000, 1, 1)
+	last = datetime.datetime(2026, 1, 1)
+	span = (last - first).total_seconds()
+
+	if not os.path.isdir(workdir):
+		os.makedirs(workdir)
+
+	#
+	## Inventory
+	codes = [ ]
+	nstreams = 0
+	inventory = os.path.join(workdir, "inventory.xml")
+	with open(inventory, "w") as fio:
+		fio.write('<?xml version="1.0" encoding="UTF-8"?>\n<seiscomp xmlns="%s" version="0.7">\n<Inventory>\n' % SCHEMA)
+		for n in range(networks):
+			net = "N%d" % n if networks <= 10 else "%02d" % n
+			fio.write('<network publicID="Network/%s" code="%s"><start>%s</start><description>Network %s</description>\n' % (net, net, timestring(first), net))
+			for s in range(stations):
+				sta = "S%03d" % s
+				lat = rng.uniform(-30.0, -10.0)
+				lon = rng.uniform(-60.0, -40.0)
+				codes.append((net, sta))
+				for k in range(epochs):
+					start = timestring(first + datetime.timedelta(seconds = span * k / epochs))
+					end = "" if k == epochs - 1 else "<end>%s</end>" % timestring(first + datetime.timedelta(seconds = span * (k + 1) / epochs))
+					fio.write('<station publicID="Station/%s/%s/%d" code="%s"><start>%s</start>%s<description>Station %s</description>'
+							  '<latitude>%f</latitude><longitude>%f</longitude><elevation>%f</elevation><remark><content>S;STS-2;Q330</content></remark>\n' %
+							  (net, sta, k, sta, start, end, sta, lat, lon, rng.uniform(0.0, 1500.0)))
+					for loc in ("", "00"):
+						fio.write('<sensorLocation publicID="SensorLocation/%s/%s/%d/%s" code="%s"><start>%s</start>%s<latitude>%f</latitude><longitude>%f</longitude><elevation>0</elevation>\n' %
+								  (net, sta, k, loc, loc, start, end, lat, lon))
+						for cha in ("HHZ", "HHN", "HHE"):
+							fio.write('<stream code="%s" datalogger="Datalogger" sensor="Sensor"><start>%s</start>%s<depth>%f</depth></stream>\n' % (cha, start, end, rng.uniform(0.0, 5.0)))
+							nstreams += 1
+						fio.write('</sensorLocation>\n')
+					fio.write('</station>\n')
+			fio.write('</network>\n')
+		fio.write('</Inventory>\n</seiscomp>\n')
+
+	#
+	## Events, perfile events to an EventParameters document
+	files = [ ]
+	npicks = 0
+	for i in range(events):
+		if i % perfile == 0:
+			if files: closeevents(fio)
+			files.append(os.path.join(workdir, "events%06d.xml" % len(files)))
+			fio = open(files[-1], "w")
+			fio.write('<?xml version="1.0" encoding="UTF-8"?>\n<seiscomp xmlns="%s" version="0.7">\n<EventParameters publicID="EventParameters">\n' % SCHEMA)
+
+		t0 = first + datetime.timedelta(seconds = rng.uniform(0, span))
+		t0 = t0.replace(microsecond = rng.randrange(0, 1000000))
+
+		nsta = min(len(codes), (picks + 1) // 2)
+		arrivals = [ ]
+		for (j, (net, sta)) in enumerate(rng.sample(codes, nsta)):
+			for phase in ("P", "S"):
+				if len(arrivals) >= picks: break
+				if phase == "S" and j >= picks - nsta: continue
+				tt = rng.uniform(5.0, 100.0) * (1.0 if phase == "P" else 1.73)
+				pick = "Pick/%d/%d/%s" % (i, j, phase)
+				fio.write('<pick publicID="%s"><time><value>%s</value></time><waveformID networkCode="%s" stationCode="%s" locationCode="%s" channelCode="%s"/><phaseHint>%s</phaseHint></pick>\n' %
+						  (pick, timestring(t0 + datetime.timedelta(seconds = tt)), net, sta, rng.choice(("", "00")), "HHZ" if phase == "P" else "HHN", phase))
+				arrivals.append('<arrival><pickID>%s</pickID><phase>%s</phase><weight>%s</weight></arrival>' % (pick, phase, rng.choice(("1", "0.5", "1"))))
+
+		npicks += len(arrivals)
+		fio.write('<origin publicID="Origin/%d"><time><value>%s</value></time><latitude><value>%f</value><uncertainty>1.5</uncertainty></latitude>'
+				  '<longitude><value>%f</value><uncertainty>2.0</uncertainty></longitude><depth><value>%f</value><uncertainty>3.0</uncertainty></depth>'
+				  '<quality><standardError>0.4</standardError></quality>\n%s\n'
+				  '<magnitude publicID="Magnitude/%d"><magnitude><value>%f</value></magnitude><type>MLv</type></magnitude></origin>\n' %
+				  (i, timestring(t0), rng.uniform(-30.0, -10.0), rng.uniform(-60.0, -40.0), rng.uniform(0.0, 700.0), "\n".join(arrivals), i, rng.uniform(0.5, 6.0)))
+		fio.write('<event publicID="Event/%d"><preferredOriginID>Origin/%d</preferredOriginID><preferredMagnitudeID>Magnitude/%d</preferredMagnitudeID>'
+				  '<description><text>Region %d</text><type>region name</type></description></event>\n' % (i, i, i, i % 50))
+
+	if files: closeevents(fio)
+
+	catalog = {
+		'inventory': inventory,
+		'files': files,
+		'events': events,
+		'picks': npicks,
+		'stations': len(codes) * epochs,
+		'streams': nstreams,
+		'config': { 'events': events, 'picks': picks, 'networks': networks, 'stations': stations,
+					'epochs': epochs, 'perfile': perfile, 'seed': seed },
+	}
+
+	with open(os.path.join(workdir, "catalog.json"), "w") as fio:
+		json.dump(catalog, fio, indent = 1, sort_keys = True)
+
+	return catalog
+
+def closeevents(fio):
+	fio.write('</EventParameters>\n</seiscomp>\n')
+	fio.close()
+
+'''
+Stage Timer
+	Collects the wall time of named stages
+'''
+class Stages(object):
+	def __init__(self):
+		self.seconds = { }
+
+	@contextlib.contextmanager
+	def stage(self, name):
+		start = time.time()
+		yield
+		self.seconds[name] = self.seconds.get(name, 0.0) + time.time() - start
+
+'''
+Stage Runners
+	Run inside a child process with the interpreter of the tool,
+	they import the converter and time its stages one after the
+	other on the catalog. Output goes to /dev/null.
+'''
+def stagesev2kml(catalog, reader, stages, sink):
+	import ev2kml
+
+	(options, args) = ev2kml.make_cmdline_parser().parse_args([])
+	options.reader = reader
+
+	with stages.stage('parse'):
+		events = [ data for f in catalog['files'] for data in ev2kml.datafromxml(f, None, reader) ]
+
+	with stages.stage('filter'):
+		events = [ data for data in map(lambda data: ev2kml.selectevent(options, data), events) if data is not None ]
+
+	with stages.stage('write'):
+		styler = ev2kml.StyleFactory()
+		style = styler.basicstyle()
+		ev2kml.openKML(sink, options, styler)
+		for data in events:
+			ev2kml.ptKML(sink, options, data['time'], data['lon'], data['lat'], data['dep'],
+						 data['mag'], data['magt'], data['desc'], data['arc'], style)
+		ev2kml.closeKML(sink)
+
+def stagesst2kml(catalog, reader, stages, sink):
+	import st2kml
+
+	(options, args) = st2kml.make_cmdline_parser().parse_args([])
+	options.reader = reader
+
+	with stages.stage('parse'):
+		stations = list(st2kml.datafromxml(catalog['inventory'], reader))
+
+	with stages.stage('filter'):
+		styler = st2kml.StyleFactory()
+		records = { 'true': { }, 'false': { } }
+		for sta in stations:
+			st2kml.addstation(records, *st2kml.stationdata(sta, styler))
+
+	with stages.stage('write'):
+		st2kml.writeKML(sink, options, styler, records)
+
+def stagessc32ph(catalog, reader, stages, sink):
+	import sc32ph
+
+	with stages.stage('parse'):
+		events = [ ev for f in catalog['files'] for ev in sc32ph.datafromxml(f, None, reader) ]
+
+	with stages.stage('inventory'):
+		station = sc32ph.Stations(catalog['inventory'], reader)
+
+	with stages.stage('stations'):
+		for ev in events:
+			station.selectbye(ev)
+
+	with stages.stage('write'):
+		for (evid, ev) in enumerate(events):
+			ev.write(sink, evid + 1)
+		station.write(sink)
+
+	if sc32ph.numpy is None: return
+
+	with stages.stage('dtct'):
+		(options, args) = sc32ph.make_cmdline_parser().parse_args([])
+		dtct = sc32ph.DifferentialTimes(options.maxsep, options.maxngh, options.minlnk, options.maxobs, options.maxdist)
+		for (evid, ev) in enumerate(events):
+			dtct.add(ev, evid + 1)
+		dtct.write(sink, station.selection)
+
+def runstages(tool, workdir, reader):
+	with open(os.path.join(workdir, "catalog.json")) as fio:
+		catalog = json.load(fio)
+
+	stages = Stages()
+	sink = open(os.devnull, "w")
+	try:
+		globals()["stages%s" % tool](catalog, reader, stages, sink)
+	finally:
+		sink.close()
+
+	#
+	## The parent reads the result from stdout
+	print(json.dumps(stages.seconds))
+
+'''
+Tool Runners
+	Run a command and return its exit status, wall time, peak
+	resident memory in bytes, standard output and the tail of its
+	standard error.
+'''
+def spawn(command, capture = False):
+	errors = tempfile.TemporaryFile()
+	devnull = open(os.devnull, "w")
+
+	start = time.time()
+	process = subprocess.Popen(command, stdout = subprocess.PIPE if capture else devnull, stderr = errors, cwd = HERE)
+	output = process.stdout.read() if capture else None
+	(pid, status, usage) = os.wait4(process.pid, 0)
+	wall = time.time() - start
+	process.returncode = status
+
+	errors.seek(0, os.SEEK_END)
+	errors.seek(max(0, errors.tell() - 2000))
+	tail = errors.read().decode("utf-8", "replace")
+	errors.close()
+	devnull.close()
+
+	#
+	## ru_maxrss is in kilobytes on Linux
+	return (status, wall, usage.ru_maxrss * 1024, output, tail)
+
+def toolcommand(tool, catalog, reader, workdir):
+	script = os.path.join(HERE, "%s.py" % tool)
+
+	if tool == "ev2kml":
+		return [ script, "--reader", reader ] + catalog['files']
+
+	if tool == "st2kml":
+		return [ script, "--reader", reader, "-o", os.devnull, catalog['inventory'] ]
+
+	return [ script, "--reader", reader, "--inventory", catalog['inventory'],
+			 "--events", os.path.join(workdir, "bench.pha"), "--stations", os.path.join(workdir, "bench.sta") ] + catalog['files']
+
+def benchmark(tool, catalog, options):
+	python = options.python2 if TOOLS[tool]['python'] == 2 else options.python3
+
+	result = { 'stages': { }, 'wall': None, 'rss': None, 'stagerss': None }
+
+	for n in range(options.repeat):
+		(status, wall, rss, output, tail) = spawn([ python, os.path.abspath(__file__), "--stages", tool,
+												   "--workdir", options.workdir, "--reader", options.reader ], capture = True)
+		if status != 0:
+			raise Exception("Stages of %s failed:\n%s" % (tool, tail))
+
+		for (stage, seconds) in json.loads(output.decode("utf-8").strip().splitlines()[-1]).items():
+			result['stages'][stage] = min(seconds, result['stages'].get(stage, seconds))
+		result['stagerss'] = min(rss, result['stagerss'] or rss)
+
+		(status, wall, rss, output, tail) = spawn([ python ] + toolcommand(tool, catalog, options.reader, options.workdir))
+		if status != 0:
+			raise Exception("%s failed:\n%s" % (tool, tail))
+
+		result['wall'] = min(wall, result['wall'] or wall)
+		result['rss'] = min(rss, result['rss'] or rss)
+
+	#
+	## Throughput of the whole tool
+	if tool == "st2kml":
+		result['stations/s'] = catalog['stations'] / result['wall']
+		result['streams/s'] = catalog['streams'] / result['wall']
+	else:
+		result['events/s'] = catalog['events'] / result['wall']
+		result['picks/s'] = catalog['picks'] / result['wall']
+
+	return result
+
+'''
+Report
+'''
+def report(catalog, results, openfile):
+	print("Catalog: %d events, %d picks in %d files, %d station epochs with %d streams" %
+		  (catalog['events'], catalog['picks'], len(catalog['files']), catalog['stations'], catalog['streams']), file = openfile)
+	print("", file = openfile)
+	print("%-8s %-10s %10s" % ("tool", "stage", "seconds"), file = openfile)
+
+	for tool in sorted(results):
+		result = results[tool]
+		for stage in TOOLS[tool]['stages']:
+			if stage in result['stages']:
+				print("%-8s %-10s %10.3f" % (tool, stage, result['stages'][stage]), file = openfile)
+
+		rates = [ "%.0f %s" % (result[k], k) for k in ('events/s', 'picks/s', 'stations/s', 'streams/s') if k in result ]
+		print("%-8s %-10s %10.3f   %s, peak %.1f MB (stages %.1f MB)" % (tool, "total", result['wall'], ", ".join(rates),
+																		  result['rss'] / 1048576.0, result['stagerss'] / 1048576.0), file = openfile)
+
+'''
+Baseline Comparison
+	Returns the list of regressions of results against a baseline,
+	times or memory that grew by more than tolerance (fraction).
+	Differences under minimum seconds are taken as noise.
+'''
+def compare(baseline, results, tolerance, minimum = 0.01):
+	regressions = [ ]
+
+	for tool in sorted(results):
+		if tool not in baseline: continue
+		(old, new) = (baseline[tool], results[tool])
+
+		pairs = [ (stage, old['stages'][stage], new['stages'][stage], True) for stage in new['stages'] if stage in old['stages'] ]
+		pairs.append(("total", old['wall'], new['wall'], True))
+		pairs.append(("peak rss", old['rss'], new['rss'], False))
+
+		for (name, a, b, seconds) in pairs:
+			if seconds and b - a < minimum: continue
+			if b > a * (1.0 + tolerance):
+				regressions.append((tool, name, a, b))
+
+	return regressions
+
+def make_cmdline_parser():
+	# Create the parser
+	#
+	parser = OptionParser(usage="%prog [options]", version="1.0", add_help_option = True)
+
+	parser.add_option("--events", type="int", dest="events", help="Number of synthetic events", default=2000)
+	parser.add_option("--picks", type="int", dest="picks", help="Number of arrivals of each event", default=20)
+	parser.add_option("--networks", type="int", dest="networks", help="Number of networks in the inventory", default=4)
+	parser.add_option("--stations", type="int", dest="stations", help="Number of stations of each network", default=25)
+	parser.add_option("--epochs", type="int", dest="epochs", help="Number of epochs of each station", default=2)
+	parser.add_option("--per-file", type="int", dest="perfile", help="Number of events written to each EventParameters file", default=1)
+	parser.add_option("--seed", type="int", dest="seed", help="Random seed of the catalog", default=1)
+
+	parser.add_option("--tools", type="string", dest="tools", help="Tools to benchmark (%s)" % ",".join(sorted(TOOLS)), default=",".join(sorted(TOOLS)))
+	parser.add_option("--reader", type="choice", choices=("seiscomp", "stream"), dest="reader", help="XML reader given to the tools (seiscomp/stream)", default="stream")
+	parser.add_option("--repeat", type="int", dest="repeat", help="Number of runs of each tool, the best one is reported", default=3)
+	parser.add_option("--python2", type="string", dest="python2", help="Interpreter for the Python 2 tools", default="python2")
+	parser.add_option("--python3", type="string", dest="python3", help="Interpreter for the Python 3 tools", default="python3")
+
+	parser.add_option("--workdir", type="string", dest="workdir", help="Directory for the catalog, a temporary one is used and removed by default", default=None)
+	parser.add_option("--keep", action="store_true", dest="keep", help="Reuse the catalog in --workdir when it has the same configuration", default=False)
+	parser.add_option("--save", type="string", dest="save", help="Save the results as a JSON baseline", default=None)
+	parser.add_option("--baseline", type="string", dest="baseline", help="Compare the results with a JSON baseline, exit with 2 on a regression", default=None)
+	parser.add_option("--tolerance", type="float", dest="tolerance", help="Allowed slow down against the baseline in percent", default=10.0)
+
+	parser.add_option("--stages", type="choice", choices=sorted(TOOLS), dest="stages", help="Internal, time the stages of one tool on the catalog in --workdir", default=None)
+
+	return parser
+
+if __name__ == "__main__":
+	parser = make_cmdline_parser()
+	(options, args) = parser.parse_args()
+
+	if options.stages:
+		runstages(options.stages, options.workdir, options.reader)
+		sys.exit(0)
+
+	tools = options.tools.split(",")
+	for tool in tools:
+		if tool not in TOOLS:
+			parser.error("unknown tool '%s'" % tool)
+
+	baseline = None
+	if options.baseline:
+		try:
+			with open(options.baseline) as fio:
+				baseline = json.load(fio)
+		except (IOError, ValueError) as e:
+			print("Cannot read baseline '%s'\n %s" % (options.baseline, str(e)), file = sys.stderr)
+			sys.exit(1)
+
+	temporary = options.workdir is None
+	if temporary:
+		options.workdir = tempfile.mkdtemp(prefix = "sc3bench")
+	options.workdir = os.path.abspath(options.workdir)
+
+	config = { 'events': options.events, 'picks': options.picks, 'networks': options.networks, 'stations': options.stations,
+			   'epochs': options.epochs, 'perfile': options.perfile, 'seed': options.seed }
+
+	try:
+		catalog = None
+		if options.keep and os.path.exists(os.path.join(options.workdir, "catalog.json")):
+			with open(os.path.join(options.workdir, "catalog.json")) as fio:
+				catalog = json.load(fio)
+			if catalog['config'] != config:
+				catalog = None
+
+		if catalog is None:
+			print("Generating catalog in '%s'" % options.workdir, file = sys.stderr)
+			catalog = generate(options.workdir, **config)
+
+		results = { }
+		for tool in tools:
+			print("Running %s" % tool, file = sys.stderr)
+			try:
+				results[tool] = benchmark(tool, catalog, options)
+			except Exception as e:
+				print(str(e), file = sys.stderr)
+				sys.exit(1)
+	finally:
+		if temporary:
+			shutil.rmtree(options.workdir, True)
+
+	report(catalog, results, sys.stdout)
+
+	if options.save:
+		with open(options.save, "w") as fio:
+			json.dump({ 'config': config, 'results': results }, fio, indent = 1, sort_keys = True)
+
+	if baseline is None:
+		sys.exit(0)
+
+	if baseline.get('config') != config:
+		print("\nWarning, the baseline was taken on a different catalog configuration.", file = sys.stderr)
+
+	regressions = compare(baseline.get('results', { }), results, options.tolerance / 100.0)
+
+	print("", file = sys.stdout)
+	if not regressions:
+		print("No regressions against '%s'" % options.baseline, file = sys.stdout)
+		sys.exit(0)
+
+	for (tool, name, a, b) in regressions:
+		print("Regression %-8s %-10s %10.3f -> %10.3f (%+.0f%%)" % (tool, name, a, b, 100.0 * (b - a) / a), file = sys.stdout)
+
+	sys.exit(2)
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#                                                                              #
+#   Parsed event cache shared by the sc3tools converters                       #
+#   Copyright (C) 2026  Marcelo Belentani de Bianchi                           #
+#                                                                              #
+#   This program is free software; you can redistribute it and/or modify       #
+#   it under the terms of the GNU General Public License as published by       #
+#   the Free Software Foundation; either version 2 of the License, or          #
+#   (at your option) any later version.                                        #
+#                                                                              #
+#   This program is distributed in the hope that it will be useful,            #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#   GNU General Public License for more details.                               #
+#                                                                              #
+#   You should have received a copy of the GNU General Public License along    #
+#   with this program; if not, write to the Free Software Foundation, Inc.,    #
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.                #
+#                                                                              #
+#### 2026-10-18 ################################################################
+#
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+import tempfile
+
+'''
+File Hash
+'''
+def filehash(filename):
+	h = hashlib.sha1()
+	with open(filename, "rb") as fio:
+		while True:
+			chunk = fio.read(1 << 20)
+			if not chunk: break
+			h.update(chunk)
+	return h.hexdigest()
+
+'''
+Spool
+	Collects the records of a file while it is read in a temporary
+	file, one JSON line each, so they are not held in memory until
+	the file is complete and can be stored.
+'''
+class Spool(object):
+	def __init__(self):
+		self.fileobj = tempfile.TemporaryFile()
+		self.length = 0
+
+	def add(self, record):
+		line = json.dumps(record, separators = (',', ':')).encode("utf-8")
+		self.fileobj.write(line + b"\n")
+		self.length += len(line)
+
+	def payloads(self):
+		self.fileobj.seek(0)
+		for line in self.fileobj:
+			yield line.rstrip(b"\n").decode("utf-8")
+
+	def close(self):
+		self.fileobj.close()
+
+'''
+Event Cache
+	Keeps the records extracted from event files in a SQLite file,
+	one entry per file with a row for the record of each of its
+	events. An entry is valid while the path, size and mtime of the
+	file match, when they do not the content hash is checked so that
+	a touched, copied or renamed file is still found. Entries are
+	evicted least recently used first when the cache grows over
+	maxsize bytes.
+
+	Records are read back one row at a time and stored from a Spool,
+	a file is never held in memory whole.
+
+	Pool workers get their own connection the first time they use
+	the cache, the same object can be handed to them.
+'''
+class EventCache(object):
+	VERSION = 3
+
+	def __init__(self, filename, maxsize = 1024 * 1024 * 1024):
+		self.filename = filename
+		self.maxsize = maxsize
+		self._db = None
+		self._pid = None
+
+		#
+		## Create or upgrade the file before any worker opens it
+		self.db()
+
+	def __getstate__(self):
+		return { 'filename': self.filename, 'maxsize': self.maxsize }
+
+	def __setstate__(self, state):
+		self.filename = state['filename']
+		self.maxsize = state['maxsize']
+		self._db = None
+		self._pid = None
+
+	def db(self):
+		if self._db is not None and self._pid == os.getpid():
+			return self._db
+
+		self._db = sqlite3.connect(self.filename, timeout = 60.0)
+		self._pid = os.getpid()
+		self._db.execute("PRAGMA journal_mode=WAL")
+		self._db.execute("PRAGMA synchronous=NORMAL")
+		if self._db.execute("PRAGMA user_version").fetchone()[0] != self.VERSION:
+			self._db.execute("DROP TABLE IF EXISTS entries")
+			self._db.execute("DROP TABLE IF EXISTS records")
+			self._db.execute("PRAGMA user_version = %d" % self.VERSION)
+		self._db.execute("CREATE TABLE IF NOT EXISTS entries (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, hash TEXT, used REAL, length INTEGER)")
+		self._db.execute("CREATE TABLE IF NOT EXISTS records (path TEXT, seq INTEGER, payload TEXT, PRIMARY KEY (path, seq))")
+		self._db.execute("CREATE INDEX IF NOT EXISTS entries_hash ON entries (hash)")
+		self._db.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries (used)")
+		self._db.commit()
+		return self._db
+
+	def records(self, path):
+		for (payload,) in self.db().execute("SELECT payload FROM records WHERE path = ? ORDER BY seq", (path,)):
+			yield json.loads(payload)
+
+	def get(self, filename):
+		#
+		## An iterator over the records of filename, None when there
+		## is no valid entry for it
+		try:
+			st = os.stat(filename)
+		except OSError:
+			return None
+
+		path = os.path.abspath(filename)
+		db = self.db()
+
+		row = db.execute("SELECT size, mtime FROM entries WHERE path = ?", (path,)).fetchone()
+		if row and row[0] == st.st_size and row[1] == st.st_mtime:
+			with db:
+				db.execute("UPDATE entries SET used = ? WHERE path = ?", (time.time(), path))
+			return self.records(path)
+
+		#
+		## Stat changed or unknown path, look for the same content
+		digest = filehash(filename)
+		row = db.execute("SELECT path, length FROM entries WHERE hash = ? LIMIT 1", (digest,)).fetchone()
+		if row is None:
+			return None
+
+		with db:
+			if row[0] != path:
+				db.execute("DELETE FROM records WHERE path = ?", (path,))
+				db.execute("INSERT INTO records SELECT ?, seq, payload FROM records WHERE path = ?", (path, row[0]))
+			db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+					   (path, st.st_size, st.st_mtime, digest, time.time(), row[1]))
+
+		return self.records(path)
+
+	def put(self, filename, spool):
+		try:
+			st = os.stat(filename)
+			digest = filehash(filename)
+		except (IOError, OSError):
+			return
+
+		path = os.path.abspath(filename)
+
+		db = self.db()
+		with db:
+			db.execute("DELETE FROM records WHERE path = ?", (path,))
+			db.executemany("INSERT INTO records VALUES (?, ?, ?)",
+						   ((path, seq, payload) for (seq, payload) in enumerate(spool.payloads())))
+			db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+					   (path, st.st_size, st.st_mtime, digest, time.time(), spool.length))
+
+	def evict(self):
+		db = self.db()
+
+		total = db.execute("SELECT COALESCE(SUM(length), 0) FROM entries").fetchone()[0]
+		if total <= self.maxsize:
+			return 0
+
+		paths = [ ]
+		for (path, length) in db.execute("SELECT path, length FROM entries ORDER BY used"):
+			if total <= self.maxsize: break
+			paths.append((path,))
+			total -= length
+
+		with db:
+			db.executemany("DELETE FROM records WHERE path = ?", paths)
+			db.executemany("DELETE FROM entries WHERE path = ?", paths)
+
+		return len(paths)
+
+	def close(self):
+		if self._db is None or self._pid != os.getpid():
+			return
+
+		n = self.evict()
+		if n:
+			print(" Evicted %d entries from cache '%s'" % (n, self.filename), file = sys.stderr)
+
+		self._db.close()
+		self._db = None
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#                                                                              #
+#   SQLite catalog index shared by the sc3tools converters                     #
+#   Copyright (C) 2026  Marcelo Belentani de Bianchi                           #
+#                                                                              #
+#   This program is free software; you can redistribute it and/or modify       #
+#   it under the terms of the GNU General Public License as published by       #
+#   the Free Software Foundation; either version 2 of the License, or          #
+#   (at your option) any later version.                                        #
+#                                                                              #
+#   This program is distributed in the hope that it will be useful,            #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#   GNU General Public License for more details.                               #
+#                                                                              #
+#   You should have received a copy of the GNU General Public License along    #
+#   with this program; if not, write to the Free Software Foundation, Inc.,    #
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.                #
+#                                                                              #
+#### 2026-10-18 ################################################################
+#
+from __future__ import print_function
+import os
+import sys
+import sqlite3
+import functools
+from optparse import OptionParser
+import sc3pool
+import sc3reader
+import sc3archive
+
+'''
+Catalog Index
+	Keeps a summary of the preferred solution of every event of a
+	set of event files in a SQLite file, so the files holding the
+	events of interest can be found without parsing them all. The
+	events table has the columns
+
+		path    absolute path of the file holding the event
+		id      event publicID
+		time    origin time, epoch seconds
+		lat, lon, dep
+		mag     preferred magnitude value or NULL
+		magt    preferred magnitude type or NULL
+		arc     number of arrivals of the origin
+
+	and the files table the path, size and mtime of every file when
+	it was indexed. refresh() parses again only the files whose size
+	or mtime changed.
+'''
+BATCH = 1000
+
+class Catalog(object):
+	VERSION = 1
+
+	def __init__(self, filename):
+		self.filename = filename
+		self.db = sqlite3.connect(filename, timeout = 60.0)
+		self.db.execute("PRAGMA journal_mode=WAL")
+		self.db.execute("PRAGMA synchronous=NORMAL")
+		if self.db.execute("PRAGMA user_version").fetchone()[0] != self.VERSION:
+			self.db.execute("DROP TABLE IF EXISTS files")
+			self.db.execute("DROP TABLE IF EXISTS events")
+			self.db.execute("PRAGMA user_version = %d" % self.VERSION)
+		self.db.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL)")
+		self.db.execute("CREATE TABLE IF NOT EXISTS events (path TEXT, id TEXT, time REAL, lat REAL, lon REAL, dep REAL, mag REAL, magt TEXT, arc INTEGER)")
+		self.db.execute("CREATE INDEX IF NOT EXISTS events_path ON events (path)")
+		self.db.execute("CREATE INDEX IF NOT EXISTS events_time ON events (time)")
+		self.db.execute("CREATE INDEX IF NOT EXISTS events_mag ON events (mag)")
+		self.db.execute("CREATE INDEX IF NOT EXISTS events_dep ON events (dep)")
+		self.db.execute("CREATE INDEX IF NOT EXISTS events_place ON events (lat, lon)")
+		self.db.commit()
+
+	def paths(self):
+		return [ row[0] for row in self.db.execute("SELECT path FROM files ORDER BY path") ]
+
+	def refresh(self, filenames = None, reader = None, jobs = 1, timeout = None):
+		#
+		## Without filenames all the indexed files are checked and
+		## the ones that are gone dropped
+		known = dict([ (row[0], (row[1], row[2])) for row in self.db.execute("SELECT path, size, mtime FROM files") ])
+
+		removed = [ ]
+		if filenames is None:
+			filenames = sorted(known)
+
+		stale = [ ]
+		for filename in filenames:
+			path = os.path.abspath(filename)
+			try:
+				st = os.stat(path)
+			except OSError:
+				if path in known:
+					removed.append(path)
+				continue
+			if known.get(path) != (st.st_size, st.st_mtime):
+				stale.append((path, st.st_size, st.st_mtime))
+
+		with self.db:
+			for path in removed:
+				self.forget(path)
+
+		#
+		## Committed in batches, an interrupted refresh keeps what it did
+		function = functools.partial(summary, reader)
+		sizes = dict([ (path, (size, mtime)) for (path, size, mtime) in stale ])
+		updated = 0
+		for (path, rows) in sc3pool.orderedmap(function, [ path for (path, size, mtime) in stale ], jobs, timeout):
+			if rows is None:
+				print("File '%s' was not indexed." % path, file = sys.stderr)
+				continue
+
+			self.forget(path)
+			self.db.execute("INSERT INTO files VALUES (?, ?, ?)", (path,) + sizes[path])
+			self.db.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [ (path,) + row for row in rows ])
+			updated += 1
+			if updated % BATCH == 0:
+				self.db.commit()
+		self.db.commit()
+
+		return (updated, len(removed))
+
+	def forget(self, path):
+		self.db.execute("DELETE FROM files WHERE path = ?", (path,))
+		self.db.execute("DELETE FROM events WHERE path = ?", (path,))
+
+	def select(self, conditions = ()):
+		#
+		## conditions are (sql, parameters) pairs, all must hold.
+		## Returns the matching event ids of every file.
+		sql = "SELECT path, id FROM events"
+		parameters = [ ]
+		if conditions:
+			sql += " WHERE " + " AND ".join([ "(%s)" % condition for (condition, values) in conditions ])
+			for (condition, values) in conditions:
+				parameters.extend(values)
+
+		selected = { }
+		for (path, ID) in self.db.execute(sql, parameters):
+			selected.setdefault(path, set()).add(ID)
+		return selected
+
+	def count(self):
+		return (self.db.execute("SELECT COUNT(*) FROM files").fetchone()[0],
+				self.db.execute("SELECT COUNT(*) FROM events").fetchone()[0])
+
+	def close(self):
+		self.db.close()
+
+def summary(reader, filename):
+	rows = [ ]
+	for record in sc3reader.readevents(filename, None, reader):
+		rows.append((record['id'], record['time'], record['lat'], record['lon'], record['dep'],
+					 record['mag'], record['magt'], record['arc']))
+	return rows
+
+'''
+Catalog Query
+	What the converters call with their --catalog option. The files
+	given are indexed when needed and, without files, all the ones
+	in the catalog are used. Returns the files holding events that
+	match conditions, in the order given or by path, and the ids of
+	those events in every file.
+'''
+def select(filename, files, conditions = (), reader = None, jobs = 1, timeout = None):
+	catalog = Catalog(filename)
+	try:
+		(updated, removed) = catalog.refresh(files or None, reader, jobs, timeout)
+		if updated or removed:
+			print("Catalog '%s' updated %d and dropped %d files." % (filename, updated, removed), file = sys.stderr)
+
+		try:
+			selected = catalog.select(conditions)
+		except sqlite3.OperationalError as e:
+			raise ValueError("Bad catalog query, %s" % e)
+
+		if files:
+			paths = [ os.path.abspath(f) for f in files ]
+		else:
+			paths = catalog.paths()
+	finally:
+		catalog.close()
+
+	return ([ path for path in paths if path in selected ], selected)
+
+def eventfiles(names):
+	#
+	## Directories are searched for event files, archives give their shards
+	for name in names:
+		if sc3archive.isarchive(name):
+			for shard in sc3archive.shards(name):
+				yield shard
+			continue
+		if not os.path.isdir(name):
+			yield name
+			continue
+		for (directory, subdirectories, files) in os.walk(name):
+			subdirectories.sort()
+			for f in sorted(files):
+				if f.endswith(sc3reader.SUFFIXES) or sc3archive.isshard(os.path.join(directory, f)):
+					yield os.path.join(directory, f)
+
+def make_cmdline_parser():
+	# Create the parser
+	#
+	parser = OptionParser(usage="%prog [options] <catalog> [event files, archives or directories]", version="1.0", add_help_option = True)
+
+	parser.add_option("--reader", type="choice", choices=sc3reader.READERS, dest="reader", help="XML reader, seiscomp uses the SeisComP bindings and stream a lightweight parser (%s)" % "/".join(sc3reader.READERS), default=None)
+	parser.add_option("--jobs", type="int", dest="jobs", help="Number of worker processes used to parse the event files", default=1)
+	parser.add_option("--timeout", type="float", dest="timeout", help="Seconds a worker may spend on one event file before it is abandoned (with --jobs)", default=300.0)
+	parser.add_option("--where", dest="where", help="List the files with events matching this SQL condition on the columns id, time, lat, lon, dep, mag, magt and arc", default=None)
+
+	return parser
+
+if __name__ == "__main__":
+	parser = make_cmdline_parser()
+	(options, args) = parser.parse_args()
+
+	if not args:
+		parser.error("no catalog file given")
+
+	try:
+		options.reader = sc3reader.checkreader(options.reader)
+	except Exception as e:
+		print(str(e), file = sys.stderr)
+		sys.exit(1)
+
+	catalog = Catalog(args[0])
+	(updated, removed) = catalog.refresh(list(eventfiles(args[1:])) if len(args) > 1 else None,
+										 options.reader, options.jobs, options.timeout)
+	(files, events) = catalog.count()
+	print("Catalog '%s' updated %d and dropped %d files, it holds %d events in %d files." % (args[0], updated, removed, events, files), file = sys.stderr)
+
+	if options.where:
+		try:
+			selected = catalog.select([ (options.where, ()) ])
+		except sqlite3.OperationalError as e:
+			print("Bad catalog query, %s" % e, file = sys.stderr)
+			sys.exit(1)
+		for path in sorted(selected):
+			print(path)
+
+	catalog.close()
+	sys.exit(0)
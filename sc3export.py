@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#                                                                              #
+#   Single pass export of SeisComp3 events to KML, hypoDD and CSV              #
+#   Copyright (C) 2026  Marcelo Belentani de Bianchi                           #
+#                                                                              #
+#   This program is free software; you can redistribute it and/or modify       #
+#   it under the terms of the GNU General Public License as published by       #
+#   the Free Software Foundation; either version 2 of the License, or          #
+#   (at your option) any later version.                                        #
+#                                                                              #
+#   This program is distributed in the hope that it will be useful,            #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#   GNU General Public License for more details.                               #
+#                                                                              #
+#   You should have received a copy of the GNU General Public License along    #
+#   with this program; if not, write to the Free Software Foundation, Inc.,    #
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.                #
+#                                                                              #
+#### 2026-10-18 ################################################################
+#
+from __future__ import print_function
+import sys
+import csv
+import shlex
+import datetime
+import functools
+from optparse import OptionParser
+import sc3pool
+import sc3cache
+import sc3reader
+import sc3stats
+import sc3archive
+import ev2kml
+import sc32ph
+
+'''
+Sinks
+	Every event file is parsed once and the record of each event is
+	handed to all the sinks in turn. The KML and hypoDD sinks take
+	the options of ev2kml.py and sc32ph.py as one string, with the
+	same filters and outputs, but the events are read here so the
+	options choosing the input cannot be given to them.
+'''
+INPUT = ( "reader", "jobs", "timeout", "cache", "cachesize", "catalog", "db", "where", "watch", "stats", "profile" )
+
+def sinkoptions(name, parser, arguments):
+	(options, args) = parser.parse_args(shlex.split(arguments))
+
+	if args:
+		raise ValueError("The %s sink takes no event files, give them to sc3export.py." % name)
+
+	for option in INPUT:
+		if getattr(options, option, None) != parser.defaults.get(option):
+			raise ValueError("The events are read by sc3export.py, --%s cannot be given to the %s sink." % (option, name))
+
+	return options
+
+class KMLSink(object):
+	def __init__(self, arguments):
+		self.options = sinkoptions("kml", ev2kml.make_cmdline_parser(), arguments)
+		ev2kml.checkoptions(self.options)
+
+		try:
+			self.output = ev2kml.Output(self.options, ev2kml.StyleFactory())
+		except IOError as e:
+			raise IOError("Cannot open output file '%s'\n %s" % (self.options.output, str(e)))
+
+	def add(self, filename, record):
+		for data in ev2kml.datafromrecords([ record ]):
+			with sc3stats.stage("filter"):
+				data = ev2kml.selectevent(self.options, data)
+			if data is not None:
+				self.output.add(data)
+
+	def close(self):
+		self.output.close()
+
+class HypoDDSink(object):
+	def __init__(self, arguments, reader):
+		self.options = sinkoptions("hypodd", sc32ph.make_cmdline_parser(), arguments)
+		sc32ph.checkoptions(self.options)
+
+		state = None
+		try:
+			if self.options.state:
+				state = sc32ph.State(self.options.state, self.options.eventfile)
+		except Exception as e:
+			raise ValueError("Cannot load state file '%s'\n %s" % (self.options.state, str(e)))
+
+		with sc3stats.stage("inventory"):
+			station = sc32ph.Stations(self.options.inventory, reader)
+
+		self.output = sc32ph.Output(self.options, state, station)
+
+	def add(self, filename, record):
+		with sc3stats.stage("picks"):
+			ev = sc32ph.eventfromrecord(record, filename)
+		if ev is not None:
+			self.output.add(ev)
+
+	def close(self):
+		self.output.close()
+
+'''
+Catalog Sink
+	One row for every event with the values of its record, times
+	in ISO 8601 and missing values left empty.
+'''
+COLUMNS = ( "id", "time", "lat", "lon", "dep", "eh", "ez", "rms", "mag", "magt", "arc", "desc" )
+
+class CatalogSink(object):
+	def __init__(self, filename, delimiter):
+		try:
+			self.fileobj = sc3stats.Counted(open(filename, "w", newline = ""))
+		except IOError as e:
+			raise IOError("Cannot open catalog file '%s'\n %s" % (filename, str(e)))
+
+		self.writer = csv.writer(self.fileobj, delimiter = delimiter, lineterminator = "\n")
+		self.writer.writerow(COLUMNS)
+
+	def add(self, filename, record):
+		with sc3stats.stage("write"):
+			row = [ ]
+			for column in COLUMNS:
+				value = record.get(column)
+				if value is None:
+					value = ""
+				elif column == "time":
+					value = datetime.datetime.utcfromtimestamp(value).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+				row.append(value)
+			self.writer.writerow(row)
+
+	def close(self):
+		self.fileobj.close()
+
+'''
+Data Reader
+'''
+def readrecords(cache, reader, filename):
+	return sc3stats.timed("parse", sc3reader.readevents(filename, cache, reader))
+
+def make_cmdline_parser():
+	# Create the parser
+	#
+	parser = OptionParser(usage="%prog [options] <event files or archives>", version="1.0", add_help_option = True)
+
+	parser.add_option("--kml", action="append", dest="kml", help="Write KML as ev2kml.py does with the options in KML, given as one string, e.g. --kml \"-o events.kml -c\". Can be repeated", default=[])
+	parser.add_option("--hypodd", action="append", dest="hypodd", help="Write hypoDD files as sc32ph.py does with the options in HYPODD, given as one string, e.g. --hypodd \"--events phase.dat --stations station.dat\". Can be repeated", default=[])
+	parser.add_option("--csv", action="append", dest="csv", help="Write a comma separated catalog of the events to CSV. Can be repeated", default=[])
+	parser.add_option("--tsv", action="append", dest="tsv", help="Write a tab separated catalog of the events to TSV. Can be repeated", default=[])
+
+	parser.add_option("--reader", type="choice", choices=sc3reader.READERS, dest="reader", help="XML reader, seiscomp uses the SeisComP bindings and stream a lightweight parser (%s)" % "/".join(sc3reader.READERS), default=None)
+	parser.add_option("--jobs", type="int", dest="jobs", help="Number of worker processes used to parse the event files", default=1)
+	parser.add_option("--timeout", type="float", dest="timeout", help="Seconds a worker may spend on one event file before it is abandoned (with --jobs)", default=300.0)
+	parser.add_option("--cache", dest="cache", help="SQLite file used to keep the parsed events between runs", default=None)
+	parser.add_option("--cache-size", type="float", dest="cachesize", help="Maximum size of the event cache in MB", default=1024.0)
+	parser.add_option("--db", dest="db", help="Read the events from this SQLite database in the SeisComP schema instead of event files", default=None)
+
+	parser.add_option("--stats", dest="stats", help="Write a JSON summary of stage times, counters and warnings at exit to STATS (- for stderr)", default=None)
+	parser.add_option("--profile", dest="profile", help="Write a cProfile dump of the main process to PROFILE", default=None)
+
+	return parser
+
+if __name__ == "__main__":
+	parser = make_cmdline_parser()
+	(options, args) = parser.parse_args()
+
+	#
+	## Event archives are read shard by shard
+	args = list(sc3archive.expand(args))
+
+	if not (options.kml or options.hypodd or options.csv or options.tsv):
+		print("Nothing to do, please give at least one of --kml, --hypodd, --csv or --tsv.", file = sys.stderr)
+		sys.exit(1)
+
+	try:
+		options.reader = sc3reader.checkreader(options.reader)
+	except Exception as e:
+		print(str(e), file = sys.stderr)
+		sys.exit(1)
+
+	if options.db and args:
+		print("Events are read from the database %s, no event files can be given." % options.db, file = sys.stderr)
+		sys.exit(1)
+
+	sc3stats.setup("sc3export", options.stats, options.profile)
+
+	#
+	## Sinks, in the order of the options
+	sinks = [ ]
+	try:
+		for arguments in options.kml:
+			sinks.append(KMLSink(arguments))
+		for arguments in options.hypodd:
+			sinks.append(HypoDDSink(arguments, options.reader))
+		for filename in options.csv:
+			sinks.append(CatalogSink(filename, ","))
+		for filename in options.tsv:
+			sinks.append(CatalogSink(filename, "\t"))
+	except (IOError, ValueError) as e:
+		print(str(e), file = sys.stderr)
+		sys.exit(1)
+
+	#
+	## The database is read with one query
+	cache = None
+	if options.db:
+		try:
+			records = sc3reader.databaseevents(options.db)
+		except sc3reader.ReaderError as e:
+			print(str(e), file = sys.stderr)
+			sys.exit(1)
+		results = ((options.db, record) for record in records)
+	else:
+		if options.cache:
+			cache = sc3cache.EventCache(options.cache, int(options.cachesize * 1024 * 1024))
+		results = sc3pool.orderedchain(functools.partial(readrecords, cache, options.reader), args, options.jobs, options.timeout)
+
+	#
+	## Each event once through all the sinks
+	for (f, record) in results:
+		for sink in sinks:
+			sink.add(f, record)
+
+	if cache:
+		cache.close()
+
+	status = 0
+	for sink in sinks:
+		try:
+			sink.close()
+		except ValueError as e:
+			print(str(e), file = sys.stderr)
+			status = 1
+
+	sys.exit(status)
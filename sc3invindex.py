@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#                                                                              #
+#   Binary inventory index shared by the sc3tools converters                   #
+#   Copyright (C) 2026  Marcelo Belentani de Bianchi                           #
+#                                                                              #
+#   This program is free software; you can redistribute it and/or modify       #
+#   it under the terms of the GNU General Public License as published by       #
+#   the Free Software Foundation; either version 2 of the License, or          #
+#   (at your option) any later version.                                        #
+#                                                                              #
+#   This program is distributed in the hope that it will be useful,            #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#   GNU General Public License for more details.                               #
+#                                                                              #
+#   You should have received a copy of the GNU General Public License along    #
+#   with this program; if not, write to the Free Software Foundation, Inc.,    #
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.                #
+#                                                                              #
+#### 2026-10-18 ################################################################
+#
+from __future__ import print_function
+import os
+import sys
+import mmap
+import math
+import struct
+import binascii
+from optparse import OptionParser
+import sc3cache
+import sc3reader
+
+'''
+Index Layout
+	All values are little endian. The file starts with a header
+	holding the magic, the layout version, the sha1, size and mtime
+	of the inventory it was compiled from and the table sizes. It
+	is followed by the station table, the stream table and the
+	string table. Strings are given as offset and length in the
+	string table, a length of NONE is an unset string. Unset numbers
+	are stored as NaN. Every station points at its first stream and
+	holds the number of streams it has.
+'''
+MAGIC = b"SC3INVIX"
+VERSION = 1
+NONE = 0xFFFFFFFF
+
+HEADER = struct.Struct("<8sI20sqdIII")
+STATION = struct.Struct("<IIIIIIIIdddddII")
+STREAM = struct.Struct("<IIIIddd")
+
+def indexname(filename):
+	return "%s.idx" % filename
+
+def number(value):
+	return float("nan") if value is None else float(value)
+
+def unnumber(value):
+	return None if math.isnan(value) else value
+
+def decode(data):
+	value = data.decode("utf-8")
+	if str is bytes:
+		#
+		## Plain strings on Python 2 like the XML readers give
+		try:
+			return str(value)
+		except UnicodeEncodeError:
+			pass
+	return value
+
+'''
+String Table
+	Collects the distinct strings of the index
+'''
+class Strings(object):
+	def __init__(self):
+		self.data = [ ]
+		self.where = { }
+		self.size = 0
+
+	def add(self, value):
+		if value is None:
+			return (0, NONE)
+
+		if not isinstance(value, bytes):
+			value = value.encode("utf-8")
+
+		if value not in self.where:
+			self.where[value] = self.size
+			self.data.append(value)
+			self.size += len(value)
+
+		return (self.where[value], len(value))
+
+'''
+Index Writer
+	Compiles the inventory in filename into the index output,
+	returns the number of stations and streams written or None
+	when the inventory could not be read.
+'''
+def build(filename, output = None, reader = None):
+	if output is None:
+		output = indexname(filename)
+
+	st = os.stat(filename)
+	digest = binascii.unhexlify(sc3cache.filehash(filename))
+
+	inventory = sc3reader.readinventory(filename, reader)
+	if inventory is None:
+		return None
+
+	strings = Strings()
+	stations = [ ]
+	streams = [ ]
+	for sta in inventory:
+		first = len(streams)
+		for (loc, cha, start, end, depth) in sta['streams']:
+			streams.append(STREAM.pack(*(strings.add(loc) + strings.add(cha) +
+										 (number(start), number(end), number(depth)))))
+
+		stations.append(STATION.pack(*(strings.add(sta['net']) + strings.add(sta['sta']) +
+									   strings.add(sta['desc']) + strings.add(sta['remark']) +
+									   (number(sta['start']), number(sta['end']),
+										number(sta['lat']), number(sta['lon']), number(sta['elev']),
+										first, len(streams) - first))))
+
+	tmp = "%s.tmp" % output
+	with open(tmp, "wb") as fio:
+		fio.write(HEADER.pack(MAGIC, VERSION, digest, st.st_size, st.st_mtime,
+							  len(stations), len(streams), strings.size))
+		fio.write(b"".join(stations))
+		fio.write(b"".join(streams))
+		fio.write(b"".join(strings.data))
+	os.rename(tmp, output)
+
+	return (len(stations), len(streams))
+
+'''
+Index Reader
+	Maps an index file and decodes its stations on demand, it is
+	a sequence of the same station records readinventory returns.
+'''
+class InventoryIndex(object):
+	def __init__(self, filename):
+		self.filename = filename
+
+		with open(filename, "rb") as fio:
+			self.data = mmap.mmap(fio.fileno(), 0, access = mmap.ACCESS_READ)
+
+		if len(self.data) < HEADER.size:
+			raise ValueError("File '%s' is no inventory index" % filename)
+
+		(magic, version, self.digest, self.size, self.mtime,
+		 self.nstations, self.nstreams, nstrings) = HEADER.unpack_from(self.data, 0)
+
+		if magic != MAGIC:
+			raise ValueError("File '%s' is no inventory index" % filename)
+		if version != VERSION:
+			raise ValueError("Inventory index '%s' has version %d, expected %d" % (filename, version, VERSION))
+
+		self.stations = HEADER.size
+		self.streams = self.stations + self.nstations * STATION.size
+		self.strings = self.streams + self.nstreams * STREAM.size
+
+		if self.strings + nstrings != len(self.data):
+			raise ValueError("Inventory index '%s' is truncated" % filename)
+
+	def __len__(self):
+		return self.nstations
+
+	def __iter__(self):
+		for i in range(self.nstations):
+			yield self[i]
+
+	def text(self, offset, length):
+		if length == NONE:
+			return None
+		offset += self.strings
+		return decode(self.data[offset:offset + length])
+
+	def __getitem__(self, i):
+		if i < 0: i += self.nstations
+		if i < 0 or i >= self.nstations:
+			raise IndexError("station index out of range")
+
+		(net, lnet, sta, lsta, desc, ldesc, remark, lremark,
+		 start, end, lat, lon, elev, first, count) = STATION.unpack_from(self.data, self.stations + i * STATION.size)
+
+		station = { }
+		station['net'] = self.text(net, lnet)
+		station['sta'] = self.text(sta, lsta)
+		station['start'] = unnumber(start)
+		station['end'] = unnumber(end)
+		station['desc'] = self.text(desc, ldesc)
+		station['remark'] = self.text(remark, lremark)
+		station['lat'] = unnumber(lat)
+		station['lon'] = unnumber(lon)
+		station['elev'] = unnumber(elev)
+
+		station['streams'] = [ ]
+		for j in range(first, first + count):
+			(loc, lloc, cha, lcha, start, end, depth) = STREAM.unpack_from(self.data, self.streams + j * STREAM.size)
+			station['streams'].append([ self.text(loc, lloc), self.text(cha, lcha), unnumber(start), unnumber(end), unnumber(depth) ])
+
+		return station
+
+	def matches(self, source):
+		#
+		## Same stat is enough, otherwise compare the content hash
+		try:
+			st = os.stat(source)
+		except OSError:
+			return False
+
+		if st.st_size != self.size:
+			return False
+
+		if st.st_mtime == self.mtime:
+			return True
+
+		return binascii.unhexlify(sc3cache.filehash(source)) == self.digest
+
+	def close(self):
+		self.data.close()
+
+def isindex(filename):
+	try:
+		with open(filename, "rb") as fio:
+			return fio.read(len(MAGIC)) == MAGIC
+	except (IOError, OSError):
+		return False
+
+'''
+Inventory Reader
+	Like sc3reader.readinventory, but uses the index of filename
+	when it is up to date. filename may also be an index itself.
+'''
+def readinventory(filename, reader = None):
+	try:
+		if isindex(filename):
+			return InventoryIndex(filename)
+
+		if os.path.exists(indexname(filename)):
+			index = InventoryIndex(indexname(filename))
+			if index.matches(filename):
+				return index
+			index.close()
+			print("Inventory index '%s' is out of date, reading '%s'." % (indexname(filename), filename), file = sys.stderr)
+	except (IOError, OSError, ValueError, struct.error) as e:
+		print("Cannot use inventory index, %s" % e, file = sys.stderr)
+
+	return sc3reader.readinventory(filename, reader)
+
+def make_cmdline_parser():
+	# Create the parser
+	#
+	parser = OptionParser(usage="%prog [options] <inventory files>", version="1.0", add_help_option = True)
+
+	parser.add_option("-o", "--output", type="string", dest="output", help="Index filename, only with one inventory (default <inventory>.idx)", default=None)
+	parser.add_option("--reader", type="choice", choices=sc3reader.READERS, dest="reader", help="XML reader, seiscomp uses the SeisComP bindings and stream a lightweight parser (%s)" % "/".join(sc3reader.READERS), default=None)
+
+	return parser
+
+if __name__ == "__main__":
+	parser = make_cmdline_parser()
+	(options, args) = parser.parse_args()
+
+	if not args:
+		parser.error("no inventory file given")
+
+	if options.output and len(args) > 1:
+		parser.error("--output works with only one inventory file")
+
+	try:
+		options.reader = sc3reader.checkreader(options.reader)
+	except Exception as e:
+		print(str(e), file = sys.stderr)
+		sys.exit(1)
+
+	status = 0
+	for f in args:
+		output = options.output or indexname(f)
+		try:
+			counts = build(f, output, options.reader)
+		except (IOError, OSError) as e:
+			print("Cannot index '%s'\n %s" % (f, str(e)), file = sys.stderr)
+			counts = None
+
+		if counts is None:
+			status = 1
+			continue
+
+		print("Indexed %d stations and %d streams of '%s' into '%s'" % (counts[0], counts[1], f, output), file = sys.stderr)
+
+	sys.exit(status)
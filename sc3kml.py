@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#                                                                              #
+#   Buffered KML output shared by the sc3tools converters                      #
+#   Copyright (C) 2026  Marcelo Belentani de Bianchi                           #
+#                                                                              #
+#   This program is free software; you can redistribute it and/or modify       #
+#   it under the terms of the GNU General Public License as published by       #
+#   the Free Software Foundation; either version 2 of the License, or          #
+#   (at your option) any later version.                                        #
+#                                                                              #
+#   This program is distributed in the hope that it will be useful,            #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#   GNU General Public License for more details.                               #
+#                                                                              #
+#   You should have received a copy of the GNU General Public License along    #
+#   with this program; if not, write to the Free Software Foundation, Inc.,    #
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.                #
+#                                                                              #
+#### 2026-10-18 ################################################################
+#
+from __future__ import print_function
+import sys
+import zlib
+import struct
+import codecs
+import zipfile
+import tempfile
+import sc3stats
+import sc3watch
+
+'''
+Output Buffer
+	Collects the rendered KML in memory and hands it to openfile in
+	chunks of about size characters. Call flush() before the file is
+	used directly again and close() at the end, which closes openfile
+	too unless closefile is False.
+'''
+class Buffer(object):
+	def __init__(self, openfile, size = 1 << 20, closefile = True):
+		self.openfile = openfile
+		self.size = size
+		self.closefile = closefile
+		self.chunks = [ ]
+		self.length = 0
+
+	def write(self, text):
+		self.chunks.append(text)
+		self.length += len(text)
+		if self.length >= self.size:
+			self.flush()
+
+	def flush(self):
+		if self.chunks:
+			self.openfile.write("".join(self.chunks))
+			self.chunks = [ ]
+			self.length = 0
+		self.openfile.flush()
+
+	def close(self):
+		self.flush()
+		if self.closefile:
+			self.openfile.close()
+
+
+'''
+KMZ Container
+	Streams the text written to it as doc.kml into a zip archive on
+	fileobj, compressing as it goes. Assets, like images referenced
+	by the document, are stored after it when the archive is closed.
+	Needs Python 3.6 or newer to write zip entries incrementally.
+	The size of doc.kml is not known in advance, so it is always
+	written with zip64 extensions and may grow beyond 2 GiB.
+'''
+class KMZ(object):
+	def __init__(self, fileobj, name = "doc.kml", closefile = True):
+		self.fileobj = fileobj
+		self.closefile = closefile
+		self.zip = zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED)
+		self.doc = self.zip.open(name, "w", force_zip64 = True)
+		self.assets = [ ]
+
+	def write(self, text):
+		self.doc.write(text.encode("utf-8"))
+
+	def flush(self):
+		pass
+
+	def asset(self, name, data):
+		self.assets.append((name, data))
+
+	def close(self):
+		self.doc.close()
+		for (name, data) in self.assets:
+			self.zip.writestr(name, data)
+		self.zip.close()
+		if self.closefile:
+			self.fileobj.close()
+
+'''
+Compressed Spool
+	Holds text that has to be written later, compressed in a
+	temporary file, and copies it to another output on demand.
+'''
+class Spool(object):
+	def __init__(self):
+		self.fileobj = tempfile.TemporaryFile()
+		self.compressor = zlib.compressobj(1)
+
+	def write(self, text):
+		self.fileobj.write(self.compressor.compress(text.encode("utf-8")))
+
+	def flush(self):
+		pass
+
+	def copy(self, target, size = 1 << 20):
+		self.fileobj.write(self.compressor.flush())
+		self.fileobj.seek(0)
+
+		decompressor = zlib.decompressobj()
+		decoder = codecs.getincrementaldecoder("utf-8")()
+		while True:
+			chunk = self.fileobj.read(size)
+			if not chunk: break
+			target.write(decoder.decode(decompressor.decompress(chunk)))
+		target.write(decoder.decode(decompressor.flush(), True))
+
+	def close(self):
+		self.fileobj.close()
+
+'''
+PNG Image
+	Encodes width x height RGBA pixels, given as bytes row by row
+	from the top, into a PNG image to be stored as a KMZ asset.
+'''
+def chunk(kind, data):
+	return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+def png(width, height, pixels):
+	stride = width * 4
+	rows = b"".join([ b"\x00" + pixels[i * stride:(i + 1) * stride] for i in range(height) ])
+
+	return (b"\x89PNG\r\n\x1a\n" +
+			chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)) +
+			chunk(b"IDAT", zlib.compress(rows)) +
+			chunk(b"IEND", b""))
+
+'''
+KML Output
+	Opens filename, or stdout when it is None, for plain KML or for
+	KMZ and returns the Buffer to render into. Bytes reaching the
+	file are counted by sc3stats. Close the Buffer at the end, stdout
+	itself is left open. With replace the file only takes the place
+	of the old one once it is closed.
+'''
+def openkml(filename = None, kmz = False, replace = False):
+	closefile = filename is not None
+	opener = sc3watch.Replacement if replace else open
+
+	if kmz:
+		fileobj = opener(filename, "wb") if filename else getattr(sys.stdout, "buffer", sys.stdout)
+		return Buffer(KMZ(sc3stats.Counted(fileobj), closefile = closefile))
+
+	fileobj = opener(filename, "w") if filename else sys.stdout
+	return Buffer(sc3stats.Counted(fileobj), closefile = closefile)
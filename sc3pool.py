@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#                                                                              #
+#   Ordered process pool shared by the sc3tools converters                     #
+#   Copyright (C) 2026  Marcelo Belentani de Bianchi                           #
+#                                                                              #
+#   This program is free software; you can redistribute it and/or modify       #
+#   it under the terms of the GNU General Public License as published by       #
+#   the Free Software Foundation; either version 2 of the License, or          #
+#   (at your option) any later version.                                        #
+#                                                                              #
+#   This program is distributed in the hope that it will be useful,            #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#   GNU General Public License for more details.                               #
+#                                                                              #
+#   You should have received a copy of the GNU General Public License along    #
+#   with this program; if not, write to the Free Software Foundation, Inc.,    #
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.                #
+#                                                                              #
+#### 2026-10-18 ################################################################
+#
+from __future__ import print_function
+import os
+import sys
+import time
+import pickle
+import tempfile
+import functools
+import multiprocessing
+import sc3stats
+
+try:
+	from multiprocessing import SimpleQueue
+except ImportError:
+	from multiprocessing.queues import SimpleQueue
+
+'''
+Ordered Map
+	Calls function on every item and yields (item, result) pairs in
+	the same order as the items were given. With more than one job
+	the calls run on a process pool, at most a few items per worker
+	are in flight at any time so that results do not pile up.
+
+	A call that raises, kills its worker or does not return within
+	timeout seconds is reported on stderr and yields None as result.
+	Workers report on a queue, written before the call is made, when
+	they start a call and in which process. The timeout counts from
+	there and a call whose process is gone is known lost at once. On
+	a timeout the pool is replaced, the items that were still in
+	flight are submitted again to the new pool.
+'''
+#
+## Seconds between the checks on the call waited for
+POLL = 1.0
+
+STARTED = None
+
+def initworker(queue):
+	global STARTED
+	STARTED = queue
+
+def started(function, index, item):
+	STARTED.put((index, time.time(), os.getpid()))
+	return function(item)
+
+def alive(pool, pid):
+	return any([ process.pid == pid and process.is_alive() for process in pool._pool ])
+
+def orderedmap(function, items, jobs = 1, timeout = None):
+	if jobs is None or jobs <= 1:
+		for item in items:
+			yield (item, function(item))
+		return
+
+	def newpool():
+		queue = SimpleQueue()
+		return (queue, multiprocessing.Pool(jobs, initworker, (queue,)))
+
+	def submit(index, item):
+		return (index, item, pool.apply_async(started, (function, index, item)))
+
+	items = iter(items)
+	window = 4 * jobs
+	pending = [ ]
+	starts = { }
+	count = 0
+	(queue, pool) = newpool()
+
+	try:
+		while True:
+			#
+			## Keep the pool fed
+			while len(pending) < window:
+				try:
+					item = next(items)
+				except StopIteration:
+					break
+				pending.append(submit(count, item))
+				count += 1
+
+			if not pending: break
+
+			#
+			## Wait for the oldest item
+			(index, item, job) = pending.pop(0)
+			while True:
+				job.wait(POLL)
+
+				while not queue.empty():
+					(i, start, pid) = queue.get()
+					starts[i] = (start, pid)
+
+				if job.ready():
+					try:
+						result = job.get()
+					except Exception as e:
+						print(" Worker on '%s' failed: %s" % (item, e), file = sys.stderr)
+						result = None
+					break
+
+				if index not in starts: continue
+				(start, pid) = starts[index]
+
+				if timeout is not None and time.time() - start > timeout:
+					print(" Worker on '%s' did not finish in %s seconds, abandoned." % (item, timeout), file = sys.stderr)
+					pool.terminate()
+					pool.join()
+					(queue, pool) = newpool()
+					starts = { }
+					pending = [ (i, it, j) if j.ready() else submit(i, it) for (i, it, j) in pending ]
+					result = None
+					break
+
+				if not alive(pool, pid):
+					#
+					## A result sent just before the process ended may
+					## still be on its way
+					job.wait(POLL)
+					if job.ready(): continue
+					print(" Worker on '%s' died, its result is lost." % (item,), file = sys.stderr)
+					result = None
+					break
+
+			starts.pop(index, None)
+			yield (item, result)
+	finally:
+		pool.terminate()
+		pool.join()
+
+'''
+Ordered Chain
+	Like orderedmap for a function that returns an iterable for each
+	item, yields (item, element) for every element of it. Serially
+	the iterables are consumed lazily, on the pool every worker sends
+	back the list of its item together with the stage times, counters
+	and warnings it collected, which are merged here. An item with
+	more than SPILL elements is pickled to a temporary file by its
+	worker instead and read back here one element at a time, so that
+	no item is ever held in memory whole.
+'''
+SPILL = 1000
+
+def listof(function, item):
+	sc3stats.STATS.reset()
+	result = [ ]
+	spill = None
+	try:
+		for element in function(item):
+			if spill is not None:
+				pickle.dump(element, spill, pickle.HIGHEST_PROTOCOL)
+				continue
+
+			result.append(element)
+			if len(result) > SPILL:
+				spill = tempfile.NamedTemporaryFile(prefix = "sc3pool", delete = False)
+				for element in result:
+					pickle.dump(element, spill, pickle.HIGHEST_PROTOCOL)
+				result = None
+	except:
+		if spill is not None:
+			spill.close()
+			os.remove(spill.name)
+		raise
+
+	if spill is not None:
+		spill.close()
+		result = spill.name
+
+	return (result, sc3stats.STATS.take())
+
+def spilled(filename):
+	try:
+		with open(filename, "rb") as fio:
+			while True:
+				try:
+					element = pickle.load(fio)
+				except EOFError:
+					break
+				yield element
+	finally:
+		os.remove(filename)
+
+def orderedchain(function, items, jobs = 1, timeout = None):
+	if jobs is None or jobs <= 1:
+		for item in items:
+			for element in function(item):
+				yield (item, element)
+		return
+
+	for (item, result) in orderedmap(functools.partial(listof, function), items, jobs, timeout):
+		if result is None: continue
+		(result, stats) = result
+		sc3stats.STATS.merge(stats)
+		if not isinstance(result, list):
+			result = spilled(result)
+		for element in result:
+			yield (item, element)
@@ -0,0 +1,977 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#                                                                              #
+#   SeisComp3 event reader shared by the sc3tools converters                   #
+#   Copyright (C) 2026  Marcelo Belentani de Bianchi                           #
+#                                                                              #
+#   This program is free software; you can redistribute it and/or modify       #
+#   it under the terms of the GNU General Public License as published by       #
+#   the Free Software Foundation; either version 2 of the License, or          #
+#   (at your option) any later version.                                        #
+#                                                                              #
+#   This program is distributed in the hope that it will be useful,            #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#   GNU General Public License for more details.                               #
+#                                                                              #
+#   You should have received a copy of the GNU General Public License along    #
+#   with this program; if not, write to the Free Software Foundation, Inc.,    #
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.                #
+#                                                                              #
+#### 2026-10-18 ################################################################
+#
+from __future__ import print_function
+import io
+import os
+import sys
+import math
+import zlib
+import bz2
+import gzip
+import shutil
+import calendar
+import contextlib
+import sqlite3
+import tempfile
+import threading
+import sc3stats
+import sc3cache
+import sc3archive
+
+try:
+	import lzma
+except ImportError:
+	lzma = None
+
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+from xml.parsers import expat
+
+try:
+	import xml.etree.cElementTree as ElementTree
+except ImportError:
+	import xml.etree.ElementTree as ElementTree
+
+try:
+	from seiscomp3 import IO, DataModel, Core
+except ImportError:
+	try:
+		from seiscomp import io as IO, datamodel as DataModel, core as Core
+	except ImportError:
+		IO = DataModel = Core = None
+
+# Unset optional attributes raise Core.ValueException on SC3 and
+# ValueError on newer bindings
+UNSET = (ValueError, getattr(Core, "ValueException", ValueError))
+
+class ReaderError(Exception):
+	pass
+
+'''
+Readers
+	seiscomp  reads through the SeisComP DataModel
+	stream    incremental parse of the XML keeping only what the
+	          records need, works without a SeisComP install
+'''
+READERS = ( "seiscomp", "stream" )
+
+def defaultreader():
+	return "seiscomp" if IO is not None else "stream"
+
+def checkreader(reader):
+	if reader is None: return defaultreader()
+
+	if reader not in READERS:
+		raise Exception("Unknown reader '%s', use one of %s." % (reader, ", ".join(READERS)))
+
+	if reader == "seiscomp" and IO is None:
+		raise Exception("The seiscomp reader needs the SeisComP python bindings.")
+
+	return reader
+
+'''
+Compressed Input
+	Event and inventory files compressed with gzip, bzip2, xz or
+	zstandard are told by their first bytes, whatever their name,
+	and decompressed while the parser reads them. xz needs the lzma
+	module of Python 3 and zstandard the zstandard package.
+'''
+MAGIC = ( (b"\x1f\x8b", "gzip"),
+		  (b"BZh", "bzip2"),
+		  (b"\xfd7zXZ\x00", "xz"),
+		  (b"\x28\xb5\x2f\xfd", "zstd") )
+
+#
+## Names of event files when directories are searched
+SUFFIXES = ( ".xml", ".xml.gz", ".xml.bz2", ".xml.xz", ".xml.zst" )
+
+#
+## Raised by the decompressors on damaged data
+CORRUPT = (EOFError, zlib.error) + ((lzma.LZMAError,) if lzma else ()) + ((zstandard.ZstdError,) if zstandard else ())
+
+def compression(filename):
+	with open(filename, "rb") as fio:
+		head = fio.read(6)
+
+	for (magic, kind) in MAGIC:
+		if head.startswith(magic):
+			return kind
+
+	return None
+
+def openxml(filename):
+	#
+	## A binary file object reading the XML of filename
+	kind = compression(filename)
+
+	if kind == "gzip":
+		return gzip.GzipFile(filename, "rb")
+
+	if kind == "bzip2":
+		return bz2.BZ2File(filename, "rb")
+
+	if kind == "xz":
+		if lzma is None:
+			raise IOError("Reading xz files needs the lzma module of Python 3.")
+		return lzma.LZMAFile(filename, "rb")
+
+	if kind == "zstd":
+		if zstandard is None:
+			raise IOError("Reading zstandard files needs the zstandard package.")
+		return zstandard.ZstdDecompressor().stream_reader(open(filename, "rb"), closefd = True)
+
+	return open(filename, "rb")
+
+'''
+Named Pipe
+	XMLArchive of SeisComP only opens files by name. To hand it data
+	from memory or a decompressor, a thread writes it into a named
+	pipe whose name the archive opens, so nothing is stored on disk.
+	close() waits for the thread and raises what it failed with.
+'''
+class Pipe(object):
+	def __init__(self, fileobj):
+		self.fileobj = fileobj
+		self.directory = tempfile.mkdtemp()
+		self.name = os.path.join(self.directory, "data.xml")
+		self.error = None
+		os.mkfifo(self.name)
+
+		self.thread = threading.Thread(target = self.run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def run(self):
+		try:
+			with open(self.name, "wb") as fifo:
+				shutil.copyfileobj(self.fileobj, fifo, 1 << 20)
+		except (IOError, OSError) + CORRUPT as e:
+			self.error = e
+
+	def close(self):
+		#
+		## A reader that never opened the pipe leaves the thread
+		## waiting in open(), opening it here lets it through
+		if self.thread.is_alive():
+			try:
+				os.close(os.open(self.name, os.O_RDONLY | os.O_NONBLOCK))
+			except OSError:
+				pass
+		self.thread.join()
+
+		self.fileobj.close()
+		os.remove(self.name)
+		os.rmdir(self.directory)
+
+		if self.error is not None:
+			raise IOError(str(self.error))
+
+'''
+Sc3 Time
+	Returns the epoch in seconds of a Core.Time or TimeQuantity
+'''
+def sc3time(sc3t):
+	if isinstance(sc3t, DataModel.TimeQuantity):
+		sc3t = sc3t.value()
+
+	return float(sc3t.seconds()) + float(sc3t.microseconds()) / 1E6
+
+'''
+XML Time
+	Returns the epoch in seconds of a time as written in SC3 XML
+'''
+def xmltime(text):
+	text = text.strip().rstrip("Z")
+	(date, clock) = text.split("T")
+	(clock, dot, fraction) = clock.partition(".")
+
+	(year, month, day) = date.split("-")
+	(hour, minute, second) = clock.split(":")
+
+	seconds = calendar.timegm((int(year), int(month), int(day), int(hour), int(minute), int(second), 0, 0, 0))
+	microseconds = int((fraction + "000000")[0:6])
+
+	return float(seconds) + float(microseconds) / 1E6
+
+'''
+Event Record
+	The preferred solution of one event as a plain dictionary that
+	both ev2kml and sc32ph build their output from:
+
+		id      event publicID
+		time    origin time, epoch seconds
+		lat, lon, dep, eh, ez, rms
+		mag     preferred magnitude value or None
+		magt    preferred magnitude type or None
+		desc    first event description or None
+		arc     number of arrivals of the origin
+		picks   [ net, sta, loc, cha, time, phase, weight, pickID ]
+		        for every arrival whose pick is in the file
+'''
+def recordfromep(ep, evt, filename):
+	ori = ep.findOrigin(evt.preferredOriginID())
+	if type(ori) == type(None):
+		sc3stats.warn("origin not found", " Origin %s not found (%s), skipping." % (evt.preferredOriginID(), filename))
+		return None
+
+	if evt.preferredMagnitudeID() == "":
+		sc3stats.warn("no magnitude", " No magnitude (%s)" % filename)
+
+	mag = ori.findMagnitude(evt.preferredMagnitudeID())
+
+	record = { }
+	record['id'] = evt.publicID()
+	record['time'] = sc3time(ori.time())
+	record['lat'] = ori.latitude().value()
+	record['lon'] = ori.longitude().value()
+	record['dep'] = ori.depth().value()
+	record['arc'] = ori.arrivalCount()
+
+	record['mag'] = None
+	record['magt'] = None
+	if type(mag) != type(None):
+		record['mag'] = mag.magnitude().value()
+		record['magt'] = mag.type()
+
+	record['desc'] = None
+	if evt.eventDescriptionCount() != 0:
+		record['desc'] = evt.eventDescription(0).text()
+
+	#
+	## Assembly errors from Sc3 solution
+	try:
+		record['eh'] = math.sqrt(math.pow(ori.latitude().uncertainty(), 2)  + math.pow(ori.longitude().uncertainty(), 2))
+	except UNSET:
+		record['eh'] = 0.0
+
+	try:
+		record['ez'] = ori.depth().uncertainty()
+	except UNSET:
+		record['ez'] = 0.0
+
+	try:
+		record['rms'] = ori.quality().standardError()
+	except UNSET:
+		record['rms'] = 0.0
+
+	#
+	## Picks referenced by the arrivals
+	picks = [ ]
+	for i in range(0, ori.arrivalCount()):
+		arrival = ori.arrival(i)
+
+		pick = ep.findPick(arrival.pickID())
+		if type(pick) == type(None):
+			sc3stats.warn("invalid pick", " Invalid pick -- %s " % arrival.pickID())
+			continue
+
+		waveform = pick.waveformID()
+
+		try:
+			phase = pick.phaseHint().code()
+		except UNSET:
+			phase = ""
+
+		try:
+			weight = arrival.weight()
+		except UNSET:
+			weight = 0.0
+
+		picks.append([ waveform.networkCode(), waveform.stationCode(),
+					   waveform.locationCode(), waveform.channelCode(),
+					   sc3time(pick.time()), phase, weight, arrival.pickID() ])
+
+	record['picks'] = picks
+
+	return record
+
+def seiscompevents(filename, source = None):
+	#
+	## source is a file object to read instead of filename
+	try:
+		if source is None and compression(filename):
+			source = openxml(filename)
+	except (IOError, OSError) as e:
+		raise ReaderError("Filename '%s' is not accessible. %s" % (filename, e))
+
+	pipe = None if source is None else Pipe(source)
+	try:
+		ar = IO.XMLArchive()
+		if ar.open(filename if pipe is None else pipe.name) == False:
+			raise ReaderError("Filename '%s' is not accessible." % (filename))
+
+		obj = ar.readObject()
+		ar.close()
+	finally:
+		if pipe is not None:
+			try:
+				pipe.close()
+			except (IOError, OSError) as e:
+				raise ReaderError("Filename '%s' is not readable. %s" % (filename, e))
+
+	ep = DataModel.EventParameters.Cast(obj)
+
+	if type(ep) == type(None):
+		sc3stats.warn("no event file", "File (%s) is no event, skipping." % filename)
+		return
+
+	if ep.eventCount() == 0:
+		sc3stats.warn("no event file", "File (%s) has no events, skipping." % filename)
+		return
+
+	for i in range(0, ep.eventCount()):
+		evt = DataModel.Event.Cast(ep.event(i))
+
+		if type(evt) == type(None):
+			sc3stats.warn("unreadable event", "Cannot get event %d from file (%s), skipping." % (i, filename))
+			continue
+
+		if evt.preferredOriginID() == "":
+			sc3stats.warn("no origin", "No origin for %s (%s), skipping." % (evt.publicID(), filename))
+			continue
+
+		record = recordfromep(ep, evt, filename)
+		if record is not None:
+			yield record
+
+'''
+Stream Reader
+	Walks the XML and keeps, for every pick and origin, only the few
+	values that a record needs. Every other element, like amplitudes,
+	station magnitudes, focal mechanisms and comments, is dropped as
+	soon as it was parsed.
+
+	SeisComP writes all picks and origins before the events, so a
+	file bigger than PREPASS bytes is first scanned for the preferred
+	origins of its events and then for the picks of their arrivals.
+	Only those are kept while it is read, memory follows what the
+	events use and not the size of the file. The scans cost about
+	one more read of the file, smaller files are read once and keep
+	every pick and origin until the events that use them.
+
+	A time or number that does not parse ends the file with
+	ReaderError, as an unreadable file does, so that it is reported
+	and skipped the same with and without --jobs.
+'''
+PREPASS = 64 * 1024 * 1024
+
+#
+## Raised by xmltime and number on a value that is not a time or a
+## number, or is missing
+MALFORMED = (ValueError, TypeError, AttributeError)
+
+def tag(element):
+	return element.tag.rpartition("}")[2]
+
+def child(element, name):
+	for c in element:
+		if tag(c) == name:
+			return c
+	return None
+
+def text(element, path, default = None):
+	for name in path.split("/"):
+		if element is None: break
+		element = child(element, name)
+
+	if element is None or element.text is None:
+		return default
+
+	return element.text.strip()
+
+def number(element, path, default = None):
+	value = text(element, path)
+	return default if value is None else float(value)
+
+def streampick(element):
+	waveform = child(element, "waveformID")
+	if waveform is None:
+		waveform = { }
+
+	return ( waveform.get("networkCode", ""), waveform.get("stationCode", ""),
+			 waveform.get("locationCode", ""), waveform.get("channelCode", ""),
+			 xmltime(text(element, "time/value")), text(element, "phaseHint", "") )
+
+def streamorigin(element):
+	origin = { }
+	origin['time'] = xmltime(text(element, "time/value"))
+	origin['lat'] = number(element, "latitude/value")
+	origin['lon'] = number(element, "longitude/value")
+	origin['dep'] = number(element, "depth/value")
+
+	latu = number(element, "latitude/uncertainty")
+	lonu = number(element, "longitude/uncertainty")
+	origin['eh'] = 0.0 if latu is None or lonu is None else math.sqrt(math.pow(latu, 2) + math.pow(lonu, 2))
+	origin['ez'] = number(element, "depth/uncertainty", 0.0)
+	origin['rms'] = number(element, "quality/standardError", 0.0)
+
+	origin['arrivals'] = [ ]
+	origin['magnitudes'] = { }
+	for c in element:
+		name = tag(c)
+		if name == "arrival":
+			origin['arrivals'].append((text(c, "pickID"), number(c, "weight", 0.0)))
+		elif name == "magnitude":
+			origin['magnitudes'][c.get("publicID")] = (number(c, "magnitude/value"), text(c, "type", ""))
+
+	return origin
+
+def recordfromstream(evt, origins, picks, filename):
+	oid = text(evt, "preferredOriginID", "")
+	mid = text(evt, "preferredMagnitudeID", "")
+
+	if oid == "":
+		sc3stats.warn("no origin", "No origin for %s (%s), skipping." % (evt.get("publicID"), filename))
+		return None
+
+	ori = origins.get(oid)
+	if ori is None:
+		sc3stats.warn("origin not found", " Origin %s not found (%s), skipping." % (oid, filename))
+		return None
+
+	if mid == "":
+		sc3stats.warn("no magnitude", " No magnitude (%s)" % filename)
+
+	mag = ori['magnitudes'].get(mid)
+
+	record = { }
+	record['id'] = evt.get("publicID")
+	for key in ( 'time', 'lat', 'lon', 'dep', 'eh', 'ez', 'rms' ):
+		record[key] = ori[key]
+	record['arc'] = len(ori['arrivals'])
+
+	record['mag'] = None
+	record['magt'] = None
+	if mag is not None:
+		(record['mag'], record['magt']) = mag
+
+	description = child(evt, "description")
+	record['desc'] = None if description is None else text(description, "text", "")
+
+	record['picks'] = [ ]
+	for (pickid, weight) in ori['arrivals']:
+		pick = picks.get(pickid)
+		if pick is None:
+			sc3stats.warn("invalid pick", " Invalid pick -- %s " % pickid)
+			continue
+		(n, s, l, c, time, phase) = pick
+		record['picks'].append([ n, s, l, c, time, phase, weight, pickid ])
+
+	return record
+
+def forget(evt, origins, picks):
+	#
+	## Drop the origins of a finished event and the picks they use
+	oids = set([ text(evt, "preferredOriginID", "") ])
+	for c in evt:
+		if tag(c) == "originReference" and c.text:
+			oids.add(c.text.strip())
+
+	for oid in oids:
+		ori = origins.pop(oid, None)
+		if ori is None: continue
+		for (pickid, weight) in ori['arrivals']:
+			picks.pop(pickid, None)
+
+def parameters(source):
+	#
+	## Yields (name, element) for EventParameters when it starts and
+	## for each of its children when they end, the children are
+	## dropped once handled. Other documents yield nothing
+	root = None
+	parent = None
+
+	for (action, element) in ElementTree.iterparse(source, events = ("start", "end")):
+		if action == "start":
+			if root is None:
+				root = element
+			elif parent is None:
+				if tag(element) != "EventParameters": return
+				parent = element
+				yield ("EventParameters", element)
+			continue
+
+		if parent is None or element not in parent: continue
+
+		yield (tag(element), element)
+		parent.remove(element)
+
+def leaves(filename, path, owners = None):
+	#
+	## The text of every element at path below the children of
+	## EventParameters, of the children whose publicID is in owners
+	## when given. Read with expat, no element is built
+	values = set()
+	stack = [ ]
+	owner = [ None ]
+	data = [ ]
+	path = [ "seiscomp", "EventParameters" ] + list(path)
+
+	def start(name, attributes):
+		stack.append(name.rpartition("}")[2])
+		if len(stack) == 3:
+			owner[0] = attributes.get("publicID")
+		elif len(stack) == len(path):
+			del data[:]
+
+	def end(name):
+		if len(stack) == len(path) and stack[1:] == path[1:] and (owners is None or owner[0] in owners):
+			values.add("".join(data).strip())
+		stack.pop()
+
+	def characters(text):
+		if len(stack) == len(path):
+			data.append(text)
+
+	parser = expat.ParserCreate(namespace_separator = "}")
+	parser.StartElementHandler = start
+	parser.EndElementHandler = end
+	parser.CharacterDataHandler = characters
+
+	source = openxml(filename)
+	try:
+		parser.ParseFile(source)
+	finally:
+		source.close()
+
+	return values
+
+def references(filename):
+	#
+	## The preferred origins of the events and the picks of their arrivals
+	oids = leaves(filename, ( "event", "preferredOriginID" ))
+	pickids = leaves(filename, ( "origin", "arrival", "pickID" ), oids)
+	return (oids, pickids)
+
+def streamevents(filename, source = None):
+	picks = { }
+	origins = { }
+	oids = None
+	pickids = None
+	found = False
+	nevents = 0
+
+	try:
+		if source is None:
+			if os.path.getsize(filename) > PREPASS:
+				(oids, pickids) = references(filename)
+			source = openxml(filename)
+
+		for (name, element) in parameters(source):
+			if name == "EventParameters":
+				found = True
+			elif name == "pick":
+				pickid = element.get("publicID")
+				if pickids is None or pickid in pickids:
+					picks[pickid] = streampick(element)
+			elif name == "origin":
+				oid = element.get("publicID")
+				if oids is None or oid in oids:
+					origins[oid] = streamorigin(element)
+			elif name == "event":
+				nevents += 1
+				record = recordfromstream(element, origins, picks, filename)
+				forget(element, origins, picks)
+				if record is not None:
+					yield record
+	except (IOError, OSError, SyntaxError, expat.ExpatError) + CORRUPT as e:
+		raise ReaderError("Filename '%s' is not accessible. %s" % (filename, e))
+	except MALFORMED as e:
+		raise ReaderError("Filename '%s' has a malformed value. %s" % (filename, e))
+	finally:
+		if source is not None:
+			source.close()
+
+	if not found:
+		sc3stats.warn("no event file", "File (%s) is no event, skipping." % filename)
+	elif nevents == 0:
+		sc3stats.warn("no event file", "File (%s) has no events, skipping." % filename)
+
+'''
+Archive Reader
+	Yields the records of all the events of an archive shard, parsed
+	one member at a time. A member that does not parse is reported
+	and skipped, a shard that cannot be read ends with ReaderError.
+'''
+def shardevents(filename, reader):
+	try:
+		for (evid, data) in sc3archive.members(filename):
+			name = "%s#%s" % (filename, evid)
+			if reader == "seiscomp":
+				records = seiscompevents(name, io.BytesIO(data))
+			else:
+				records = streamevents(name, io.BytesIO(data))
+
+			try:
+				for record in records:
+					yield record
+			except ReaderError as e:
+				sc3stats.warn("unreadable event", str(e))
+	except (IOError, OSError, zlib.error, sqlite3.Error) as e:
+		raise ReaderError("Shard '%s' is not accessible. %s" % (filename, e))
+
+'''
+Data Reader
+	Yields the record of every event in filename, an event file or
+	the shard of an event archive. The stream reader hands out each
+	event as soon as its element ends, so the file is never fully in
+	memory; the seiscomp reader has to load all of it.
+	The cache, when given, is consulted before the file is parsed and
+	filled from a spool once the file was read to its end without
+	errors.
+'''
+def readevents(filename, cache = None, reader = None):
+	sc3stats.count("files")
+
+	if cache:
+		records = cache.get(filename)
+		if records is not None:
+			sc3stats.count("cached files")
+			for record in records:
+				sc3stats.count("events")
+				sc3stats.count("picks", len(record['picks']))
+				yield record
+			return
+
+	reader = checkreader(reader)
+	if sc3archive.isshard(filename):
+		records = shardevents(filename, reader)
+	elif reader == "seiscomp":
+		records = seiscompevents(filename)
+	else:
+		records = streamevents(filename)
+
+	spool = sc3cache.Spool() if cache else None
+	try:
+		for record in records:
+			sc3stats.count("events")
+			sc3stats.count("picks", len(record['picks']))
+			if spool: spool.add(record)
+			yield record
+
+		if spool:
+			cache.put(filename, spool)
+	except ReaderError as e:
+		sc3stats.warn("unreadable file", str(e))
+	finally:
+		if spool:
+			spool.close()
+
+'''
+Database Reader
+	Reads the records straight from a SQLite database in the SeisComP
+	schema, with no XML in between. The events with their preferred
+	origin and magnitude come from one query, the arrivals and their
+	picks from one more query for every batch of events. conditions
+	are (sql, parameters) pairs selecting the events, on the same
+	columns as the sc3catalog index: id, time, lat, lon, dep, mag,
+	magt and arc.
+'''
+DBEVENTS = '''
+SELECT * FROM (
+ SELECT pe.publicID AS id,
+        CAST(strftime('%%s', o.time_value) AS INTEGER) + COALESCE(o.time_value_ms, 0) / 1E6 AS time,
+        o.latitude_value AS lat, o.longitude_value AS lon, o.depth_value AS dep,
+        m.magnitude_value AS mag, m.type AS magt,
+        (SELECT COUNT(*) FROM Arrival a WHERE a._parent_oid = o._oid) AS arc,
+        o.latitude_uncertainty AS latu, o.longitude_uncertainty AS lonu,
+        o.depth_uncertainty AS depu, o.quality_standardError AS rms,
+        (SELECT d.text FROM EventDescription d WHERE d._parent_oid = e._oid ORDER BY d._oid LIMIT 1) AS description,
+        e.preferredOriginID AS originid, e.preferredMagnitudeID AS magnitudeid, o._oid AS origin
+ FROM Event e
+ JOIN PublicObject pe ON pe._oid = e._oid
+ LEFT JOIN PublicObject po ON po.publicID = e.preferredOriginID
+ LEFT JOIN Origin o ON o._oid = po._oid
+ LEFT JOIN PublicObject pm ON pm.publicID = e.preferredMagnitudeID
+ LEFT JOIN Magnitude m ON m._oid = pm._oid AND m._parent_oid = o._oid
+)%s
+ORDER BY time, id
+'''
+
+DBARRIVALS = '''
+SELECT a._parent_oid AS origin, a.pickID AS pickid, a.weight AS weight, p._oid AS pick,
+       p.waveformID_networkCode AS net, p.waveformID_stationCode AS sta,
+       p.waveformID_locationCode AS loc, p.waveformID_channelCode AS cha,
+       CAST(strftime('%%s', p.time_value) AS INTEGER) + COALESCE(p.time_value_ms, 0) / 1E6 AS time,
+       p.phaseHint_code AS phase
+FROM Arrival a
+LEFT JOIN PublicObject pp ON pp.publicID = a.pickID
+LEFT JOIN Pick p ON p._oid = pp._oid
+WHERE a._parent_oid IN (%s)
+ORDER BY a._parent_oid, a._oid
+'''
+
+def recordfromrow(row, arrivals, filename):
+	if not row['originid']:
+		sc3stats.warn("no origin", "No origin for %s (%s), skipping." % (row['id'], filename))
+		return None
+
+	if row['origin'] is None:
+		sc3stats.warn("origin not found", " Origin %s not found (%s), skipping." % (row['originid'], filename))
+		return None
+
+	if not row['magnitudeid']:
+		sc3stats.warn("no magnitude", " No magnitude (%s)" % row['id'])
+
+	record = { }
+	for key in ( 'id', 'time', 'lat', 'lon', 'dep', 'arc', 'mag', 'magt' ):
+		record[key] = row[key]
+	record['desc'] = row['description']
+
+	record['eh'] = 0.0
+	if row['latu'] is not None and row['lonu'] is not None:
+		record['eh'] = math.sqrt(math.pow(row['latu'], 2) + math.pow(row['lonu'], 2))
+	record['ez'] = 0.0 if row['depu'] is None else row['depu']
+	record['rms'] = 0.0 if row['rms'] is None else row['rms']
+
+	record['picks'] = [ ]
+	for arrival in arrivals.get(row['origin'], [ ]):
+		if arrival['pick'] is None:
+			sc3stats.warn("invalid pick", " Invalid pick -- %s " % arrival['pickid'])
+			continue
+		record['picks'].append([ arrival['net'], arrival['sta'], arrival['loc'] or "", arrival['cha'],
+								 arrival['time'], arrival['phase'] or "",
+								 0.0 if arrival['weight'] is None else arrival['weight'], arrival['pickid'] ])
+
+	return record
+
+def databaserecords(filename, query, parameters, batch):
+	#
+	## The connection is opened on the first record asked for and
+	## closed when the generator ends, also when it is not run out
+	try:
+		with contextlib.closing(sqlite3.connect(filename)) as db:
+			db.text_factory = str
+			db.row_factory = sqlite3.Row
+			cursor = db.execute(query, parameters)
+			for record in databasebatches(db, cursor, filename, batch):
+				yield record
+	except sqlite3.Error as e:
+		raise ReaderError("Database '%s' is not readable. %s" % (filename, e))
+
+def databasebatches(db, cursor, filename, batch):
+	while True:
+		rows = cursor.fetchmany(batch)
+		if not rows: break
+
+		origins = [ row['origin'] for row in rows if row['origin'] is not None ]
+		arrivals = { }
+		if origins:
+			for arrival in db.execute(DBARRIVALS % ",".join([ "?" ] * len(origins)), origins):
+				arrivals.setdefault(arrival['origin'], [ ]).append(arrival)
+
+		for row in rows:
+			record = recordfromrow(row, arrivals, filename)
+			if record is None: continue
+			sc3stats.count("events")
+			sc3stats.count("picks", len(record['picks']))
+			yield record
+
+def databaseevents(filename, conditions = (), batch = 500):
+	#
+	## Not a generator, a bad database or condition fails right away
+	if not os.path.isfile(filename):
+		raise ReaderError("Database '%s' is not accessible." % filename)
+
+	where = ""
+	parameters = [ ]
+	if conditions:
+		where = " WHERE " + " AND ".join([ "(%s)" % condition for (condition, values) in conditions ])
+		for (condition, values) in conditions:
+			parameters.extend(values)
+
+	#
+	## Only compiled here, the query is run by the generator
+	try:
+		with contextlib.closing(sqlite3.connect(filename)) as db:
+			db.execute("EXPLAIN " + DBEVENTS % where, parameters)
+	except sqlite3.Error as e:
+		raise ReaderError("Database '%s' is not readable. %s" % (filename, e))
+
+	return databaserecords(filename, DBEVENTS % where, parameters, batch)
+
+'''
+Station Record
+	One station epoch of an inventory as a plain dictionary:
+
+		net, sta  network and station codes
+		start     epoch seconds
+		end       epoch seconds or None when open
+		desc      description
+		remark    remark content or None
+		lat, lon, elev
+		streams   [ loc, cha, start, end, depth ] with end None
+		          when the stream is open
+'''
+def seiscompinventory(filename):
+	try:
+		pipe = Pipe(openxml(filename)) if compression(filename) else None
+	except (IOError, OSError) as e:
+		print("Filename '%s' is not accessible. %s" % (filename, e), file = sys.stderr)
+		return None
+
+	obj = None
+	try:
+		ar = IO.XMLArchive()
+		if ar.open(filename if pipe is None else pipe.name) == False:
+			print("Filename '%s' is not accessible." % (filename), file = sys.stderr)
+			return None
+
+		obj = ar.readObject()
+		ar.close()
+	finally:
+		if pipe is not None:
+			try:
+				pipe.close()
+			except (IOError, OSError) as e:
+				print("Filename '%s' is not readable. %s" % (filename, e), file = sys.stderr)
+				obj = None
+
+	inv = DataModel.Inventory.Cast(obj)
+
+	if type(inv) == type(None):
+		print("File (%s) is no inventory, skipping." % filename, file = sys.stderr)
+		return None
+
+	stations = [ ]
+	for i in range(0, inv.networkCount()):
+		net = inv.network(i)
+		for j in range(0, net.stationCount()):
+			sta = net.station(j)
+
+			station = { }
+			station['net'] = net.code()
+			station['sta'] = sta.code()
+			station['start'] = sc3time(sta.start())
+			try:
+				station['end'] = sc3time(sta.end())
+			except UNSET:
+				station['end'] = None
+			station['desc'] = sta.description()
+			try:
+				station['remark'] = sta.remark().content()
+			except UNSET:
+				station['remark'] = None
+			station['lat'] = sta.latitude()
+			station['lon'] = sta.longitude()
+			station['elev'] = sta.elevation()
+
+			station['streams'] = [ ]
+			for k in range(0, sta.sensorLocationCount()):
+				loc = sta.sensorLocation(k)
+				for m in range(0, loc.streamCount()):
+					cha = loc.stream(m)
+					try:
+						end = sc3time(cha.end())
+					except UNSET:
+						end = None
+					station['streams'].append([ loc.code(), cha.code(), sc3time(cha.start()), end, cha.depth() ])
+
+			stations.append(station)
+
+	return stations
+
+def streamstation(net, element):
+	end = text(element, "end")
+
+	station = { }
+	station['net'] = net
+	station['sta'] = element.get("code", "")
+	station['start'] = xmltime(text(element, "start"))
+	station['end'] = None if end is None else xmltime(end)
+	station['desc'] = text(element, "description", "")
+	station['remark'] = text(element, "remark/content")
+	station['lat'] = number(element, "latitude")
+	station['lon'] = number(element, "longitude")
+	station['elev'] = number(element, "elevation")
+
+	station['streams'] = [ ]
+	for loc in element:
+		if tag(loc) != "sensorLocation": continue
+		for cha in loc:
+			if tag(cha) != "stream": continue
+			end = text(cha, "end")
+			station['streams'].append([ loc.get("code", ""), cha.get("code", ""), xmltime(text(cha, "start")),
+									   None if end is None else xmltime(end), number(cha, "depth") ])
+
+	return station
+
+def streaminventory(filename):
+	stations = [ ]
+	root = None
+	inventory = None
+	network = None
+
+	source = None
+	try:
+		source = openxml(filename)
+		for (action, element) in ElementTree.iterparse(source, events = ("start", "end")):
+			name = tag(element)
+
+			if action == "start":
+				if root is None:
+					root = element
+				elif inventory is None:
+					if name != "Inventory": break
+					inventory = element
+				elif name == "network" and network is None:
+					network = element
+				continue
+
+			if network is not None and element in network:
+				if name == "station":
+					stations.append(streamstation(network.get("code", ""), element))
+				network.remove(element)
+			elif inventory is not None and element in inventory:
+				inventory.remove(element)
+				if element is network:
+					network = None
+	except (IOError, OSError, SyntaxError) + CORRUPT as e:
+		print("Filename '%s' is not accessible. %s" % (filename, e), file = sys.stderr)
+		return None
+	except MALFORMED as e:
+		print("Filename '%s' has a malformed value. %s" % (filename, e), file = sys.stderr)
+		return None
+	finally:
+		if source is not None:
+			source.close()
+
+	if inventory is None:
+		print("File (%s) is no inventory, skipping." % filename, file = sys.stderr)
+		return None
+
+	return stations
+
+'''
+Inventory Reader
+	Returns the list of station records of filename or None
+'''
+def readinventory(filename, reader = None):
+	if checkreader(reader) == "seiscomp":
+		return seiscompinventory(filename)
+
+	return streaminventory(filename)
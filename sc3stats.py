@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#                                                                              #
+#   Stage timers, counters and warnings shared by the sc3tools converters      #
+#   Copyright (C) 2026  Marcelo Belentani de Bianchi                           #
+#                                                                              #
+#   This program is free software; you can redistribute it and/or modify       #
+#   it under the terms of the GNU General Public License as published by       #
+#   the Free Software Foundation; either version 2 of the License, or          #
+#   (at your option) any later version.                                        #
+#                                                                              #
+#   This program is distributed in the hope that it will be useful,            #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#   GNU General Public License for more details.                               #
+#                                                                              #
+#   You should have received a copy of the GNU General Public License along    #
+#   with this program; if not, write to the Free Software Foundation, Inc.,    #
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.                #
+#                                                                              #
+#### 2026-10-18 ################################################################
+#
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import atexit
+
+'''
+Warnings
+	Only the first LIMIT warnings of a kind are printed, the rest
+	are counted and reported once at exit.
+'''
+LIMIT = 10
+
+def cputime():
+	t = os.times()
+	return t[0] + t[1]
+
+'''
+Stage Timer
+	Context manager adding the wall and CPU time of its block to a
+	stage of Stats.
+'''
+class Stage(object):
+	def __init__(self, stats, name):
+		self.stats = stats
+		self.name = name
+
+	def __enter__(self):
+		self.wall = time.time()
+		self.cpu = cputime()
+		return self
+
+	def __exit__(self, kind, value, traceback):
+		entry = self.stats.stages.setdefault(self.name, [ 0.0, 0.0, 0 ])
+		entry[0] += time.time() - self.wall
+		entry[1] += cputime() - self.cpu
+		entry[2] += 1
+		return False
+
+'''
+Stats Class
+	Holds the stage times, counters and warning counts of one
+	process. Pool workers send theirs back with take() and the main
+	process adds them with merge(), stage times are then summed
+	over all workers.
+'''
+class Stats(object):
+	def __init__(self):
+		self.printed = { }
+		self.reset()
+
+	def reset(self):
+		self.stages = { }
+		self.counters = { }
+		self.warnings = { }
+
+	def take(self):
+		state = (self.stages, self.counters, self.warnings)
+		self.reset()
+		return state
+
+	def merge(self, state):
+		(stages, counters, warnings) = state
+		for (name, values) in stages.items():
+			entry = self.stages.setdefault(name, [ 0.0, 0.0, 0 ])
+			for i in range(3):
+				entry[i] += values[i]
+		for (name, n) in counters.items():
+			self.counters[name] = self.counters.get(name, 0) + n
+		for (kind, n) in warnings.items():
+			self.warnings[kind] = self.warnings.get(kind, 0) + n
+
+	def stage(self, name):
+		return Stage(self, name)
+
+	def count(self, name, n = 1):
+		self.counters[name] = self.counters.get(name, 0) + n
+
+	def warn(self, kind, message):
+		#
+		## The printed count is per process and survives take()
+		self.warnings[kind] = self.warnings.get(kind, 0) + 1
+		n = self.printed.get(kind, 0) + 1
+		self.printed[kind] = n
+		if n <= LIMIT:
+			print(message, file = sys.stderr)
+		if n == LIMIT:
+			print(" Further '%s' warnings are only counted." % kind, file = sys.stderr)
+
+STATS = Stats()
+
+def stage(name):
+	return STATS.stage(name)
+
+def count(name, n = 1):
+	STATS.count(name, n)
+
+def warn(kind, message):
+	STATS.warn(kind, message)
+
+def timed(name, iterable):
+	#
+	## Times the production of every item of iterable as stage name
+	iterator = iter(iterable)
+	while True:
+		with STATS.stage(name):
+			try:
+				item = next(iterator)
+			except StopIteration:
+				return
+		yield item
+
+'''
+Counted Output
+	Wraps an output file and counts the bytes written to it
+'''
+class Counted(object):
+	def __init__(self, openfile, name = "bytes written"):
+		self.openfile = openfile
+		self.name = name
+
+	def write(self, data):
+		STATS.count(self.name, len(data))
+		return self.openfile.write(data)
+
+	def __getattr__(self, name):
+		return getattr(self.openfile, name)
+
+'''
+Run Summary
+	setup() is called once by a tool after parsing its options, it
+	starts the profiler and arranges the summary to be written when
+	the tool exits. The JSON summary goes to statsfile ("-" is
+	stderr) and the profile, in the pstats format, to profilefile.
+'''
+class Run(object):
+	def __init__(self, tool, statsfile = None, profilefile = None):
+		self.tool = tool
+		self.statsfile = statsfile
+		self.profilefile = profilefile
+		self.wall = time.time()
+		self.cpu = cputime()
+		self.profiler = None
+
+		if profilefile:
+			import cProfile
+			self.profiler = cProfile.Profile()
+			self.profiler.enable()
+
+	def summary(self):
+		return {
+			'tool': self.tool,
+			'wall': time.time() - self.wall,
+			'cpu': cputime() - self.cpu,
+			'stages': dict([ (name, { 'wall': v[0], 'cpu': v[1], 'calls': v[2] }) for (name, v) in STATS.stages.items() ]),
+			'counters': STATS.counters,
+			'warnings': STATS.warnings,
+		}
+
+	def finish(self):
+		if self.profiler:
+			self.profiler.disable()
+			try:
+				self.profiler.dump_stats(self.profilefile)
+			except (IOError, OSError) as e:
+				print("Cannot write profile '%s'\n %s" % (self.profilefile, str(e)), file = sys.stderr)
+
+		for kind in sorted(STATS.warnings):
+			if STATS.warnings[kind] > LIMIT:
+				print("Warning '%s' happened %d times." % (kind, STATS.warnings[kind]), file = sys.stderr)
+
+		if not self.statsfile: return
+
+		summary = json.dumps(self.summary(), indent = 1, sort_keys = True)
+		if self.statsfile == "-":
+			print(summary, file = sys.stderr)
+			return
+
+		try:
+			with open(self.statsfile, "w") as fio:
+				print(summary, file = fio)
+		except (IOError, OSError) as e:
+			print("Cannot write stats '%s'\n %s" % (self.statsfile, str(e)), file = sys.stderr)
+
+def setup(tool, statsfile = None, profilefile = None):
+	run = Run(tool, statsfile, profilefile)
+	atexit.register(run.finish)
+	return run
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#                                                                              #
+#   Directory watch and atomic output shared by the sc3tools converters        #
+#   Copyright (C) 2026  Marcelo Belentani de Bianchi                           #
+#                                                                              #
+#   This program is free software; you can redistribute it and/or modify       #
+#   it under the terms of the GNU General Public License as published by       #
+#   the Free Software Foundation; either version 2 of the License, or          #
+#   (at your option) any later version.                                        #
+#                                                                              #
+#   This program is distributed in the hope that it will be useful,            #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#   GNU General Public License for more details.                               #
+#                                                                              #
+#   You should have received a copy of the GNU General Public License along    #
+#   with this program; if not, write to the Free Software Foundation, Inc.,    #
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.                #
+#                                                                              #
+#### 2026-10-18 ################################################################
+#
+from __future__ import print_function
+import os
+import sys
+import time
+import filecmp
+import sc3reader
+
+'''
+Replacement Output
+	Writes to filename.tmp and renames it over filename when closed,
+	so readers find the old or the new content but never half a
+	file. When the new content is the same as the old the old file
+	is kept untouched and changed is False.
+'''
+class Replacement(object):
+	def __init__(self, filename, mode = "w"):
+		self.filename = filename
+		self.tmp = "%s.tmp" % filename
+		self.fileobj = open(self.tmp, mode)
+		self.changed = None
+
+	def write(self, data):
+		return self.fileobj.write(data)
+
+	def __getattr__(self, name):
+		return getattr(self.fileobj, name)
+
+	def close(self):
+		self.fileobj.close()
+		if os.path.exists(self.filename) and filecmp.cmp(self.tmp, self.filename, False):
+			os.remove(self.tmp)
+			self.changed = False
+		else:
+			os.rename(self.tmp, self.filename)
+			self.changed = True
+
+'''
+Directory Watcher
+	Polls directory for event files. A file is reported once its
+	size and mtime stayed the same over two polls, so files still
+	being written are left for later. The files found by the first
+	poll are reported at once.
+'''
+class Watcher(object):
+	def __init__(self, directory, suffix = sc3reader.SUFFIXES):
+		self.directory = directory
+		self.suffix = suffix
+		self.seen = { }
+		self.pending = { }
+		self.first = True
+
+	def scan(self):
+		found = { }
+		for (directory, subdirectories, files) in os.walk(self.directory):
+			for f in files:
+				if not f.endswith(self.suffix): continue
+				path = os.path.join(directory, f)
+				try:
+					st = os.stat(path)
+				except OSError:
+					continue
+				found[path] = (st.st_size, st.st_mtime)
+		return found
+
+	def poll(self):
+		found = self.scan()
+
+		changed = [ ]
+		for (path, st) in found.items():
+			if self.seen.get(path) == st: continue
+			if self.first or self.pending.get(path) == st:
+				changed.append(path)
+				self.seen[path] = st
+				self.pending.pop(path, None)
+			else:
+				self.pending[path] = st
+
+		removed = [ path for path in self.seen if path not in found ]
+		for path in removed:
+			del self.seen[path]
+		for path in [ path for path in self.pending if path not in found ]:
+			del self.pending[path]
+
+		self.first = False
+		return (sorted(changed), sorted(removed))
+
+'''
+Watch Loop
+	Calls update(changed, removed) with the new or modified and the
+	removed files of directory every time some are found, polling
+	every interval seconds until interrupted.
+'''
+def watch(directory, interval, update):
+	watcher = Watcher(directory)
+	print("Watching '%s' every %.1f seconds, interrupt to stop." % (directory, interval), file = sys.stderr)
+
+	try:
+		while True:
+			(changed, removed) = watcher.poll()
+			if changed or removed:
+				update(changed, removed)
+			time.sleep(interval)
+	except KeyboardInterrupt:
+		pass
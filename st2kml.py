@@ -23,11 +23,13 @@
 #### 2015-02-26 ################################################################
 #
 
-import sys, hashlib, math
-from seiscomp import io as IO, datamodel as DataModel
+import sys, math
 from optparse import OptionParser
-import seiscomp
 import datetime, re
+import sc3reader
+import sc3invindex
+import sc3stats
+import sc3kml
 
 '''
 Style Factory
@@ -35,25 +37,14 @@ Style Factory
 class StyleFactory(object):
     def __init__(self):
         self.styles = {}
+        self.ids = {}
 
     def dump(self, openfile):
         for ID in self.styles:
             color = self.styles[ID]['color']
             scale = self.styles[ID]['size']
 
-            print ('<Style id="%s">' % ID, file = openfile)
-            print ('<LabelStyle>', file = openfile)
-            print ('<scale>0</scale>', file = openfile)
-            print ('</LabelStyle>', file = openfile)
-            print ('<IconStyle>', file = openfile)
-            if color:
-                print (' <color>%s</color>' % color, file = openfile)
-            print (' <scale>%f</scale>' % scale, file = openfile)
-            print (' <Icon>', file = openfile)
-            print ('  <href>http://maps.google.com/mapfiles/kml/shapes/triangle.png</href>', file = openfile)
-            print (' </Icon>', file = openfile)
-            print ('</IconStyle>', file = openfile)
-            print ('</Style>', file = openfile)
+            openfile.write(STYLE % (ID, COLOR % color if color else "", scale))
         return
 
     def basicstyle(self):
@@ -64,29 +55,120 @@ class StyleFactory(object):
         return "basic"
 
     def getstyle(self, size, color):
-        sh1 = "S_%s" %  hashlib.sha1(f"{size:.2f}-%{color}".encode()).hexdigest()
-        if sh1 in self.styles:
-            return sh1
-        self.styles[sh1] = { }
-        self.styles[sh1]['color'] = color
-        self.styles[sh1]['size'] = size
+        # Size in hundredths and the color are the ID, short and the
+        # same on every run. Sizes that only differ below a hundredth
+        # get the number of the style appended to stay apart
+        #
+        key = (size, color)
+        if key in self.ids:
+            return self.ids[key]
+
+        ID = "S%d_%s" % (round(size * 100), color)
+        if ID in self.styles:
+            ID = "%s_%d" % (ID, len(self.ids))
+        self.ids[key] = ID
+        self.styles[ID] = { }
+        self.styles[ID]['color'] = color
+        self.styles[ID]['size'] = size
+
+        return ID
 
-        return sh1
+'''
+KML Templates
+    Each element is rendered with a single format, optional lines
+    have their own template and an empty slot when absent.
+'''
+STYLE = ('<Style id="%s">\n'
+         '<LabelStyle>\n'
+         '<scale>0</scale>\n'
+         '</LabelStyle>\n'
+         '<IconStyle>\n'
+         '%s'
+         ' <scale>%f</scale>\n'
+         ' <Icon>\n'
+         '  <href>http://maps.google.com/mapfiles/kml/shapes/triangle.png</href>\n'
+         ' </Icon>\n'
+         '</IconStyle>\n'
+         '</Style>\n')
+COLOR = ' <color>%s</color>\n'
+
+HEADER = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+          '<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">\n'
+          ' <Document>\n')
+
+FOLDER = (' <Folder>\n'
+          '  <name>%s</name>\n')
+
+PLACEMARK = ('  <Placemark>\n'
+             '%s'
+             '  <name>%s</name>\n'
+             '  <description><![CDATA[\n'
+             '<pre>\n'
+             '<b>Description:</b> %s\n'
+             '\n'
+             '<b>Network:</b> %s\n'
+             '\n'
+             '<b>Locations and Channels Names:</b>\n'
+             '(SEED Standard Naming)\n'
+             '%s'
+             '\n'
+             '<b>Operation Time:</b>\n'
+             '  Start: %s\n'
+             '    End: %s\n'
+             '\n'
+             '<b>Station Location:</b>\n'
+             '  Longitude: %+09.4f\n'
+             '  Latitude:  %+09.4f\n'
+             '  Elevation: %6.1f (m)\n'
+             '\n'
+             '<b>Station Transmission:</b>\n'
+             '%s'
+             '\n'
+             '<b>Instruments in Station:</b>\n'
+             '  %s ; %s\n'
+             '</pre>]]></description>\n'
+             '  <TimeSpan>\n'
+             '    <begin>%s</begin>\n'
+             '%s'
+             '  </TimeSpan>\n'
+             '   <Point>\n'
+             '    <coordinates>%f,%f,%f</coordinates>\n'
+             '   </Point>\n'
+             '  </Placemark>\n')
+STYLEURL = '  <styleUrl>#%s</styleUrl>\n'
+CHANNELS = '  %s\n'
+STATUS = '  Status is %s\n'
+METHOD = '  Method: %s\n'
+CLOSED = '  Status is closed.\n'
+END = '    <end>%s</end>\n'
+
+FOOTER = (' </Document>\n'
+          ' </kml>\n')
+
+METHODS = {
+ None: "Unset",
+ '-': "Offline",
+ "S": "Satelite",
+ "W": "Wireless Lan Provider",
+ "2G": "Mobile Phone Network"
+}
+
+ONLINE = {
+     None: "Unknow",
+     '-': "Offline",
+     "S": "Online",
+     "W": "Online",
+     "2G": "Online"
+}
 
 def newFolder(openfile, name):
-    print (' <Folder>', file = openfile)
-    print ('  <name>%s</name>' % name, file = openfile)
-#     print ('  <description><![CDATA[', file = openfile)
-#     print ('  <p>SeisComP3 Station Extracter st2kml<br/>', file = openfile)
-#     print (']]>  </description>', file = openfile)
+    openfile.write(FOLDER % name)
 
 '''
 KML Generators
 '''
 def openKML(openfile, options, styler):
-    print ('<?xml version="1.0" encoding="UTF-8"?>', file = openfile)
-    print ('<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">', file = openfile)
-    print (' <Document>', file = openfile)
+    openfile.write(HEADER)
 
     if styler:
         styler.dump(openfile)
@@ -96,85 +178,34 @@ def ptKML(openfile, options, code, channels, start, end, lon, lat, ele, desc, rm
     if lon == None: return
     if lat == None: return
 
-    print ('  <Placemark>', file = openfile)
-    if style:
-        print ('  <styleUrl>#%s</styleUrl>' % style, file = openfile)
-
-    print ('  <name>%s</name>' % (code.split(".")[1]), file = openfile)
-    print ('  <description><![CDATA[', file = openfile)
-
-    print ("<pre>", file = openfile)
-    
-    print ("<b>Description:</b> %s" % desc, file = openfile)
-    
-    print ("", file = openfile)
-    print ("<b>Network:</b> %s" % (code.split(".")[0]), file = openfile)
-    
-    print ("", file = openfile)
-    print ("<b>Locations and Channels Names:</b>", file = openfile)
-    print ("(SEED Standard Naming)", file = openfile)
-
-    for chunk in re.findall('.{21}',channels) if len(channels) > 21 else [channels]:
-        print ("  %s" % chunk, file = openfile)
-    print ("", file = openfile)
-
-    print ("<b>Operation Time:</b>", file = openfile)
-    print ('  Start: %s' % start, file = openfile)
-    print ('    End: %s' % ("--" if end is None else end), file = openfile)
-
-    print ("", file = openfile)
-    print ("<b>Station Location:</b>", file = openfile)
-    print ('  Longitude: %+09.4f' % lon, file = openfile)
-    print ('  Latitude:  %+09.4f' % lat, file = openfile)
-    print ('  Elevation: %6.1f (m)' % ele, file = openfile)
-
-    method = {
-     None: "Unset",
-     '-': "Offline",
-     "S": "Satelite",
-     "W": "Wireless Lan Provider",
-     "2G": "Mobile Phone Network"
-    }
-
-    online = {
-         None: "Unknow",
-         '-': "Offline",
-         "S": "Online",
-         "W": "Online",
-         "2G": "Online"
-    }
-
-    print ("", file = openfile)
-    print ("<b>Station Transmission:</b>", file = openfile)
+    chunks = re.findall('.{21}',channels) if len(channels) > 21 else [channels]
+
     if end is None:
-        print ("  Status is %s" % online[rmk], file = openfile)
-        if online[rmk] == "Online":
-            print ("  Method: %s" % method[rmk], file = openfile)
+        status = STATUS % ONLINE[rmk]
+        if ONLINE[rmk] == "Online":
+            status += METHOD % METHODS[rmk]
     else:
-        print ("  Status is closed.", file = openfile)
-
-    print ("", file = openfile)
-    print ("<b>Instruments in Station:</b>", file = openfile)
-    print ("  %s ; %s" % ("--" if sensor is None else sensor, "--" if dtl is None else dtl), file = openfile)
-    print ('</pre>]]></description>', file = openfile)
-
-    print ('  <TimeSpan>', file = openfile)
-    print ('    <begin>%s</begin>' % (start), file = openfile)
-    if end:
-        print ('    <end>%s</end>' % (end), file = openfile)
-    print ('  </TimeSpan>', file = openfile)
-
-    print ('   <Point>', file = openfile)
-    print ('    <coordinates>%f,%f,%f</coordinates>' % (lon, lat, 0.0), file = openfile)
-    print ('   </Point>', file = openfile)
-    print ('  </Placemark>', file = openfile)
+        status = CLOSED
+
+    openfile.write(PLACEMARK % (STYLEURL % style if style else "",
+                                code.split(".")[1],
+                                desc,
+                                code.split(".")[0],
+                                "".join([ CHANNELS % chunk for chunk in chunks ]),
+                                start,
+                                "--" if end is None else end,
+                                lon, lat, ele,
+                                status,
+                                "--" if sensor is None else sensor, "--" if dtl is None else dtl,
+                                start,
+                                END % end if end else "",
+                                lon, lat, 0.0))
 
 def closeFolder(openfile):
-    print (' </Folder>', file = openfile)
+    openfile.write(' </Folder>\n')
 
 def closeKML(openfile):
-    print (' </Document>', file = openfile)
-    print (' </kml>', file = openfile)
+    openfile.write(FOOTER)
 
 '''
 Scales
@@ -182,165 +213,98 @@ Scales
 def getsize():
     return 1.5
 
+NETWORKCOLORS = {
+    "BR": "50BD6C",
+    "NB": "15E8DE",
+    "ON": "1571E8",
+    "BL": "A62E00",
+}
+
 def getcolor(network, open):
     #cusp=0/46/166    # BL # 002ea6
     #cunb=44/124/17   # BR # 23640e
     #con=232/113/21   # ON # e87115
     #cufrn=222/232/21 # NB # dee815
     #6cbd50 -> 50BD6C
-    if network == "BR":
-        return "FF50BD6C" if open == "true" else "CC50BD6C" 
-    elif network == "NB":
-        return "FF15E8DE" if open == "true" else "CC15E8DE"
-    elif network == "ON":
-        return "FF1571E8" if open == "true" else "CC1571E8"
-    elif network == "BL":
-        return "FFA62E00" if open == "true" else "CCA62E00"
+    return ("FF" if open == "true" else "CC") + NETWORKCOLORS.get(network, "DDDDDD")
 
-    return "FFDDDDDD" if open == "true" else "CCDDDDDD"
+def datafromxml(filename, reader = None):
+    return sc3invindex.readinventory(filename, reader)
 
-def datafromxml(filename):
-    ar = IO.XMLArchive()
-    ar.open(filename)
-    obj = ar.readObject()
-    ar.close()
-
-    inv = DataModel.Inventory.Cast(obj)
-
-    if type(inv) == type(None):
-        print ("File (%s) is no event, skipping." % filename, file = sys.stderr)
-        return None
-
-    return inv
+def timestring(epoch):
+    return datetime.datetime.utcfromtimestamp(math.floor(epoch)).strftime("%Y-%m-%dT%H:%M:%SZ")
 
 def collect(sta):
     codes = []
 
-    for ll in range(0,sta.sensorLocationCount()):
-        loc = sta.sensorLocation(ll)
-        for cc in range(0,loc.streamCount()):
-            cha = loc.stream(cc)
-            codes.append("%s.%s" % ("--" if loc.code() == "" else loc.code(), cha.code()))
-#             sensor=sta.network().inventory().findSensor(cha.sensor())
-#             print("MA='%s' MO='%s' DS='%s' %s" % (sensor.manufacturer(),sensor.model(),sensor.description(),sensor.name()))
+    for (loc, cha, start, end, depth) in sta['streams']:
+        codes.append("%s.%s" % ("--" if loc == "" else loc, cha))
 
     codes.sort(reverse = True)
     return ",".join(codes)
 
-'''
-Basic
-'''
-def make_cmdline_parser():
-    # Create the parser
+def stationdata(sta, styler):
+    if sta['end'] is not None:
+        d = datetime.datetime.utcfromtimestamp(math.floor(sta['end']))
+        open = "true" if d > datetime.datetime.now() else "false"
+        end = timestring(sta['end'])
+    else:
+        end = None
+        open = "true"
+
+    rmk = sta['remark']
+    dtl = None
+    sen = None
+    try:
+        if rmk is not None and rmk.find(";") != -1:
+            rmk = rmk.split(";")
+            dtl=rmk[2]
+            sen=rmk[1]
+            rmk=rmk[0]
+    except IndexError:
+        rmk = None
+        dtl = None
+        sen = None
+
+    data = { }
+    code = "%s.%s" % (sta['net'], sta['sta'])
+    data['code'] = code
+    data['net'] = sta['net']
+    data['desc'] = sta['desc']
+    data['remark'] = rmk
+    data['sensor'] = sen
+    data['dtl'] = dtl
+    data['start'] = timestring(sta['start'])
+    data['end'] = end
+    data['open'] = open
+    data['channels'] = collect(sta)
+    data['latitude'] = sta['lat']
+    data['longitude'] = sta['lon']
+    data['elevation'] = sta['elev']
+
+    # Find style
     #
-    parser = OptionParser(usage="%prog [options] <files>", version="1.0", add_help_option = True)
-    parser.add_option("-f", "--filter", type="string", dest="filter", help="Network list to filter (BL,BR)", default=None)
-    parser.add_option("-o","--output", type="string", dest="output", help="Output filename", default=None)
-
-    return parser
+    style = styler.getstyle(size = getsize(),
+                            color = getcolor(sta['net'], open))
+    data['style'] = style
 
-if __name__ == "__main__":
-    parser = make_cmdline_parser()
-    (options, args) = parser.parse_args()
+    return (open, data)
 
-    fio = sys.stdout
-
-    if options.output:
-        fio = open(options.output,"w")
-
-    # Styler
-    #
-    styler = StyleFactory()
+def addstation(records, open, data):
+    if data['net'] not in records[open]:
+        records[open][data['net']] = { }
 
-    # Loop each file
-    #
-    records = {
-               'true' : { },
-               'false': { }}
+    where = records[open][data['net']]
+    code = data['code']
 
-    if options.filter:
-        options.filter = options.filter.split(",")
+    if code in where:
+        if data['end'] is None and where[code]['open'] == "false":
+            print ("Over-write.", file = sys.stderr)
+            where[code] = data
+    else:
+        where[code] = data
 
-    for f in args:
-        print ("Processing file: %s" % f, file = sys.stderr)
-        # Get data
-        #
-        inv = datafromxml(f)
-        if type(inv) == type(None): continue
-
-        for nn in range(0,inv.networkCount()):
-            net = inv.network(nn)
-            if options.filter and net.code() not in options.filter: continue
-            for ss in range(0, net.stationCount()):
-                sta = net.station(ss)
-
-                try:
-                    end = sta.end()
-                    d = datetime.datetime.strptime(end.toString("%Y-%m-%d %H:%M:%SZ"), "%Y-%m-%d %H:%M:%SZ")
-                    open = "true" if d > datetime.datetime.now() else "false"
-                    end = end.toString("%Y-%m-%dT%H:%M:%SZ")
-                # ~ except seiscomp.Core.ValueException:
-                    # ~ end = None
-                    # ~ open = "true"
-                except ValueError:
-                    end = None
-                    open = "true"
-                
-                try:
-                    rmk = sta.remark().content()
-                    if rmk.find(";") != -1:
-                        rmk = rmk.split(";")
-                        dtl=rmk[2]
-                        sen=rmk[1]
-                        rmk=rmk[0]
-                except IndexError:
-                    rmk = None
-                    dtl = None
-                    sen = None
-                except ValueError:
-                    rmk = None
-                    dtl = None
-                    sen = None
-                except seiscomp3.Core.ValueException:
-                    rmk = None
-                    dtl = None
-                    sen = None
-                
-                data = { }
-                code = "%s.%s" % (net.code(), sta.code())
-                data['code'] = code
-                data['desc'] = sta.description()
-                data['remark'] = rmk
-                data['sensor'] = sen
-                data['dtl'] = dtl
-                data['start'] = sta.start().toString("%Y-%m-%dT%H:%M:%SZ")
-                data['end'] = end
-                data['open'] = open
-                data['channels'] = collect(sta)
-                data['latitude'] = sta.latitude()
-                data['longitude'] = sta.longitude()
-                data['elevation'] = sta.elevation()
-                
-                # Find style
-                #
-                style = styler.getstyle(size = getsize(),
-                                        color = getcolor(net.code(), open))
-                data['style'] = style
-
-                if net.code() not in records[open]:
-                    records[open][net.code()] = { }
-
-                where = records[open][net.code()]
-
-                if code in where:
-                    if data['end'] is None and where[code]['open'] == "false":
-                        print ("Over-write.", file = sys.stderr)
-                        where[code] = data
-                else:
-                    where[code] = data
-
-    # Start KML
-    #
+def writeKML(fio, options, styler, records):
     openKML(fio, options, styler)
 
     for (k,g) in records.items():
@@ -374,13 +338,80 @@ if __name__ == "__main__":
                     data['style'])
             closeFolder(fio)
         closeFolder(fio)
- 
-    # Finish
-    #
+
     closeKML(fio)
 
-    if fio != sys.stdout:
-        fio.close()
+'''
+Basic
+'''
+def make_cmdline_parser():
+    # Create the parser
+    #
+    parser = OptionParser(usage="%prog [options] <files>", version="1.0", add_help_option = True)
+    parser.add_option("-f", "--filter", type="string", dest="filter", help="Network list to filter (BL,BR)", default=None)
+    parser.add_option("-o","--output", type="string", dest="output", help="Output filename", default=None)
+    parser.add_option("--kmz", action="store_true", dest="kmz", help="Write a compressed KMZ (zip holding doc.kml) instead of plain KML", default=False)
+    parser.add_option("--reader", type="choice", choices=sc3reader.READERS, dest="reader", help="XML reader, seiscomp uses the SeisComP bindings and stream a lightweight parser (%s)" % "/".join(sc3reader.READERS), default=None)
+    parser.add_option("--stats", dest="stats", help="Write a JSON summary of stage times, counters and warnings at exit to STATS (- for stderr)", default=None)
+    parser.add_option("--profile", dest="profile", help="Write a cProfile dump to PROFILE", default=None)
+
+    return parser
+
+if __name__ == "__main__":
+    parser = make_cmdline_parser()
+    (options, args) = parser.parse_args()
+
+    try:
+        options.reader = sc3reader.checkreader(options.reader)
+    except Exception as e:
+        print (str(e), file = sys.stderr)
+        sys.exit(1)
+
+    sc3stats.setup("st2kml", options.stats, options.profile)
+
+    try:
+        fio = sc3kml.openkml(options.output, options.kmz)
+    except IOError as e:
+        print ("Cannot open output file '%s'\n %s" % (options.output, str(e)), file = sys.stderr)
+        sys.exit(1)
+
+    # Styler
+    #
+    styler = StyleFactory()
+
+    # Loop each file
+    #
+    records = {
+               'true' : { },
+               'false': { }}
+
+    if options.filter:
+        options.filter = options.filter.split(",")
+
+    for f in args:
+        print ("Processing file: %s" % f, file = sys.stderr)
+        # Get data
+        #
+        sc3stats.count("files")
+        with sc3stats.stage("parse"):
+            stations = datafromxml(f, options.reader)
+        if stations is None: continue
+
+        with sc3stats.stage("filter"):
+            for sta in stations:
+                sc3stats.count("stations")
+                sc3stats.count("streams", len(sta['streams']))
+                if options.filter and sta['net'] not in options.filter: continue
+                addstation(records, *stationdata(sta, styler))
+
+    # Write KML
+    #
+    with sc3stats.stage("write"):
+        writeKML(fio, options, styler, records)
+
+    # Finish
+    #
+    fio.close()
 
     # END
     #
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#                                                                              #
+#   Checks of the database reader against the stream reader                   #
+#   Copyright (C) 2026  Marcelo Belentani de Bianchi                           #
+#                                                                              #
+#   This program is free software; you can redistribute it and/or modify       #
+#   it under the terms of the GNU General Public License as published by       #
+#   the Free Software Foundation; either version 2 of the License, or          #
+#   (at your option) any later version.                                        #
+#                                                                              #
+#   This program is distributed in the hope that it will be useful,            #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#   GNU General Public License for more details.                               #
+#                                                                              #
+#   You should have received a copy of the GNU General Public License along    #
+#   with this program; if not, write to the Free Software Foundation, Inc.,    #
+#   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.                #
+#                                                                              #
+#### 2026-10-18 ################################################################
+#
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sc3reader
+
+'''
+Fixture
+	One event as scxmldump writes it and the same event in the tables
+	of the SeisComP SQLite schema, only the columns the reader uses.
+	The third arrival refers to a pick that is in neither.
+'''
+XML = '''<?xml version="1.0" encoding="UTF-8"?>
+<seiscomp xmlns="http://geofon.gfz-potsdam.de/ns/seiscomp3-schema/0.7" version="0.7">
+  <EventParameters>
+    <pick publicID="Pick/1">
+      <time><value>2009-05-08T06:32:31.120000Z</value></time>
+      <waveformID networkCode="BL" stationCode="AQDB" locationCode="" channelCode="HHZ"/>
+      <phaseHint>P</phaseHint>
+    </pick>
+    <pick publicID="Pick/2">
+      <time><value>2009-05-08T06:32:40.005500Z</value></time>
+      <waveformID networkCode="BR" stationCode="PTGA" locationCode="00" channelCode="HHN"/>
+      <phaseHint>S</phaseHint>
+    </pick>
+    <origin publicID="Origin/1">
+      <time><value>2009-05-08T06:32:20.450091Z</value></time>
+      <latitude><value>-25.739404</value><uncertainty>1.5</uncertainty></latitude>
+      <longitude><value>-46.510899</value><uncertainty>2.0</uncertainty></longitude>
+      <depth><value>5.390749</value><uncertainty>3.0</uncertainty></depth>
+      <quality><standardError>0.4</standardError></quality>
+      <arrival><pickID>Pick/1</pickID><phase>P</phase><weight>1.0</weight></arrival>
+      <arrival><pickID>Pick/2</pickID><phase>S</phase><weight>0.5</weight></arrival>
+      <arrival><pickID>Pick/3</pickID><phase>P</phase><weight>1.0</weight></arrival>
+      <magnitude publicID="Magnitude/1">
+        <magnitude><value>3.2</value></magnitude>
+        <type>mb</type>
+      </magnitude>
+    </origin>
+    <event publicID="Event/1">
+      <preferredOriginID>Origin/1</preferredOriginID>
+      <preferredMagnitudeID>Magnitude/1</preferredMagnitudeID>
+      <description><text>Sao Paulo, Brazil</text><type>region name</type></description>
+    </event>
+  </EventParameters>
+</seiscomp>
+'''
+
+SCHEMA = '''
+CREATE TABLE Object (_oid INTEGER PRIMARY KEY AUTOINCREMENT, _timestamp TIMESTAMP);
+CREATE TABLE PublicObject (_oid INTEGER PRIMARY KEY, publicID VARCHAR(255) NOT NULL UNIQUE);
+CREATE TABLE Event (_oid INTEGER PRIMARY KEY, _parent_oid INTEGER NOT NULL, preferredOriginID VARCHAR(255), preferredMagnitudeID VARCHAR(255));
+CREATE TABLE EventDescription (_oid INTEGER PRIMARY KEY, _parent_oid INTEGER NOT NULL, text VARCHAR(128) NOT NULL, type VARCHAR(64) NOT NULL);
+CREATE TABLE Origin (_oid INTEGER PRIMARY KEY, _parent_oid INTEGER NOT NULL, time_value DATETIME NOT NULL, time_value_ms INTEGER NOT NULL,
+                     latitude_value DOUBLE NOT NULL, latitude_uncertainty DOUBLE, longitude_value DOUBLE NOT NULL, longitude_uncertainty DOUBLE,
+                     depth_value DOUBLE, depth_uncertainty DOUBLE, quality_standardError DOUBLE);
+CREATE TABLE Magnitude (_oid INTEGER PRIMARY KEY, _parent_oid INTEGER NOT NULL, magnitude_value DOUBLE NOT NULL, type VARCHAR(32));
+CREATE TABLE Arrival (_oid INTEGER PRIMARY KEY, _parent_oid INTEGER NOT NULL, pickID VARCHAR(255) NOT NULL, phase_code VARCHAR(32) NOT NULL, weight DOUBLE);
+CREATE TABLE Pick (_oid INTEGER PRIMARY KEY, _parent_oid INTEGER NOT NULL, time_value DATETIME NOT NULL, time_value_ms INTEGER NOT NULL,
+                   waveformID_networkCode CHAR(8) NOT NULL, waveformID_stationCode CHAR(8) NOT NULL,
+                   waveformID_locationCode CHAR(8), waveformID_channelCode CHAR(8), phaseHint_code CHAR);
+'''
+
+ROWS = [
+	"INSERT INTO Object VALUES (1, 0), (2, 0), (3, 0), (4, 0), (5, 0), (6, 0), (7, 0), (8, 0), (9, 0), (10, 0)",
+	"INSERT INTO PublicObject VALUES (1, 'EP'), (2, 'Pick/1'), (3, 'Pick/2'), (4, 'Origin/1'), (8, 'Magnitude/1'), (9, 'Event/1')",
+	"INSERT INTO Pick VALUES (2, 1, '2009-05-08 06:32:31', 120000, 'BL', 'AQDB', '', 'HHZ', 'P')",
+	"INSERT INTO Pick VALUES (3, 1, '2009-05-08 06:32:40', 5500, 'BR', 'PTGA', '00', 'HHN', 'S')",
+	"INSERT INTO Origin VALUES (4, 1, '2009-05-08 06:32:20', 450091, -25.739404, 1.5, -46.510899, 2.0, 5.390749, 3.0, 0.4)",
+	"INSERT INTO Arrival VALUES (5, 4, 'Pick/1', 'P', 1.0), (6, 4, 'Pick/2', 'S', 0.5), (7, 4, 'Pick/3', 'P', 1.0)",
+	"INSERT INTO Magnitude VALUES (8, 4, 3.2, 'mb')",
+	"INSERT INTO Event VALUES (9, 1, 'Origin/1', 'Magnitude/1')",
+	"INSERT INTO EventDescription VALUES (10, 9, 'Sao Paulo, Brazil', 'region name')",
+]
+
+class DatabaseReaderTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+		self.xml = os.path.join(self.directory, "event.xml")
+		with open(self.xml, "w") as fio:
+			fio.write(XML)
+
+		self.db = os.path.join(self.directory, "seiscomp.db")
+		db = sqlite3.connect(self.db)
+		db.executescript(SCHEMA)
+		for row in ROWS:
+			db.execute(row)
+		db.commit()
+		db.close()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_same_records(self):
+		(expected,) = list(sc3reader.readevents(self.xml, reader = "stream"))
+		(record,) = list(sc3reader.databaseevents(self.db))
+
+		self.assertEqual(sorted(record.keys()), sorted(expected.keys()))
+		for key in expected:
+			if key in ( 'time', 'picks' ): continue
+			self.assertEqual(record[key], expected[key], key)
+
+		self.assertAlmostEqual(record['time'], expected['time'], places = 6)
+		self.assertEqual(len(record['picks']), 2)
+		self.assertEqual(len(record['picks']), len(expected['picks']))
+		for (pick, expect) in zip(record['picks'], expected['picks']):
+			self.assertEqual(pick[0:4] + pick[5:], expect[0:4] + expect[5:])
+			self.assertAlmostEqual(pick[4], expect[4], places = 6)
+
+	def test_conditions(self):
+		self.assertEqual(len(list(sc3reader.databaseevents(self.db, [ ("mag > ?", (3.0,)) ]))), 1)
+		self.assertEqual(len(list(sc3reader.databaseevents(self.db, [ ("mag > ?", (4.0,)) ]))), 0)
+		self.assertRaises(sc3reader.ReaderError, sc3reader.databaseevents, self.db, [ ("nothing > 1", ()) ])
+
+if __name__ == "__main__":
+	unittest.main()